@@ -75,7 +75,7 @@ class HXLException(Exception):
 import hxl.geo
 import hxl.datatypes
 from hxl.model import TagPattern, Dataset, Column, Row, RowQuery
-from hxl.io import data, tagger, HXLParseException, write_hxl, make_input, from_spec
+from hxl.io import data, data_async, gather_data, tagger, HXLParseException, write_hxl, make_input, from_spec
 from hxl.validation import schema, validate, HXLValidationException
 
 # end
@@ -49,12 +49,14 @@ class Tagger(hxl.io.AbstractInput):
         @param match_all: if True, require that the full header string match; otherwise, match substrings (default: False)
         @param default_tag: default tagspec to use for any column without a match
         """
+        super().__init__()
         if isinstance(specs, dict):
             # convert to list of tuples if needed
             specs = [(key, specs[key]) for key in specs]
         self.specs = [(hxl.datatypes.normalise_string(spec[0]), spec[1]) for spec in specs]
         self.default_tag = default_tag
         self.match_all = match_all
+        self.stats = getattr(input, 'stats', self.stats) # count against the underlying input
         self.input = iter(input)
         self._cache = []
         self._found_tags = False
@@ -37,8 +37,8 @@ lower-level L{AbstractBaseFilter} directly for especially-complex cases.
 
 """
 
-import hxl, hxl.formulas.eval as feval
-import abc, copy, dateutil.parser, json, jsonpath_ng.ext, logging, re, six, sys
+import hxl, hxl.formulas.eval as feval, hxl.sketches
+import abc, collections, concurrent.futures, copy, dateutil.parser, heapq, json, jsonpath_ng.ext, logging, operator, os, pickle, queue, re, six, sys, tempfile, threading
 
 
 logger = logging.getLogger(__name__)
@@ -215,6 +215,13 @@ class AbstractStreamingFilter(AbstractBaseFilter):
     This simple filter will produce a copy of the source data, but
     omitting rows where the org name is "Unknown".
 
+    Rows move between streaming stages in batches (see
+    L{hxl.model.Dataset.batches}). A filter that can process a whole
+    batch faster than one row at a time may also override
+    L{filter_batch}. A filter that keeps state from one row to the
+    next must clear it in L{reset}, because a repeatable source can
+    be read more than once.
+
     @see: L{AbstractCachingFilter}
 
     """
@@ -244,6 +251,51 @@ class AbstractStreamingFilter(AbstractBaseFilter):
         """
         return row.values
 
+    def filter_batch(self, rows):
+        """Filter a batch of rows at once.
+
+        By default, this method calls L{filter_row} for each row. Child
+        classes may override it to avoid the per-row overhead, but the
+        results must be the same.
+
+        @param rows: a list of L{hxl.model.Row} objects
+        @returns: a list of lists of values (I{not} Row objects), leaving out any skipped rows
+        """
+        filter_row = self.filter_row
+        result = []
+        for row in rows:
+            values = filter_row(row)
+            if values is not None:
+                result.append(values)
+        return result
+
+    def reset(self):
+        """Clear any state kept from an earlier pass through the rows.
+
+        Called at the start of each pass (see L{batches}). By default,
+        does nothing; child classes that remember earlier rows (e.g.
+        L{DeduplicationFilter}) override it, so that each pass through
+        a repeatable source gives the same output.
+        """
+        pass
+
+    def batches(self, size=None):
+        """Filter the source's rows a batch at a time (see L{filter_batch}).
+        @param size: the maximum number of rows in a batch
+        @returns: an iterator that returns non-empty lists of L{hxl.model.Row} objects
+        """
+        columns = self.columns # call this here, in case it caches any useful information
+        self.reset()
+        row_number = -1
+        Row = hxl.model.Row
+        for batch in self.source.batches(size):
+            rows = []
+            for values in self.filter_batch(batch):
+                row_number += 1
+                rows.append(Row(columns, values, row_number))
+            if rows:
+                yield rows
+
     def __iter__(self):
         return AbstractStreamingFilter._Iterator(self)
 
@@ -257,8 +309,8 @@ class AbstractStreamingFilter(AbstractBaseFilter):
             @param outer: a reference to the parent object (an L{AbstractStreamingFilter}).
             """
             self.outer = outer # ref to outer object
-            self.source_iter = iter(self.outer.source) # iterator for the source data
-            self.row_number = -1
+            self.batches = self.outer.batches() # iterator for batches of filtered rows
+            self.batch = iter(())
 
         def __iter__(self):
             return self
@@ -266,26 +318,21 @@ class AbstractStreamingFilter(AbstractBaseFilter):
         def __next__(self):
             """Return the next filtered row of data.  
 
-            Uses the L{AbstractStreamingFilter.filter_row} method. The
-            returned row is always a new object, so that if the client
-            changes it, it won't change the version visible upstream
-            in the filter chain.
+            Takes rows one at a time from the batches filtered by
+            L{AbstractStreamingFilter.batches}. The returned row is
+            always a new object, so that if the client changes it, it
+            won't change the version visible upstream in the filter
+            chain.
 
             @returns: a L{hxl.model.Row} object
 
             """
-            # call this here, in case it caches any useful information
-            columns = self.outer.columns
             while True:
-                # a StopIterationException will terminate the loop
-                row = next(self.source_iter)
-                # get a new list of filtered values
-                values = self.outer.filter_row(row)
-                if values is not None:
-                    # keep looping if filter_row(row) returned None
-                    self.row_number += 1
-                    # create a new Row object
-                    return hxl.model.Row(columns, values, self.row_number)
+                try:
+                    return next(self.batch)
+                except StopIteration:
+                    # a StopIterationException from the batches will terminate the loop
+                    self.batch = iter(next(self.batches))
 
 
 class AbstractCachingFilter(AbstractBaseFilter):
@@ -400,20 +447,131 @@ class AbstractCachingFilter(AbstractBaseFilter):
 #
 # Utility classes
 #
+class SpillFiles(object):
+    """Temporary files of pickled items, for caching filters that don't fit in memory.
+
+    The files are in a temporary directory that is removed when this
+    object is garbage-collected. Items are pickled in chunks, and read
+    back lazily, one chunk at a time.
+
+    @see: L{SortFilter}
+    @see: L{CountFilter}
+    """
+
+    CHUNK_SIZE = 1000
+    """Number of items to pickle together"""
+
+    def __init__(self, prefix='hxl-'):
+        """
+        @param prefix: the prefix for the temporary directory name
+        """
+        self.prefix = prefix
+        self._dir = None
+
+    def writer(self):
+        """@returns: a new L{Writer} for a temporary file"""
+        if self._dir is None:
+            self._dir = tempfile.TemporaryDirectory(prefix=self.prefix)
+        fd, path = tempfile.mkstemp(suffix='.run', dir=self._dir.name)
+        return SpillFiles.Writer(os.fdopen(fd, 'wb'), path)
+
+    def save(self, items):
+        """Save items to a new temporary file.
+        @param items: an iterable of picklable items
+        @returns: the path to the file
+        """
+        writer = self.writer()
+        for item in items:
+            writer.add(item)
+        return writer.close()
+
+    @staticmethod
+    def read(path):
+        """Read back the items from a temporary file, one chunk at a time.
+        @param path: the file path
+        @returns: an iterator over the items
+        """
+        with open(path, 'rb') as input:
+            while True:
+                try:
+                    chunk = pickle.load(input)
+                except EOFError:
+                    return
+                yield from chunk
+
+    @staticmethod
+    def merge(paths, reverse=False):
+        """k-way merge of sorted files of (key, value) pairs.
+        For equal keys, L{heapq.merge} takes the earlier file first,
+        so the merge is stable.
+        @param paths: the file paths
+        @param reverse: if True, the files are in descending order
+        @returns: an iterator over the (key, value) pairs
+        """
+        return heapq.merge(
+            *[SpillFiles.read(path) for path in paths],
+            key=lambda item: item[0],
+            reverse=reverse
+        )
+
+    class Writer:
+        """Writes items to a temporary file, a chunk at a time."""
+
+        def __init__(self, output, path):
+            self.output = output
+            self.path = path
+            self.chunk = []
+
+        def add(self, item):
+            self.chunk.append(item)
+            if len(self.chunk) >= SpillFiles.CHUNK_SIZE:
+                self.flush()
+
+        def flush(self):
+            if self.chunk:
+                pickle.dump(self.chunk, self.output, pickle.HIGHEST_PROTOCOL)
+                self.chunk = []
+
+        def close(self):
+            """@returns: the file path"""
+            self.flush()
+            self.output.close()
+            return self.path
+
+    class MergedValues:
+        """The values from sorted files of (key, value) pairs, merged each time they're iterated."""
+
+        def __init__(self, paths, reverse=False):
+            self.paths = paths
+            self.reverse = reverse
+
+        def __iter__(self):
+            for key, value in SpillFiles.merge(self.paths, self.reverse):
+                yield value
+
+
 class Aggregator(object):
     """Class for aggregating a single value vertically through a dataset
 .
     This is the class that accumulates a line count, sum, min, max, or average value
     across all rows of a dataset. Add any new aggregator types here.
+
+    The median, percentile(p), and count_distinct aggregators are
+    approximate for large groups: they use mergeable sketches with
+    bounded memory (see L{hxl.sketches}) instead of keeping every value.
     """
 
-    def __init__(self, type='count', pattern=None, column=None):
+    PARAMETER_TYPES = ['percentile']
+    """Aggregator types that take a numeric parameter, e.g. C{percentile(#affected, 90)}"""
+
+    def __init__(self, type='count', pattern=None, column=None, parameter=None):
         """Constructor
         See the L{parse} and L{parse_list} static methods for creating an aggregator from a string spec.
         @param type: the aggregator type to create, as a string
         @param pattern: the tag pattern for disaggregation (may be C{None} for just counting lines)
         @param column: the hashtag and attributes for the output column with aggregated values
-        @exception HXLFilterException: if C{pattern} is C{None} and C{type} isn't C{"count"}
+        @param parameter: a numeric parameter (required for percentile, from 0 to 100)
+        @exception HXLFilterException: if C{pattern} is C{None} and C{type} isn't C{"count"}, or the parameter is wrong
         """
         super().__init__()
         self.type = type.lower()
@@ -423,92 +581,221 @@ class Aggregator(object):
             self.pattern = None
         else:
             raise HXLFilterException('Pattern missing for {} aggregator'.format(type))
+        if self.type in self.PARAMETER_TYPES:
+            try:
+                self.parameter = float(parameter)
+            except (TypeError, ValueError):
+                raise HXLFilterException('Numeric parameter missing for {} aggregator'.format(type))
+            if not 0 <= self.parameter <= 100:
+                raise HXLFilterException('Percentile must be from 0 to 100: {}'.format(parameter))
+        elif parameter is not None:
+            raise HXLFilterException('{} aggregator does not take a parameter'.format(type))
+        else:
+            self.parameter = None
         if not column:
             column = '{type}#meta+{type}'.format(type=self.type)
         self.column = hxl.model.Column.parse_spec(column)
 
-        self.total = 0
-        """Total number of rows used."""
-
         self.value = None
-        """Resulting aggregation value."""
+        """Resulting aggregation value (for L{evaluate_row})."""
 
-        self.normalised = None
-        """Normalised value to use for internal comparison"""
-
-        self.values = set()
-        """Unique values seen (for concat)"""
+        self._state = None
+        self._update = None
 
     def evaluate_row(self, row):
         """Evaluate a single row of HXL data against this aggregator.
+        This is a convenience method for aggregating one group at a
+        time; L{CountFilter} uses the compiled methods below instead.
         @param row: the input row to read
         @exception HXLFilterException: for an unrecognised aggregator type
         """
+        if self._state is None:
+            self._state = self.new_state()
+            self._update = self.make_updater()
+        self._update(self._state, row.get(self.pattern) if self.pattern else None)
+        self.value = self.result(self._state)
 
-        #
-        # Shortcut: just counting rows
-        #
-        if self.type == 'count':
-            if self.value is None:
-                self.value = 0
-            self.value += 1
-            return
+    #
+    # Compiled aggregation
+    #
+    # The state for each group is a small list (or set), created by
+    # new_state(), changed in place by the function from
+    # make_updater(), and converted to the output value by result().
+    #
 
-        #
-        # Aggregating values
-        #
-        value = row.get(self.pattern)
+    def make_reader(self, columns, default=None):
+        """Make a function to read this aggregator's value from a list of row values.
+        Like L{hxl.model.Row.get}, the function returns the first
+        non-empty value from a matching column.
+        @param columns: the source columns
+        @param default: the value to return if there's no match
+        @returns: a function that takes a list of values
+        """
+        return Aggregator.make_pattern_reader(self.pattern, columns, default)
 
-        # Skip empty values
-        if hxl.datatypes.is_empty(value):
-            return
+    @staticmethod
+    def make_pattern_reader(pattern, columns, default=None):
+        """Make a function to read the value for a tag pattern from a list of row values (see L{make_reader})."""
+        if pattern is None:
+            return lambda values: default
+        indices = [i for i, column in enumerate(columns) if pattern.match(column)]
+        if len(indices) == 1:
+            index = indices[0]
+            def read(values):
+                if index < len(values) and values[index]:
+                    return values[index]
+                return default
+        else:
+            def read(values):
+                for index in indices:
+                    if index >= len(values):
+                        break
+                    if values[index]:
+                        return values[index]
+                return default
+        return read
+
+    def new_state(self):
+        """@returns: a new, empty state for one group"""
+        if self.type == 'average':
+            return [0, 0] # total, sum
+        elif self.type in ('min', 'max',):
+            return [None, None] # value, normalised
+        elif self.type == 'concat':
+            return set()
+        elif self.type == 'count':
+            return [0]
+        elif self.type == 'sum':
+            return [None]
+        elif self.type in ('median', 'percentile',):
+            return hxl.sketches.QuantileSketch()
+        elif self.type == 'count_distinct':
+            return hxl.sketches.DistinctSketch()
+        else:
+            raise HXLFilterException("Bad aggregator type for count filter: {}".format(self.type))
 
-        # Numbers only for sum and average
-        datatype = hxl.datatypes.typeof(value, self.pattern)
-        if self.type in ['sum', 'average'] and datatype != 'number':
-            logger.error("Cannot use %s as a numeric value for aggregation; skipping.", value)
-            return
+    def make_updater(self):
+        """Make a function to add a value to a group's state.
+        @returns: a function that takes a state and a value (from L{make_reader})
+        @exception HXLFilterException: for an unrecognised aggregator type
+        """
+        pattern = self.pattern
+        is_empty = hxl.datatypes.is_empty
 
-        normalised = hxl.datatypes.normalise(value, self.pattern)
-        self.total += 1
+        def number(value):
+            # the numeric value, or None if it's not a number
+            if pattern.tag == '#date':
+                if hxl.datatypes.typeof(value, pattern) != 'number':
+                    return None
+                return hxl.datatypes.normalise(value, pattern)
+            try:
+                return hxl.datatypes.normalise_number(value)
+            except ValueError:
+                return None
 
-        # aggregate as appropriate
-        # note that we track a separate normalised value for strings and dates
-        if self.type == 'sum':
-            if self.value is None:
-                self.value = 0
-            self.value += normalised
-        elif self.type == 'average':
-            if self.value is None:
-                self.value = 0
-            self.value = ((self.value * (self.total - 1)) + normalised) / self.total
-        elif self.type == 'min':
-            def gt(a, b):
-                try:
-                    return a > b
-                except TypeError:
-                    return str(a) > str(b)
-            if self.normalised is None or gt(self.normalised, normalised):
-                self.value = value
-                self.normalised = normalised
-        elif self.type == 'max':
-            def lt(a, b):
+        def compare(op):
+            def compare(a, b):
                 try:
-                    return a < b
+                    return op(a, b)
                 except TypeError:
-                    return str(a) < str(b)
-            if self.normalised is None or lt(self.normalised, normalised):
-                self.value = value
-                self.normalised = normalised
+                    return op(str(a), str(b))
+            return compare
+
+        if self.type == 'count':
+            def update(state, value):
+                state[0] += 1
+
+        elif self.type == 'sum':
+            def update(state, value):
+                if is_empty(value):
+                    return
+                n = number(value)
+                if n is None:
+                    logger.error("Cannot use %s as a numeric value for aggregation; skipping.", value)
+                elif state[0] is None:
+                    state[0] = n
+                else:
+                    state[0] += n
+
+        elif self.type == 'average':
+            def update(state, value):
+                if is_empty(value):
+                    return
+                n = number(value)
+                if n is None:
+                    logger.error("Cannot use %s as a numeric value for aggregation; skipping.", value)
+                else:
+                    state[0] += 1
+                    state[1] += n
+
+        elif self.type in ('min', 'max',):
+            better = compare(operator.gt if self.type == 'min' else operator.lt)
+            def update(state, value):
+                if is_empty(value):
+                    return
+                normalised = hxl.datatypes.normalise(value, pattern)
+                if state[1] is None or better(state[1], normalised):
+                    state[0] = value
+                    state[1] = normalised
+
         elif self.type == 'concat':
-            if not hxl.datatypes.is_empty(value):
-                value = hxl.datatypes.normalise_space(value)
-                if value not in self.values:
-                    # regenerate the list if it's a new value
-                    self.values.add(value)
-                    self.value = "|".join(sorted(self.values))
+            def update(state, value):
+                if not is_empty(value):
+                    state.add(hxl.datatypes.normalise_space(value))
+
+        elif self.type in ('median', 'percentile',):
+            def update(state, value):
+                if is_empty(value):
+                    return
+                n = number(value)
+                if n is None:
+                    logger.error("Cannot use %s as a numeric value for aggregation; skipping.", value)
+                else:
+                    state.add(n)
+
+        elif self.type == 'count_distinct':
+            def update(state, value):
+                if not is_empty(value):
+                    state.add(hxl.datatypes.normalise_space(value))
+
+        else:
+            raise HXLFilterException("Bad aggregator type for count filter: {}".format(self.type))
+
+        return update
+
+    def merge_states(self, state, other):
+        """Merge another group's state into a state, as if it had seen the other group's values too.
+        @param state: the state to change
+        @param other: the state to merge into it
+        """
+        if self.type in ('median', 'percentile', 'count_distinct',):
+            state.merge(other)
+        elif self.type == 'concat':
+            state.update(other)
+        elif self.type == 'average':
+            state[0] += other[0]
+            state[1] += other[1]
+        elif self.type in ('min', 'max',):
+            if other[1] is not None:
+                updater = self.make_updater()
+                updater(state, other[0])
+        elif other[0] is not None:
+            state[0] = other[0] if state[0] is None else state[0] + other[0]
+
+    def result(self, state):
+        """@returns: the aggregated value for a group's state, or None if there were no usable values"""
+        if self.type == 'average':
+            return state[1] / state[0] if state[0] else None
+        elif self.type == 'concat':
+            return "|".join(sorted(state)) if state else None
+        elif self.type == 'median':
+            return state.quantile(0.5)
+        elif self.type == 'percentile':
+            return state.quantile(self.parameter / 100.0)
+        elif self.type == 'count_distinct':
+            return state.estimate()
         else:
-            raise HXLFilterException("Bad aggregator type for count filter: {}".format(type))
+            return state[0]
 
     TAG_PATTERN = '#?{token}(?:\s*[+-]{token})*'.format(token=hxl.datatypes.TOKEN_PATTERN)
     """Regular expression for a tag pattern"""
@@ -516,19 +803,23 @@ class Aggregator(object):
     COL_PATTERN = '#{token}(?:\s*\+{token})*'.format(token=hxl.datatypes.TOKEN_PATTERN)
     """Regular expression for an output column pattern"""
 
-    AGGREGATOR_PATTERN = r'^\s*({token})\(({tag})?\)(?:\s*as\s+([^#]*)({col}))?$'.format(
+    NUMBER_PATTERN = r'\d+(?:\.\d*)?'
+    """Regular expression for an aggregator parameter"""
+
+    AGGREGATOR_PATTERN = r'^\s*({token})\(\s*({tag})?(?:\s*,\s*({number}))?\s*\)(?:\s*as\s+([^#]*)({col}))?$'.format(
         token = hxl.datatypes.TOKEN_PATTERN,
         tag = TAG_PATTERN,
+        number = NUMBER_PATTERN,
         col = COL_PATTERN
     )
     """ Regular expression for an aggregation pattern
-    Matches 1=aggregator, 2=tag pattern, 3=column header, 4=column tag
+    Matches 1=aggregator, 2=tag pattern, 3=parameter, 4=column header, 5=column tag
     """
 
     @staticmethod
     def parse(spec):
         """Parse a string specification and create an aggregator.
-        Example: C{sum(#affected) as #affected+total}
+        Examples: C{sum(#affected) as #affected+total}, C{percentile(#affected, 90) as #affected+p90}
         @param spec: the string specification
         @returns: an aggregator
         @exception HXLFilterException: if unable to parse, or an unrecognised aggregator type
@@ -542,7 +833,8 @@ class Aggregator(object):
         return Aggregator(
             type=match.group(1),
             pattern=hxl.model.TagPattern.parse(match.group(2)) if match.group(2) else None,
-            column=hxl.model.Column.parse(match.group(4), header=match.group(3), use_exception=True) if match.group(4) else None,
+            column=hxl.model.Column.parse(match.group(5), header=match.group(4), use_exception=True) if match.group(5) else None,
+            parameter=match.group(3),
         )
 
     @staticmethod
@@ -1103,10 +1395,12 @@ class CleanDataFilter(AbstractStreamingFilter):
         self.latlon = hxl.model.TagPattern.parse_list(latlon)
         self.purge = purge
         self.queries = self._setup_queries(queries)
+        self._clean_ops = None # (index, ops) for columns needing cleaning (see filter_batch)
 
         # We need to prescan for dates
         if date:
-            self.source = self.source.cache();
+            if not self.source.is_cached:
+                self.source = self.source.cache()
             self.date_dayfirst = self._guess_dayfirst()
 
     def filter_row(self, row):
@@ -1122,6 +1416,28 @@ class CleanDataFilter(AbstractStreamingFilter):
             # otherwise, leave as-is
             return row.values
 
+    def filter_batch(self, rows):
+        """Filter a batch of rows (see L{AbstractStreamingFilter.filter_batch}).
+        Cleans only the columns that match a pattern; the rest just become strings.
+        """
+        columns = self.columns
+        if self._clean_ops is None:
+            self._clean_ops = [(i, self._get_ops(column),) for i, column in enumerate(columns)]
+            self._clean_ops = [(i, ops,) for i, ops in self._clean_ops if any(ops)]
+        clean_ops = self._clean_ops
+        match_list = hxl.model.RowQuery.match_list
+        result = []
+        for row in rows:
+            if self.queries and not match_list(row, self.queries):
+                result.append(row.values)
+                continue
+            values = [value if type(value) is str else str(value) for value in row.values[:len(columns)]] + list(row.values[len(columns):])
+            for i, ops in clean_ops:
+                if i < len(values):
+                    values[i] = self._clean_value(values[i], columns[i], ops)
+            result.append(values)
+        return result
+
     def _guess_dayfirst(self):
         """Guess whether the default should be DD-MM-YYYY or MM-DD-YYYY
         @returns: true if we should default to dayfirst format
@@ -1151,28 +1467,31 @@ class CleanDataFilter(AbstractStreamingFilter):
         return (ddmm_count >= mmdd_count)
 
     
-    def _clean_value(self, value, column):
+    def _clean_value(self, value, column, ops=None):
         """Clean a single value, using the column def for guidance.
+        @param ops: the result of L{_get_ops} for the column, if already known
         @returns: a single cleaned value
         """
+        if ops is None:
+            ops = self._get_ops(column)
         value = str(value)
 
         # Whitespace (-w)
-        if self._match_patterns(self.whitespace, column):
+        if ops[0]:
             value = re.sub('^\s+', '', value)
             value = re.sub('\s+$', '', value)
             value = re.sub('\s+', ' ', value)
 
         # Uppercase (-u)
-        if self._match_patterns(self.upper, column):
+        if ops[1]:
             value = value.upper()
 
         # Lowercase (-l)
-        if self._match_patterns(self.lower, column):
+        if ops[2]:
             value = value.lower()
 
         # Date
-        if self._match_patterns(self.date, column):
+        if ops[3]:
             if value:
                 try:
                     value = hxl.datatypes.normalise_date(value, self.date_dayfirst)
@@ -1184,7 +1503,7 @@ class CleanDataFilter(AbstractStreamingFilter):
                         value = ''
 
         # Number
-        if self._match_patterns(self.number, column):
+        if ops[4]:
 
             def try_number(s):
                 try:
@@ -1212,7 +1531,7 @@ class CleanDataFilter(AbstractStreamingFilter):
                         value = ''
 
         # Latlon
-        if self._match_patterns(self.latlon, column):
+        if ops[5]:
             if 'lat' in column.attributes:
                 lat = hxl.geo.parse_lat(value)
                 if lat is not None:
@@ -1240,6 +1559,12 @@ class CleanDataFilter(AbstractStreamingFilter):
         
         return value
 
+    def _get_ops(self, column):
+        """Check which cleaning operations apply to a column.
+        @returns: a tuple of booleans for whitespace, upper, lower, date, number, and latlon
+        """
+        return tuple([self._match_patterns(patterns, column) for patterns in (self.whitespace, self.upper, self.lower, self.date, self.number, self.latlon,)])
+
     def _match_patterns(self, patterns, column):
         """Test if a column matches a list of patterns.
         @param patterns: a list of tag patterns to match
@@ -1337,6 +1662,21 @@ class ColumnFilter(AbstractStreamingFilter):
                 pass # don't add anything
         return values
 
+    def filter_batch(self, rows):
+        """Filter a batch of rows (see L{AbstractStreamingFilter.filter_batch})."""
+        indices = self.indices
+        if indices:
+            last = indices[-1]
+        result = []
+        for row in rows:
+            values = row.values
+            if indices and len(values) > last:
+                result.append([values[i] for i in indices])
+            else:
+                # short row (or no columns)
+                result.append([values[i] for i in indices if i < len(values)])
+        return result
+
     def _test_column(self, column):
         """Test whether a  column should be included in the output.
         If there is a whitelist, it must be in the whitelist; if there is a blacklist, it must not be in the blacklist.
@@ -1365,6 +1705,16 @@ class ColumnFilter(AbstractStreamingFilter):
         # not a whitelist, and no reason to exclude
         return True
 
+    def _to_sqlite(self, input):
+        """Select the columns in SQL (see L{push_down})."""
+        columns = self.columns
+        if not self.indices:
+            return None
+        return input.derive(
+            'SELECT _row, ' + ', '.join(['c{} AS c{}'.format(index, i) for i, index in enumerate(self.indices)]) + ' FROM {source}',
+            columns
+        )
+
     @staticmethod
     def _load(source, spec):
         """Create a filter object from a JSON-like spec.
@@ -1416,15 +1766,39 @@ class CountFilter(AbstractCachingFilter):
     specific fields. This example will count only the rows where C{#adm1} is set to "Coast"::
 
       filter = hxl.data(url).count('org', queries='adm1=Coast')
+
+    With a memory limit, once the groups no longer fit, the filter
+    hash-partitions them (and the rest of the rows) into temporary
+    files, aggregates each partition separately (partitioning again
+    if needed), and merges the sorted results. The output is the same
+    as counting in memory::
+
+      filter = hxl.data(url).count(['loc+code', 'date'], memory_limit=500000000)
     """
 
-    def __init__(self, source, patterns, aggregators=None, queries=[]):
+    GROUP_OVERHEAD = 200
+    """Estimated bytes used for each group in memory, apart from its key values and aggregator states"""
+
+    VALUE_OVERHEAD = 60
+    """Estimated bytes used for each key value in memory, apart from its characters"""
+
+    STATE_OVERHEAD = 120
+    """Estimated bytes used for each aggregator state in memory"""
+
+    PARTITIONS = 16
+    """Number of partitions to use when the groups don't fit in memory"""
+
+    MAX_PARTITION_DEPTH = 5
+    """Maximum number of times to partition the same rows again"""
+
+    def __init__(self, source, patterns, aggregators=None, queries=[], memory_limit=None):
         """Construct a new count filter
         If the caller does not supply any aggregators, use "count() as Count#meta+count"
         @param source: a L{hxl.model.Dataset}
         @param patterns: a single L{tag pattern<hxl.model.TagPattern>} or list of tag patterns that, together, form a unique key for counting.
         @param aggregators: one or more Aggregator objects or string representations to define the output.
         @param queries: an optional list of L{row queries<hxl.model.RowQuery>} to filter the rows being counted.
+        @param memory_limit: if set, the approximate maximum number of bytes for groups in memory, partitioning them to temporary files beyond that (default: None, to keep all groups in memory)
         """
         super().__init__(source)
         self.patterns = hxl.model.TagPattern.parse_list(patterns)
@@ -1432,6 +1806,8 @@ class CountFilter(AbstractCachingFilter):
             aggregators = 'count() as Count#meta+count'
         self.aggregators = Aggregator.parse_list(aggregators)
         self.queries = self._setup_queries(queries)
+        self.memory_limit = memory_limit
+        self._spill_files = None
 
     def filter_columns(self):
         """@returns: the filtered columns"""
@@ -1452,39 +1828,167 @@ class CountFilter(AbstractCachingFilter):
         return columns
 
     def filter_rows(self):
-        """@returns: the filtered row values"""
+        """@returns: the filtered row values (a replayable L{SpillFiles.MergedValues} object if the groups didn't fit in memory)"""
+        result = self._aggregate_data()
+        if isinstance(result, list):
+            return [values for key, values in result]
+        else:
+            return result
 
-        raw_data = []
+    def _aggregate_data(self):
+        """Read the entire source dataset and aggregate it.
+
+        The aggregators are compiled once: each key and aggregated
+        value has a reader for precomputed column indices, and each
+        group keeps only a small state per aggregator (see
+        L{Aggregator.new_state}) until the end.
+
+        @returns: a sorted list of (key tuple, output row) pairs, or a L{SpillFiles.MergedValues} object with the output rows
+        """
+        columns = self.source.columns
+        normalise_space = hxl.datatypes.normalise_space
+        match_list = hxl.model.RowQuery.match_list
+        queries = self.queries
+
+        key_readers = [Aggregator.make_pattern_reader(pattern, columns, '') for pattern in self.patterns]
+        value_readers = [aggregator.make_reader(columns) for aggregator in self.aggregators]
+
+        def records():
+            # read the whole source dataset at once
+            for batch in self.source.batches():
+                for row in batch:
+                    # will always match if there are no queries
+                    if queries and not match_list(row, queries):
+                        continue
+                    values = row.values
+                    yield (
+                        tuple([normalise_space(read(values)) for read in key_readers]),
+                        None,
+                        [read(values) for read in value_readers],
+                    )
 
-        # each item is a sequence containing a tuple of key values and an _Aggregator object
-        for aggregate in self._aggregate_data():
-            raw_data.append(
-                list(aggregate[0]) + [aggregator.value if aggregator.value is not None else '' for aggregator in aggregate[1]]
-            )
-            
-        return raw_data
+        return self._aggregate_records(records())
 
-    def _aggregate_data(self):
-        """Read the entire source dataset and produce saved aggregate data.
-        @returns: the aggregated values as raw data
+    def _aggregate_records(self, records, depth=0):
+        """Aggregate a stream of records, partitioning them to disk if the groups don't fit within the memory limit.
+
+        Each record is a tuple of (key, states, inputs): either the
+        saved aggregator states for a group that was partitioned, or
+        the aggregator input values from a row. A group's saved
+        states always come before the rest of its rows in a
+        partition, so every aggregator sees its values in the
+        original order, and the results are the same as aggregating
+        in memory.
+
+        @param records: an iterable of (key, states, inputs) tuples
+        @param depth: the number of times these records have already been partitioned
+        @returns: a sorted list of (key tuple, output row) pairs, or a L{SpillFiles.MergedValues} object with the output rows
         """
-        aggregators = {}
+        aggregators = self.aggregators
+        updaters = [aggregator.make_updater() for aggregator in aggregators]
+        groups = {}
+        size = 0
+        partitions = None
+
+        def partition(key):
+            return partitions[hash((depth, key,)) % self.PARTITIONS]
+
+        for key, states, inputs in records:
+            if partitions is not None:
+                partition(key).add((key, states, inputs,))
+                continue
+
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = states or [aggregator.new_state() for aggregator in aggregators]
+                size += self._estimate_size(key)
+            if inputs is not None:
+                for update, state, value in zip(updaters, group, inputs):
+                    update(state, value)
+
+            if self.memory_limit is not None and size > self.memory_limit and len(groups) > 1 and depth < self.MAX_PARTITION_DEPTH:
+                # out of memory: send the groups so far, and all further records, to partitions
+                if self._spill_files is None:
+                    # removed when the filter is garbage-collected
+                    self._spill_files = SpillFiles(prefix='hxl-count-')
+                partitions = [self._spill_files.writer() for i in range(self.PARTITIONS)]
+                for key, group in groups.items():
+                    partition(key).add((key, group, None,))
+                groups = None
+
+        if partitions is None:
+            return sorted(
+                (key, list(key) + [self._output_value(aggregator, state) for aggregator, state in zip(aggregators, group)],)
+                for key, group in groups.items()
+            )
 
-        # read the whole source dataset at once
-        for row in self.source:
-            # will always match if there are no queries
-            if hxl.model.RowQuery.match_list(row, self.queries):
-                # get the values in the order we need them
-                values = [hxl.datatypes.normalise_space(row.get(pattern, default='')) for pattern in self.patterns]
-                # make a dict key for the aggregator
-                key = tuple(values)
-                if not key in aggregators:
-                    aggregators[key] = [copy.deepcopy(aggregator) for aggregator in self.aggregators]
-                for aggregator in aggregators[key]:
-                    aggregator.evaluate_row(row)
-
-        # sort the aggregators by their keys
-        return sorted(aggregators.items())
+        logger.debug("Count filter partitioned %d ways at depth %d", self.PARTITIONS, depth)
+        paths = []
+        for writer in partitions:
+            path = writer.close()
+            result = self._aggregate_records(SpillFiles.read(path), depth + 1)
+            os.remove(path)
+            if isinstance(result, list):
+                if result:
+                    paths.append(self._spill_files.save(result))
+            else:
+                paths += result.paths # already sorted files
+        return SpillFiles.MergedValues(paths)
+
+    def _estimate_size(self, key):
+        """Estimate the memory for a group with its key and aggregator states, in bytes."""
+        size = self.GROUP_OVERHEAD + self.STATE_OVERHEAD * len(self.aggregators)
+        for value in key:
+            size += self.VALUE_OVERHEAD + len(value)
+        return size
+
+    @staticmethod
+    def _output_value(aggregator, state):
+        value = aggregator.result(state)
+        return value if value is not None else ''
+
+    def _to_sqlite(self, input):
+        """Group and aggregate in SQL (see L{push_down}).
+        The keys, row queries, and aggregators run as Python functions registered with SQLite.
+        """
+        if not self.patterns:
+            return None # SQL would return an aggregate row even for no input
+        columns = self.source.columns
+        values = input.value_columns
+
+        def make_row(values):
+            return hxl.model.Row(columns, hxl.io.SQLiteInput.make_values(values))
+
+        def key(i, *values):
+            return hxl.datatypes.normalise_space(make_row(values).get(self.patterns[i], default=''))
+
+        def match(*values):
+            return hxl.model.RowQuery.match_list(make_row(values), self.queries)
+
+        def make_aggregate(aggregator):
+            read = aggregator.make_reader(columns)
+            update = aggregator.make_updater()
+            class Aggregate:
+                def __init__(self):
+                    self.state = aggregator.new_state()
+                def step(self, *values):
+                    update(self.state, read(hxl.io.SQLiteInput.make_values(values)))
+                def finalize(self):
+                    return CountFilter._output_value(aggregator, self.state)
+            return Aggregate
+
+        keys = ['k{}'.format(i) for i in range(len(self.patterns))]
+        outputs = ['{} AS c{}'.format(k, i) for i, k in enumerate(keys)]
+        outputs += ['a{} AS c{}'.format(i, i + len(keys)) for i in range(len(self.aggregators))]
+        return input.derive(
+            'SELECT ROW_NUMBER() OVER (ORDER BY ' + ', '.join(keys) + ') AS _row, ' + ', '.join(outputs) + ' FROM (' +
+            'SELECT ' + ', '.join(['{{key}}({}, {}) AS {}'.format(i, values, k) for i, k in enumerate(keys)]) + ', ' +
+            ', '.join(['{{aggregate{}}}({}) AS a{}'.format(i, values, i) for i in range(len(self.aggregators))]) +
+            ' FROM {source} WHERE {match}(' + values + ') GROUP BY ' + ', '.join(keys) + ')',
+            self.columns,
+            functions={'key': key, 'match': match},
+            aggregates={'aggregate{}'.format(i): make_aggregate(aggregator) for i, aggregator in enumerate(self.aggregators)}
+        )
 
     @staticmethod
     def _load(source, spec):
@@ -1496,7 +2000,8 @@ class CountFilter(AbstractCachingFilter):
             source = source,
             patterns=opt_arg(spec, 'patterns'),
             aggregators=opt_arg(spec, 'aggregators', None),
-            queries=opt_arg(spec, 'queries', [])
+            queries=opt_arg(spec, 'queries', []),
+            memory_limit=opt_arg(spec, 'memory_limit')
         )
 
 
@@ -1540,6 +2045,10 @@ class DeduplicationFilter(AbstractStreamingFilter):
         else:
             return row.values
 
+    def reset(self):
+        """Forget the rows seen in an earlier pass."""
+        self.seen_map = set()
+
     @staticmethod
     def _load(source, spec):
         """Create a dedup filter from a dict spec.
@@ -1861,7 +2370,7 @@ class MergeDataFilter(AbstractStreamingFilter):
         @param queries: optional list of filter queries for rows to be considered from the merge dataset.
         """
         super().__init__(source)
-        self.merge_source = merge_source
+        self.merge_source = hxl.data(merge_source) # so that we can take a plain URL
         """The source dataset for pulling merged values"""
         self.keys = hxl.model.TagPattern.parse_list(keys)
         """The shared keys for merging"""
@@ -2002,6 +2511,323 @@ class MergeDataFilter(AbstractStreamingFilter):
         )
 
 
+class ParallelFilter(AbstractBaseFilter):
+    """
+    Composable filter class to run stateless filters in parallel.
+
+    The filters chained directly after this one form a I{segment}: the
+    filter sends batches of rows to a pool of worker processes, each of
+    which runs the whole segment on its batch, then puts the results
+    back into the original order.
+
+    Usage:
+
+    <pre>
+    hxl.data(url).parallel(workers=4).clean_data(whitespace='*').replace_data('NRC', 'Norwegian Refugee Council').sort()
+    </pre>
+
+    Only filters that treat each row on its own can join the segment
+    (see L{STAGES}). Filters that depend on other rows
+    (L{DeduplicationFilter}, L{FillDataFilter}, L{RowCountFilter},
+    date cleaning, or any row query or mask with an aggregate value
+    like "min" or "max") are refused. Any other filter ends the segment and runs as usual on
+    its output.
+
+    The stage arguments go to the worker processes, so they must be
+    picklable (for example, a replacement map should be a URL, not
+    an open dataset).
+    """
+
+    STAGES = [
+        'add_columns', 'clean_data', 'jsonpath', 'rename_columns', 'replace_data', 'replace_data_map',
+        'with_columns', 'with_rows', 'without_columns', 'without_rows',
+    ]
+    """Dataset methods that can run in a parallel segment"""
+
+    QUEUE_FACTOR = 2
+    """Batches waiting for results, per worker"""
+
+    def __init__(self, source, workers=None, batch_size=None, stages=[]):
+        """
+        Constructor
+        @param source: the HXL data source
+        @param workers: the number of worker processes (default: one per CPU)
+        @param batch_size: the number of rows to send to a worker at once (default: L{hxl.model.BATCH_SIZE})
+        @param stages: a list of (method, args, kwargs) tuples for the filters in the segment
+        """
+        super(ParallelFilter, self).__init__(source)
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size or hxl.model.BATCH_SIZE
+        self.stages = list(stages)
+
+    def filter_columns(self):
+        """Run the segment on an empty batch to get the output columns."""
+        source, segment = ParallelFilter.make_segment(self.source.columns, self.stages)
+        return segment.columns
+
+    def batches(self, size=None):
+        """Send the source's batches to the worker processes, in order.
+        @param size: ignored (the batches have the size given to the constructor)
+        @returns: an iterator that returns non-empty lists of L{hxl.model.Row} objects
+        """
+        columns = self.columns # also checks the segment before starting any workers
+        row_number = -1
+        Row = hxl.model.Row
+        pending = collections.deque()
+
+        def next_batch():
+            nonlocal row_number
+            rows = []
+            for values in pending.popleft().result():
+                row_number += 1
+                rows.append(Row(columns, values, row_number))
+            return rows
+
+        executor = concurrent.futures.ProcessPoolExecutor(
+            self.workers,
+            initializer=_init_parallel_worker,
+            initargs=(self.source.columns, self.stages,)
+        )
+        try:
+            for batch in self.source.batches(self.batch_size):
+                pending.append(executor.submit(_run_parallel_batch, [row.values for row in batch]))
+                if len(pending) > self.workers * self.QUEUE_FACTOR:
+                    rows = next_batch()
+                    if rows:
+                        yield rows
+            while pending:
+                rows = next_batch()
+                if rows:
+                    yield rows
+        finally:
+            # also runs if the consumer stops early
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def __iter__(self):
+        for batch in self.batches():
+            yield from batch
+
+    def _add_stage(self, method, args, kwargs):
+        """Return a new parallel filter with one more stage in its segment."""
+        return ParallelFilter(
+            self.source,
+            workers=self.workers,
+            batch_size=self.batch_size,
+            stages=self.stages + [(method, args, kwargs)]
+        )
+
+    def _refuse(self, name):
+        raise HXLFilterException(
+            "Can't {} in a parallel segment, because the result depends on other rows; add .cache() first to end the segment".format(name)
+        )
+
+    def add_columns(self, *args, **kwargs):
+        return self._add_stage('add_columns', args, kwargs)
+
+    def clean_data(self, *args, **kwargs):
+        return self._add_stage('clean_data', args, kwargs)
+
+    def jsonpath(self, *args, **kwargs):
+        return self._add_stage('jsonpath', args, kwargs)
+
+    def rename_columns(self, *args, **kwargs):
+        return self._add_stage('rename_columns', args, kwargs)
+
+    def replace_data(self, *args, **kwargs):
+        return self._add_stage('replace_data', args, kwargs)
+
+    def replace_data_map(self, *args, **kwargs):
+        return self._add_stage('replace_data_map', args, kwargs)
+
+    def with_columns(self, *args, **kwargs):
+        return self._add_stage('with_columns', args, kwargs)
+
+    def with_rows(self, *args, **kwargs):
+        return self._add_stage('with_rows', args, kwargs)
+
+    def without_columns(self, *args, **kwargs):
+        return self._add_stage('without_columns', args, kwargs)
+
+    def without_rows(self, *args, **kwargs):
+        return self._add_stage('without_rows', args, kwargs)
+
+    def dedup(self, *args, **kwargs):
+        self._refuse('deduplicate rows')
+
+    def fill_data(self, *args, **kwargs):
+        self._refuse('fill data')
+
+    def row_counter(self, *args, **kwargs):
+        self._refuse('count rows')
+
+    @staticmethod
+    def make_segment(columns, stages):
+        """Build the filters for a segment on top of a replaceable batch of rows.
+        @param columns: the source columns
+        @param stages: a list of (method, args, kwargs) tuples
+        @returns: a tuple of the batch source (see L{BatchSource}) and the last filter in the segment
+        @exception HXLFilterException: if a stage can't run in parallel
+        """
+        source = ParallelFilter.BatchSource(columns)
+        segment = source
+        for method, args, kwargs in stages:
+            if method not in ParallelFilter.STAGES:
+                raise HXLFilterException("Can't run {} in a parallel segment".format(method))
+            segment = getattr(segment, method)(*args, **kwargs)
+            if isinstance(segment, CleanDataFilter) and segment.date:
+                # guessing the date format needs the whole dataset (see RecipeOptimiser too)
+                raise HXLFilterException("Can't clean dates in a parallel segment")
+            for query in getattr(segment, 'queries', []) + getattr(segment, 'mask', []):
+                if query.is_aggregate:
+                    raise HXLFilterException(
+                        "Can't use an aggregate row query for {} in a parallel segment".format(query.pattern)
+                    )
+        return source, segment
+
+    class BatchSource(hxl.model.Dataset):
+        """A dataset whose rows can be replaced between runs of a segment."""
+
+        def __init__(self, columns):
+            super().__init__()
+            self._columns = columns
+            self.rows = []
+            """A list of lists of values"""
+
+        @property
+        def columns(self):
+            return self._columns
+
+        def __iter__(self):
+            columns = self._columns
+            return (hxl.model.Row(columns, values, i) for i, values in enumerate(self.rows))
+
+
+_parallel_segment = None
+"""The (source, segment) for a worker process (see L{ParallelFilter.make_segment})"""
+
+def _init_parallel_worker(columns, stages):
+    """Set up the segment once in each worker process."""
+    global _parallel_segment
+    _parallel_segment = ParallelFilter.make_segment(columns, stages)
+
+def _run_parallel_batch(rows):
+    """Run the segment on a batch of rows in a worker process.
+    @param rows: a list of lists of values
+    @returns: a list of lists of filtered values
+    """
+    source, segment = _parallel_segment
+    source.rows = rows
+    return [row.values for batch in segment.batches(len(rows) or None) for row in batch]
+
+
+class PrefetchFilter(AbstractBaseFilter):
+    """
+    Composable filter class to read ahead in a background thread.
+
+    A background thread reads batches of rows from the source into a
+    bounded queue, so that waiting for the network or disk (and
+    parsing) overlaps with whatever happens downstream. The output is
+    identical to the source's.
+
+    Usage:
+
+    <pre>
+    hxl.data(url).prefetch(batches=8).with_rows('#sector=WASH')
+    </pre>
+
+    An exception in the background thread is raised again in the
+    thread that is reading the rows, and the background thread stops
+    (after finishing its current read) if the reader stops early.
+
+    @see: L{hxl.io.data} (prefetch option)
+    """
+
+    DEFAULT_BATCHES = 4
+    """Default maximum number of batches to read ahead"""
+
+    WAIT = 0.1
+    """Seconds between checks for a stop request while the queue is full"""
+
+    def __init__(self, source, batches=None, batch_size=None):
+        """
+        Constructor
+        @param source: the HXL data source
+        @param batches: the maximum number of batches to read ahead (default: L{DEFAULT_BATCHES})
+        @param batch_size: the number of rows in each batch (default: L{hxl.model.BATCH_SIZE})
+        """
+        super(PrefetchFilter, self).__init__(source)
+        self.max_batches = batches or self.DEFAULT_BATCHES
+        self.batch_size = batch_size
+
+    def __enter__(self):
+        """Context-start support (passed on to the source, e.g. a L{hxl.io.HXLReader})."""
+        if hasattr(self.source, '__enter__'):
+            self.source.__enter__()
+        return self
+
+    def __exit__(self, value, type, traceback):
+        """Context-end support."""
+        if hasattr(self.source, '__exit__'):
+            self.source.__exit__(value, type, traceback)
+
+    @property
+    def input(self):
+        """The source's low-level input, if it's a L{hxl.io.HXLReader} (otherwise None)"""
+        return getattr(self.source, 'input', None)
+
+    @property
+    def stats(self):
+        """The source's input counters, if it's a L{hxl.io.HXLReader} (otherwise None)"""
+        return getattr(self.source, 'stats', None)
+
+    def batches(self, size=None):
+        """Read the source's batches in a background thread.
+        @param size: the number of rows in each batch, if not set in the constructor
+        @returns: an iterator that returns non-empty lists of L{hxl.model.Row} objects
+        """
+        self.columns # read the headers here, before the thread starts
+        buffer = queue.Queue(self.max_batches)
+        stopped = threading.Event()
+
+        def put(item):
+            while not stopped.is_set():
+                try:
+                    buffer.put(item, timeout=self.WAIT)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def read_ahead():
+            try:
+                for batch in self.source.batches(self.batch_size or size):
+                    if not put((batch, None,)):
+                        return
+                put((None, None,))
+            except BaseException as e:
+                put((None, e,))
+
+        thread = threading.Thread(target=read_ahead, name='hxl-prefetch', daemon=True)
+        thread.start()
+        try:
+            while True:
+                batch, exception = buffer.get()
+                if exception is not None:
+                    raise exception
+                elif batch is None:
+                    break
+                else:
+                    yield batch
+        finally:
+            # also runs if the consumer stops early
+            stopped.set()
+            thread.join()
+
+    def __iter__(self):
+        for batch in self.batches():
+            yield from batch
+
+
 class RenameFilter(AbstractStreamingFilter):
     """
     Composable filter class to rename columns in a HXL dataset.
@@ -2175,6 +3001,10 @@ class FillDataFilter(AbstractStreamingFilter):
                     
         return values
 
+    def reset(self):
+        """Forget the values saved in an earlier pass."""
+        self._saved = {}
+
     @staticmethod
     def _load(source, spec):
         """Create a fill-data filter from a dict spec.
@@ -2228,6 +3058,37 @@ class ReplaceDataFilter(AbstractStreamingFilter):
         else:
             return row.values
 
+    def filter_batch(self, rows):
+        """Filter a batch of rows (see L{AbstractStreamingFilter.filter_batch}).
+        Works out only once which replacements apply to each column.
+        """
+        if not rows:
+            return []
+        columns = rows[0].columns
+        column_replacements = []
+        for index, column in enumerate(columns):
+            replacements = [replacement for replacement in self.replacements if replacement.applies_to(column)]
+            if replacements:
+                column_replacements.append((index, replacements,))
+        match_list = hxl.model.RowQuery.match_list
+        result = []
+        for row in rows:
+            if row.columns is not columns or len(row.values) > len(columns):
+                # unusual row: do it the slow way
+                result.append(self.filter_row(row))
+            elif self.queries and not match_list(row, self.queries):
+                result.append(row.values)
+            else:
+                values = list(row.values)
+                for index, replacements in column_replacements:
+                    if index < len(values):
+                        value = values[index]
+                        for replacement in replacements:
+                            value = replacement.sub_value(value)
+                        values[index] = value
+                result.append(values)
+        return result
+
     class Replacement:
         """Replacement specification."""
 
@@ -2258,9 +3119,21 @@ class ReplaceDataFilter(AbstractStreamingFilter):
             @param value: the cell value
             @returns: the value, possibly changed
             """
-            if self.patterns and not hxl.model.TagPattern.match_list(column, self.patterns):
+            if self.applies_to(column):
+                return self.sub_value(value)
+            else:
                 return value
-            elif self.is_regex:
+
+        def applies_to(self, column):
+            """@returns: True if this replacement applies to values in the column"""
+            return not self.patterns or hxl.model.TagPattern.match_list(column, self.patterns)
+
+        def sub_value(self, value):
+            """Substitute inside the value, without checking the column (see L{applies_to}).
+            @param value: the cell value
+            @returns: the value, possibly changed
+            """
+            if self.is_regex:
                 return re.sub(self.original, self.replacement, str(value))
             elif self.original == hxl.datatypes.normalise_string(value):
                 return self.replacement
@@ -2339,6 +3212,10 @@ class RowCountFilter(AbstractStreamingFilter):
         if hxl.model.RowQuery.match_list(row, self.queries):
             self.row_count += 1
         return row.values
+
+    def reset(self):
+        """Start counting again (the count is for the latest pass)."""
+        self.row_count = 0
     
 
 class RowFilter(AbstractStreamingFilter):
@@ -2385,6 +3262,33 @@ class RowFilter(AbstractStreamingFilter):
                 return None
         return row.values
 
+    def filter_batch(self, rows):
+        """Filter a batch of rows (see L{AbstractStreamingFilter.filter_batch})."""
+        match_list = hxl.model.RowQuery.match_list
+        queries, reverse = self.queries, self.reverse
+        if self.mask:
+            mask = self.mask
+            return [row.values for row in rows if not match_list(row, mask) or match_list(row, queries, reverse)]
+        else:
+            return [row.values for row in rows if match_list(row, queries, reverse)]
+
+    def _to_sqlite(self, input):
+        """Select the rows in SQL (see L{push_down}).
+        The row queries run as a Python function registered with SQLite.
+        """
+        columns = self.source.columns
+
+        def match(*values):
+            row = hxl.model.Row(columns, hxl.io.SQLiteInput.make_values(values))
+            return self.filter_row(row) is not None
+
+        return input.derive(
+            'SELECT * FROM {source} WHERE {match}(' + input.value_columns + ')',
+            columns,
+            functions={'match': match},
+            width=input.width
+        )
+
     @staticmethod
     def _load(source, spec):
         """Construct a row filter from a dict spec."""
@@ -2412,21 +3316,53 @@ class SortFilter(AbstractCachingFilter):
     <pre>
     hxl.data(url).sort('sector,org,adm1')
     </pre>
+
+    With a memory limit, the filter sorts the data in runs that fit
+    within the limit, saves each run to a temporary file, and merges
+    the runs as the rows are read (an external merge sort). The result
+    is exactly the same as sorting in memory.
+
+    With a limit, the filter keeps only the first rows of the sorted
+    output, selecting them with a bounded heap as it reads the source
+    (see L{heapq.nsmallest}), so it never holds more than that many
+    rows. The result is exactly the same as a full sort followed by
+    truncation.
     """
 
-    def __init__(self, source, tags=[], reverse=False):
+    ROW_OVERHEAD = 150
+    """Estimated bytes used for each row in memory, apart from its values"""
+
+    VALUE_OVERHEAD = 200
+    """Estimated bytes used for each value in memory (including its sort key), apart from its characters"""
+
+    MERGE_WIDTH = 128
+    """Maximum number of run files to merge at once"""
+
+    def __init__(self, source, tags=[], reverse=False, memory_limit=None, limit=None):
         """
         @param source: a HXL data source
         @param tags: list of TagPattern objects for sorting
         @param reverse: True to reverse the sort order
+        @param memory_limit: if set, the approximate maximum number of bytes of data to sort in memory, spilling to temporary files beyond that (default: None, to sort everything in memory)
+        @param limit: if set, the maximum number of rows to return, from the start of the sort order (default: None, to return all rows)
         """
         super(SortFilter, self).__init__(source)
         self.sort_tags = hxl.model.TagPattern.parse_list(tags)
         self.reverse = reverse
+        self.memory_limit = memory_limit
+        if limit is not None:
+            limit = int(limit)
+            if limit < 0:
+                raise HXLFilterException("Sort limit must not be negative: {}".format(limit))
+        self.limit = limit
         self._iter = None
+        self._spill_files = None
 
     def filter_rows(self):
-        """Return a sorted list of values, row by row."""
+        """Return a sorted list of values, row by row.
+        If the data doesn't fit within the memory limit, return a
+        replayable L{SpillFiles.MergedValues} object instead of a list.
+        """
 
         # Figure out the indices for sort keys
         indices = self._make_indices()
@@ -2435,7 +3371,66 @@ class SortFilter(AbstractCachingFilter):
             """Closure, to get the object reference into the key method."""
             return self._make_key(indices, values)
 
-        return sorted(self.source.values, key=make_key, reverse=self.reverse)
+        if self.limit is not None:
+            # heap selection, equivalent to sorted(...)[:limit]
+            select = heapq.nlargest if self.reverse else heapq.nsmallest
+            return select(self.limit, (row.values for row in self.source), key=make_key)
+        elif self.memory_limit is None:
+            return sorted(self.source.values, key=make_key, reverse=self.reverse)
+        else:
+            return self._external_sort(make_key)
+
+    def _external_sort(self, make_key):
+        """Sort in runs within the memory limit, spilling them to disk if there's more than one.
+        Each run is a consecutive part of the source, and the merge
+        prefers earlier runs for equal keys, so the sort is stable,
+        like L{sorted}.
+        @param make_key: function to make a sort key from a list of values
+        @returns: a list of sorted values if everything fit in memory, or a L{SpillFiles.MergedValues} object
+        """
+        def sort_run(run):
+            keyed = [(make_key(values), values,) for values in run]
+            keyed.sort(key=lambda item: item[0], reverse=self.reverse)
+            return keyed
+
+        # removed when the filter is garbage-collected
+        self._spill_files = SpillFiles(prefix='hxl-sort-')
+
+        paths = []
+        run = []
+        size = 0
+        for row in self.source:
+            values = row.values
+            run.append(values)
+            size += self._estimate_size(values)
+            if size > self.memory_limit:
+                paths.append(self._spill_files.save(sort_run(run)))
+                run = []
+                size = 0
+
+        if not paths:
+            # everything fit
+            return [values for key, values in sort_run(run)]
+
+        if run:
+            paths.append(self._spill_files.save(sort_run(run)))
+        logger.debug("External sort with %d runs", len(paths))
+
+        # merge in more than one pass if there are too many files to open at once
+        while len(paths) > self.MERGE_WIDTH:
+            paths = [
+                self._spill_files.save(SpillFiles.merge(paths[i:i+self.MERGE_WIDTH], self.reverse))
+                for i in range(0, len(paths), self.MERGE_WIDTH)
+            ]
+
+        return SpillFiles.MergedValues(paths, self.reverse)
+
+    def _estimate_size(self, values):
+        """Estimate the memory for a row of values and its sort key, in bytes."""
+        size = self.ROW_OVERHEAD
+        for value in values:
+            size += self.VALUE_OVERHEAD + (len(value) if isinstance(value, str) else 8)
+        return size
 
     def _make_indices(self):
         """Determine the indices of the data to sort."""
@@ -2467,6 +3462,41 @@ class SortFilter(AbstractCachingFilter):
         # convert the key to a tuple for sorting
         return tuple(key)
 
+    def _to_sqlite(self, input):
+        """Sort in SQL (see L{push_down}).
+        Each sort key becomes a numeric and a string expression, matching L{_make_sort_value};
+        the original row order breaks ties, as in Python's stable sort.
+        """
+        columns = self.columns
+        indices = self._make_indices() or list(range(len(columns)))
+        direction = ' DESC' if self.reverse else ''
+
+        def make_sort_value(i, value):
+            if value is None:
+                # missing from a short row: sort before any value, like a shorter tuple
+                return (float('-inf'), '')
+            return SortFilter._make_sort_value(columns[i].tag, value)
+
+        terms = []
+        for i in indices:
+            terms.append('{{number}}({i}, t.c{i}){d}, {{string}}({i}, t.c{i}){d}'.format(i=i, d=direction))
+        input = input.derive(
+            'SELECT ROW_NUMBER() OVER (ORDER BY ' + ', '.join(terms) + ', t._row) AS _row, ' + input.value_columns + ' FROM {source} AS t',
+            columns,
+            functions={
+                'number': lambda i, value: make_sort_value(i, value)[0],
+                'string': lambda i, value: make_sort_value(i, value)[1],
+            },
+            width=input.width
+        )
+        if self.limit is not None:
+            input = input.derive(
+                'SELECT _row, ' + input.value_columns + ' FROM {source} WHERE _row <= ' + str(self.limit),
+                columns,
+                width=input.width
+            )
+        return input
+
     @staticmethod
     def _make_sort_value(tag, value):
         """
@@ -2494,7 +3524,9 @@ class SortFilter(AbstractCachingFilter):
         return SortFilter(
             source = source,
             tags=opt_arg(spec, 'keys', []),
-            reverse=opt_arg(spec, 'reverse', False)
+            reverse=opt_arg(spec, 'reverse', False),
+            memory_limit=opt_arg(spec, 'memory_limit'),
+            limit=opt_arg(spec, 'limit')
         )
 
 
@@ -2554,7 +3586,7 @@ def opt_arg(spec, property, default_value=None):
         return value
 
 
-def from_recipe(source, recipe):
+def from_recipe(source, recipe, optimise=True):
     """Build a filter chain from a JSON-like list of filter specs.
 
     Each recipe dictionary contains the property 'filter', describing
@@ -2562,37 +3594,351 @@ def from_recipe(source, recipe):
     parameters for the filter. Filter and parameter names are the same
     as the methods and arguments in hxl.model.Dataset.
 
+    External sources that the recipe uses more than once (e.g. as
+    both a merge source and a replacement map, or the main source
+    again) are opened only once (see L{hxl.io.SourceRegistry}); the
+    others are streamed.
+
+    Unless C{optimise} is False, the recipe is first rewritten into
+    an equivalent, cheaper one (see L{RecipeOptimiser}).
+
     @param source: a HXL data source, URL, etc.
     @param recipe: a list of dictionaries, each describing a filter.
+    @param optimise: if True (default), optimise the recipe before building the filters.
     @returns: the filter at the end of the new chain.
     """
-    source = hxl.data(source)
 
-    #
     # Clean up recipe if needed
-    #
-    if isinstance(recipe, six.string_types):
-        # a JSON string (parse it first)
-        recipe = json.loads(recipe)
-    if isinstance(recipe, dict) and recipe.get('filter'):
-        # a single filter (make it into a list)
-        recipe = [recipe]
-
-    # Process each filter in turn
-    for spec in recipe:
+    if optimise:
+        recipe = RecipeOptimiser(recipe).optimise()
+    else:
+        recipe = RecipeOptimiser.parse(recipe)
 
-        # Find the loader method
-        type = req_arg(spec, 'filter')
-        loader = LOAD_MAP.get(type)
-        if not loader:
-            raise HXLFilterException("Unknown filter type {}".format(type))
+    # share only the external sources that the recipe reads more than once
+    sources = recipe_sources(recipe)
+    if isinstance(source, six.string_types):
+        sources.append(source)
+    locations = [hxl.io.SourceRegistry.resolve(location) for location in sources]
+    shared = [location for location in set(locations) if locations.count(location) > 1]
 
-        # Create the filter
-        source = loader(source, spec)
+    with hxl.io.source_registry(shared):
+
+        source = hxl.data(source)
+
+        # Process each filter in turn
+        for spec in recipe:
+
+            # Find the loader method
+            type = req_arg(spec, 'filter')
+            loader = LOAD_MAP.get(type)
+            if not loader:
+                raise HXLFilterException("Unknown filter type {}".format(type))
+
+            # Create the filter, and run it inside the source database if possible
+            source = push_down(loader(source, spec))
         
     return source
 
 
+def recipe_sources(recipe):
+    """List the external sources (URLs or filenames) that a recipe refers to.
+    @param recipe: a list of dictionaries, each describing a filter.
+    @returns: a list of strings, possibly with duplicates
+    """
+    sources = []
+    for spec in recipe:
+        for property in ('merge_source', 'map_source', 'source_list_url', 'append_sources',):
+            value = spec.get(property)
+            if isinstance(value, six.string_types):
+                sources.append(value)
+            elif isinstance(value, (list, tuple,)):
+                sources += [item for item in value if isinstance(item, six.string_types)]
+    return sources
+
+
+class RecipeOptimiser(object):
+    """Rewrite a recipe into a cheaper one that produces the same output.
+
+    L{from_recipe} runs every recipe through this class first. The
+    rewrites are all provably safe, judging only from the recipe
+    itself (not the data):
+
+      - Move row filters (C{with_rows}, C{without_rows}) ahead of
+        row-by-row transforms (C{clean_data}, C{replace_data},
+        C{replace_data_map}) that can't change any column the
+        queries read, so that the transforms see fewer rows.
+      - Move column filters (C{with_columns}, C{without_columns})
+        ahead of the same transforms, when the transform doesn't
+        select rows with queries of its own.
+      - Fuse adjacent column filters of the same kind, and adjacent
+        C{rename_columns} steps that don't interfere with each other.
+      - Drop a C{cache} step that follows another C{cache} (or a
+        C{sort} or C{count}, which already hold their results in memory).
+
+    C{clean_data} with date normalisation never moves, because it
+    scans all of the rows to guess the date format.
+
+    Usage::
+
+      optimiser = RecipeOptimiser(recipe)
+      print(optimiser.explain())
+    """
+
+    ROW_FILTERS = ['with_rows', 'without_rows']
+    """Recipe filters that select rows"""
+
+    COLUMN_FILTERS = ['with_columns', 'without_columns']
+    """Recipe filters that select columns"""
+
+    ROW_TRANSFORMS = ['clean_data', 'replace_data', 'replace_data_map']
+    """Recipe filters that change values row by row, without changing the columns"""
+
+    CACHED_FILTERS = ['cache', 'count', 'sort']
+    """Recipe filters that keep their output in memory"""
+
+    def __init__(self, recipe):
+        """Constructor
+        @param recipe: a list of dicts, a single dict, or a JSON literal string.
+        """
+        super().__init__()
+        self.recipe = RecipeOptimiser.parse(recipe)
+        """The original recipe (as a list of dicts)"""
+        self.rewrites = []
+        """Descriptions of the rewrites made (strings)"""
+        self._optimised = None
+
+    @staticmethod
+    def parse(recipe):
+        """Normalise a recipe to a list of dicts.
+        @param recipe: a list of dicts, a single dict, or a JSON literal string.
+        @returns: a list of dicts
+        """
+        if isinstance(recipe, six.string_types):
+            # a JSON string (parse it first)
+            recipe = json.loads(recipe)
+        if isinstance(recipe, dict) and recipe.get('filter'):
+            # a single filter (make it into a list)
+            recipe = [recipe]
+        return recipe
+
+    def optimise(self):
+        """@returns: the optimised recipe (a new list of dicts; the original isn't changed)"""
+        if self._optimised is None:
+            specs = [copy.deepcopy(spec) for spec in self.recipe]
+            is_changed = True
+            while is_changed:
+                is_changed = False
+                for i in range(len(specs) - 1):
+                    first, second = specs[i], specs[i+1]
+                    if self._can_move_before(second, first):
+                        specs[i:i+2] = [second, first]
+                        self.rewrites.append('moved {} before {}'.format(second.get('filter'), first.get('filter')))
+                    else:
+                        replacement = self._fuse(first, second)
+                        if replacement is None:
+                            continue
+                        specs[i:i+2] = replacement
+                    is_changed = True
+                    break
+            self._optimised = specs
+        return self._optimised
+
+    def explain(self):
+        """@returns: a human-readable description of the original and optimised plans, and the rewrites"""
+        optimised = self.optimise()
+        lines = ['Original plan:']
+        lines += self._plan_lines(self.recipe)
+        lines.append('Optimised plan:')
+        lines += self._plan_lines(optimised)
+        lines.append('Rewrites:')
+        lines += ['  - ' + rewrite for rewrite in self.rewrites] or ['  (none)']
+        return '\n'.join(lines)
+
+    def _plan_lines(self, specs):
+        if not specs:
+            return ['  (no filters)']
+        lines = []
+        for i, spec in enumerate(specs):
+            args = ', '.join(['{}={}'.format(key, json.dumps(spec[key], default=str)) for key in sorted(spec) if key != 'filter'])
+            lines.append('  {}. {}({})'.format(i + 1, spec.get('filter'), args))
+        return lines
+
+    #
+    # Moving filters ahead of transforms
+    #
+
+    def _can_move_before(self, spec, transform):
+        """Check whether a filter can safely run before a transform."""
+        if transform.get('filter') not in self.ROW_TRANSFORMS:
+            return False
+        if transform.get('filter') == 'clean_data' and transform.get('date'):
+            # dates depend on a scan of all rows
+            return False
+        if spec.get('filter') in self.COLUMN_FILTERS:
+            # a transform's queries might read columns that the filter removes
+            return not transform.get('queries')
+        elif spec.get('filter') in self.ROW_FILTERS:
+            read_patterns = self._query_patterns(spec)
+            written_patterns = self._transform_patterns(transform)
+            if read_patterns is None or written_patterns is None:
+                return False
+            for read_pattern in read_patterns:
+                for written_pattern in written_patterns:
+                    if RecipeOptimiser._may_overlap(read_pattern, written_pattern):
+                        return False
+            return True
+        else:
+            return False
+
+    @staticmethod
+    def _query_patterns(spec):
+        """@returns: the tag patterns that a row filter reads, or None if unknown"""
+        try:
+            queries = hxl.model.RowQuery.parse_list(spec.get('queries')) + hxl.model.RowQuery.parse_list(spec.get('mask'))
+        except Exception:
+            return None
+        for query in queries:
+            if query.formula is not None:
+                # a formula can read any column
+                return None
+        return [query.pattern for query in queries]
+
+    @staticmethod
+    def _transform_patterns(spec):
+        """@returns: the tag patterns that a transform might change, or None for all columns"""
+        try:
+            if spec.get('filter') == 'clean_data':
+                patterns = []
+                for property in ('whitespace', 'upper', 'lower', 'number', 'latlon',):
+                    patterns += hxl.model.TagPattern.parse_list(spec.get(property))
+                return patterns
+            elif spec.get('filter') == 'replace_data' and spec.get('pattern'):
+                return hxl.model.TagPattern.parse_list(spec.get('pattern'))
+        except Exception:
+            pass
+        return None # all columns (or we can't tell)
+
+    @staticmethod
+    def _may_overlap(pattern1, pattern2):
+        """Check whether there could be a column matching both tag patterns."""
+        if not (pattern1.is_wildcard() or pattern2.is_wildcard() or pattern1.tag == pattern2.tag):
+            return False
+        if pattern1.include_attributes & pattern2.exclude_attributes or pattern2.include_attributes & pattern1.exclude_attributes:
+            return False
+        return True
+
+    #
+    # Fusing adjacent steps
+    #
+
+    def _fuse(self, first, second):
+        """@returns: a list of steps to replace two adjacent ones, or None to leave them alone"""
+        type1, type2 = first.get('filter'), second.get('filter')
+        if type1 in self.CACHED_FILTERS and type2 == 'cache' and second.get('max_rows') is None:
+            self.rewrites.append('dropped cache after {}'.format(type1))
+            return [first]
+        elif type1 == 'cache' and type2 == 'cache' and first.get('max_rows') is None:
+            self.rewrites.append('dropped cache before cache')
+            return [second]
+        elif type1 == 'without_columns' and type2 == 'without_columns':
+            fused = {
+                'filter': 'without_columns',
+                'blacklist': self._pattern_strings(first.get('blacklist')) + self._pattern_strings(second.get('blacklist')),
+            }
+            if first.get('skip_untagged') or second.get('skip_untagged'):
+                fused['skip_untagged'] = True
+            self.rewrites.append('fused without_columns with without_columns')
+            return [fused]
+        elif type1 == 'with_columns' and type2 == 'with_columns':
+            whitelist = self._intersect_patterns(first.get('whitelist'), second.get('whitelist'))
+            if whitelist:
+                self.rewrites.append('fused with_columns with with_columns')
+                return [{'filter': 'with_columns', 'whitelist': whitelist}]
+        elif type1 == 'rename_columns' and type2 == 'rename_columns':
+            specs = self._fuse_renames(first.get('specs'), second.get('specs'))
+            if specs is not None:
+                self.rewrites.append('fused rename_columns with rename_columns')
+                return [{'filter': 'rename_columns', 'specs': specs}]
+        return None
+
+    @staticmethod
+    def _pattern_strings(patterns):
+        """@returns: a list of tag-pattern strings"""
+        if isinstance(patterns, six.string_types):
+            return [s.strip() for s in patterns.split(',')]
+        else:
+            return [str(pattern) for pattern in (patterns or [])]
+
+    @staticmethod
+    def _intersect_patterns(patterns1, patterns2):
+        """Make a whitelist that matches the columns matched by both whitelists.
+        @returns: a list of tag-pattern strings, or None if that's not possible
+        """
+        try:
+            patterns1 = hxl.model.TagPattern.parse_list(patterns1)
+            patterns2 = hxl.model.TagPattern.parse_list(patterns2)
+        except Exception:
+            return None
+        result = []
+        for pattern1 in patterns1:
+            for pattern2 in patterns2:
+                if pattern1.is_absolute or pattern2.is_absolute:
+                    return None
+                if not RecipeOptimiser._may_overlap(pattern1, pattern2):
+                    continue
+                s = pattern2.tag if pattern1.is_wildcard() else pattern1.tag
+                s += ''.join(['+' + attribute for attribute in sorted(pattern1.include_attributes | pattern2.include_attributes)])
+                s += ''.join(['-' + attribute for attribute in sorted(pattern1.exclude_attributes | pattern2.exclude_attributes)])
+                if s not in result:
+                    result.append(s)
+        return result or None # an empty whitelist would mean "all columns"
+
+    @staticmethod
+    def _fuse_renames(specs1, specs2):
+        """Combine two lists of rename specs, if no column renamed by the first could be renamed again by the second.
+        @returns: the combined list, or None if they can't be combined
+        """
+        if isinstance(specs1, six.string_types):
+            specs1 = [specs1]
+        if isinstance(specs2, six.string_types):
+            specs2 = [specs2]
+        try:
+            renames1 = [RenameFilter.parse_rename(spec) for spec in specs1]
+            renames2 = [RenameFilter.parse_rename(spec) for spec in specs2]
+        except Exception:
+            return None
+        for old_pattern, new_column, header in renames1:
+            for pattern2, column2, header2 in renames2:
+                if pattern2.match(new_column):
+                    norm = hxl.datatypes.normalise_string
+                    if not header2 or new_column.header is None or norm(header2) == norm(new_column.header):
+                        return None
+        return list(specs1) + list(specs2)
+
+
+def push_down(filter):
+    """Run a filter inside its SQLite-backed source, if possible.
+
+    If the filter reads directly from a L{hxl.io.SQLiteInput} (e.g. from
+    C{hxl.data("sqlite:///data.db?table=data")} or an earlier stage
+    that was already pushed down), and the filter class has a
+    C{_to_sqlite} method, replace the filter with a reader for an
+    equivalent SQL query. Currently supported for L{RowFilter},
+    L{ColumnFilter}, L{SortFilter}, and L{CountFilter}. Otherwise,
+    return the filter unchanged, to run in Python as usual.
+
+    @param filter: the filter to push down
+    @returns: a L{hxl.io.HXLReader} for the new query, or the original filter
+    """
+    source = getattr(filter, 'source', None)
+    if isinstance(source, hxl.io.HXLReader) and isinstance(source.input, hxl.io.SQLiteInput) and hasattr(filter, '_to_sqlite'):
+        input = filter._to_sqlite(source.input)
+        if input is not None:
+            logger.debug('Pushed %s down into SQLite', filter.__class__.__name__)
+            return hxl.io.HXLReader(input)
+    return filter
+
+
 def list_product(lists, head=[]):
     """Generate the cartesian product of a list of lists 
     The elements of the result will be all possible combinations of the elements of
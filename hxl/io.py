@@ -7,13 +7,18 @@ License: Public Domain
 Documentation: https://github.com/HXLStandard/libhxl-python/wiki
 """
 
-import abc, collections, csv, io, io_wrapper, json, jsonpath_ng.ext, logging, re, requests, shutil, six, sys, tempfile, xlrd, xml.sax
+import abc, array, asyncio, bz2, collections, concurrent.futures, contextvars, copy, csv, fnmatch, gzip, io, io_wrapper, itertools, json, jsonpath_ng.ext, logging, lzma, mmap, re, requests, shutil, six, sqlite3, struct, sys, tempfile, threading, time, xlrd, xml.etree.ElementTree, xml.sax, xml.sax.saxutils
 
 import hxl, hxl.filters
 import zipfile
 import os.path
 import urllib.parse
 
+try:
+    import pyarrow, pyarrow.ipc, pyarrow.parquet
+except ImportError: # optional dependency: pip install libhxl[arrow]
+    pyarrow = None
+
 logger = logging.getLogger(__name__)
 
 
@@ -25,7 +30,39 @@ logger = logging.getLogger(__name__)
 # At least this percentage of cells must parse as HXL hashtags
 FUZZY_HASHTAG_PERCENTAGE = 0.5
 
+# Workbooks (and other random-access input) up to this size are held in memory rather than copied to a temporary file
+WORKBOOK_SPOOL_SIZE = 0x1000000
+
+# Number of rows in each Arrow record batch
+ARROW_BATCH_SIZE = 10000
+
+# Number of rows in each SQLite insert transaction
+SQLITE_BATCH_SIZE = 10000
+
+# Default table name for SQLite storage
+SQLITE_DEFAULT_TABLE = 'data'
+
+# Default limits for concurrent loading with gather_data()
+ASYNC_CONCURRENCY = 10
+ASYNC_PER_HOST = 4
+
+# Maximum number of distinct strings in the shared-string table for write_xlsx()
+# (after that, new strings are written inline, so memory use stays bounded)
+XLSX_SHARED_STRING_LIMIT = 0x10000
+
+# Parallel ranged downloads (see RangedDownloadIOWrapper)
+RANGE_MIN_SIZE = 0x4000000 # don't bother for files smaller than this
+RANGE_CHUNK_SIZE = 0x800000 # size of each range request
+RANGE_RETRIES = 5 # attempts to resume an interrupted range
+
+# Input formats that have a character encoding
+TEXT_FORMATS = ['csv', 'json', 'ndjson']
+
+# Minimum number of seconds between progress callbacks (see IOStats)
+PROGRESS_INTERVAL = 1.0
+
 # Patterns for URL munging
+SQLITE_URL = r'^sqlite:///([^?]+)(?:\?(.*))?$'
 GOOGLE_DRIVE_URL = r'^https?://drive.google.com/open\?id=([0-9A-Za-z_-]+)$'
 GOOGLE_SHEETS_URL = r'^https?://[^/]+google.com/.*[^0-9A-Za-z_-]([0-9A-Za-z_-]{44})(?:.*gid=([0-9]+))?.*$'
 GOOGLE_FILE_URL = r'https?://drive.google.com/file/d/([0-9A-Za-z_-]+)/.*$'
@@ -49,6 +86,18 @@ JSON_SIGS = [
     b' {'
 ]
 
+NDJSON_MIME_TYPES = [
+    'application/x-ndjson',
+    'application/ndjson',
+    'application/jsonl',
+    'application/x-jsonlines',
+]
+
+NDJSON_FILE_EXTS = [
+    'ndjson',
+    'jsonl',
+]
+
 ZIP_FILE_EXTS = [
     'zip'
 ]
@@ -94,6 +143,106 @@ HTML5_SIGS = [
     b"\n<!D"
 ]
 
+# Fixed parts of a workbook written by write_xlsx() ({sheet_name} is a quoted XML attribute value)
+XLSX_PARTS = [
+    ('[Content_Types].xml', '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+     '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+     '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+     '<Default Extension="xml" ContentType="application/xml"/>'
+     '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+     '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+     '<Override PartName="/xl/sharedStrings.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/>'
+     '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+     '</Types>'),
+    ('_rels/.rels', '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+     '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+     '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+     '</Relationships>'),
+    ('xl/workbook.xml', '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+     '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+     '<sheets><sheet name={sheet_name} sheetId="1" r:id="rId1"/></sheets>'
+     '</workbook>'),
+    ('xl/_rels/workbook.xml.rels', '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+     '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+     '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+     '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings" Target="sharedStrings.xml"/>'
+     '<Relationship Id="rId3" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+     '</Relationships>'),
+    ('xl/styles.xml', '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+     '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+     '<fonts count="1"><font/></fonts>'
+     '<fills count="1"><fill/></fills>'
+     '<borders count="1"><border/></borders>'
+     '<cellStyleXfs count="1"><xf/></cellStyleXfs>'
+     '<cellXfs count="1"><xf/></cellXfs>'
+     '</styleSheet>'),
+]
+
+# Characters that aren't allowed in XML 1.0
+XLSX_ILLEGAL_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+
+HXLB_FILE_EXTS = [
+    'hxlb',
+]
+
+HXLB_SIGS = [
+    b"HXLB",
+]
+
+PARQUET_FILE_EXTS = [
+    'parquet',
+]
+
+PARQUET_SIGS = [
+    b"PAR1",
+]
+
+ARROW_FILE_EXTS = [
+    'arrow',
+    'feather',
+]
+
+ARROW_SIGS = [
+    b"ARROW1",
+]
+
+GZIP_MIME_TYPES = [
+    'application/gzip',
+    'application/x-gzip',
+]
+
+GZIP_FILE_EXTS = [
+    'gz',
+]
+
+GZIP_SIGS = [
+    b"\x1f\x8b",
+]
+
+BZIP2_MIME_TYPES = [
+    'application/x-bzip2',
+]
+
+BZIP2_FILE_EXTS = [
+    'bz2',
+]
+
+BZIP2_SIGS = [
+    b"BZh1", b"BZh2", b"BZh3", b"BZh4", b"BZh5", b"BZh6", b"BZh7", b"BZh8", b"BZh9",
+]
+
+XZ_MIME_TYPES = [
+    'application/x-xz',
+]
+
+XZ_FILE_EXTS = [
+    'xz',
+]
+
+XZ_SIGS = [
+    b"\xfd7zXZ\x00",
+]
+
 
 
 ########################################################################
@@ -101,7 +250,7 @@ HTML5_SIGS = [
 ########################################################################
 
 
-def data(data, allow_local=False, sheet_index=None, timeout=None, verify_ssl=True, http_headers=None, selector=None, encoding=None):
+def data(data, allow_local=False, sheet_index=None, timeout=None, verify_ssl=True, http_headers=None, selector=None, encoding=None, incremental_json=False, json_lookahead=None, zip_members=None, range_workers=None, progress=None, prefetch=None):
     """
     Convenience method for reading a HXL dataset.
     If passed an existing Dataset, simply returns it.
@@ -113,6 +262,12 @@ def data(data, allow_local=False, sheet_index=None, timeout=None, verify_ssl=Tru
     @param http_headers: optional dict of HTTP headers to add to a request.
     @param selector: selector property for a JSON file (will later also cover tabs, etc.)
     @param encoding: force a character encoding, regardless of HTTP info etc
+    @param incremental_json: if True, decode JSON input one row at a time instead of loading the whole document (default: False)
+    @param json_lookahead: number of JSON objects to scan for headers in incremental mode (see L{JSONInput})
+    @param zip_members: glob pattern for CSV members of a zip archive to read as a single appended dataset (default: None, to read only the first CSV member)
+    @param range_workers: if more than 1, download large remote files in byte ranges over this many parallel connections (see L{RangedDownloadIOWrapper})
+    @param progress: an optional function to call with the input's L{IOStats} as reading progresses (at most every L{PROGRESS_INTERVAL} seconds, and once at the end)
+    @param prefetch: if set, read and parse up to this many batches of rows ahead in a background thread (see L{hxl.filters.PrefetchFilter}, which passes on the reader's C{input}, C{stats} and C{is_cached}); ignored for shared sources inside a L{source_registry}
     """
 
     logger.debug("HXL data from %s", str(data))
@@ -125,8 +280,26 @@ def data(data, allow_local=False, sheet_index=None, timeout=None, verify_ssl=Tru
         """If it's a JSON-type spec, try parsing it."""
         return hxl.io.from_spec(data)
 
+    elif isinstance(data, six.string_types) and SourceRegistry.current() is not None:
+        # a URL or filename inside a registry scope: open it once and share it
+        return SourceRegistry.current().data(
+            data,
+            allow_local=allow_local,
+            sheet_index=sheet_index,
+            timeout=timeout,
+            verify_ssl=verify_ssl,
+            http_headers=http_headers,
+            selector=selector,
+            encoding=encoding,
+            incremental_json=incremental_json,
+            json_lookahead=json_lookahead,
+            zip_members=zip_members,
+            range_workers=range_workers,
+            progress=progress
+        )
+
     else:
-        return HXLReader(make_input(
+        source = HXLReader(make_input(
             data,
             allow_local=allow_local,
             sheet_index=sheet_index,
@@ -134,8 +307,117 @@ def data(data, allow_local=False, sheet_index=None, timeout=None, verify_ssl=Tru
             verify_ssl=verify_ssl,
             http_headers=http_headers,
             selector=selector,
-            encoding=encoding
+            encoding=encoding,
+            incremental_json=incremental_json,
+            json_lookahead=json_lookahead,
+            zip_members=zip_members,
+            range_workers=range_workers,
+            progress=progress
         ))
+        if prefetch:
+            source = source.prefetch(batches=prefetch)
+        return source
+
+
+async def data_async(data, cache=False, executor=None, **kwargs):
+    """Asynchronous version of L{data}.
+
+    Opening the source and finding the hashtag row (the parts that
+    wait on the network) run in a worker thread, so many sources can
+    load at once from an asyncio event loop. The result is an ordinary
+    L{hxl.model.Dataset}; for streaming input, iterating through the
+    data rows afterwards still reads from the network as usual, unless
+    C{cache} is True. A L{source_registry} that's active when this
+    is called applies to the worker thread as well.
+
+    Example::
+
+      source = await hxl.data_async(url)
+
+    @param data: anything accepted by L{data}
+    @param cache: if True, also read all of the rows in the worker thread, and return a cached dataset (default: False)
+    @param executor: the C{concurrent.futures.Executor} to use (default: the event loop's default executor)
+    @param kwargs: other keyword arguments for L{data} (e.g. C{allow_local}, C{timeout}, C{http_headers})
+    @returns: a L{hxl.model.Dataset}, with its columns already parsed
+    @see: L{gather_data}
+    """
+
+    def load():
+        source = hxl.io.data(data, **kwargs)
+        if cache:
+            source = source.cache()
+            source.values # read everything now
+        else:
+            source.columns # find the hashtag row now
+        return source
+
+    # run in a copy of this context, so that an active L{source_registry} applies in the worker too
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(executor, context.run, load)
+
+
+async def gather_data(sources, concurrency=ASYNC_CONCURRENCY, per_host=ASYNC_PER_HOST, cache=False, return_exceptions=False, **kwargs):
+    """Load many HXL sources concurrently.
+
+    Runs L{data_async} for each source, with at most C{concurrency}
+    sources loading at once overall, and at most C{per_host} at once
+    from any single web host. From synchronous code, use
+    C{asyncio.run(hxl.gather_data(urls))}.
+
+    @param sources: a list of anything accepted by L{data} (usually URLs)
+    @param concurrency: maximum number of sources to load at the same time
+    @param per_host: maximum number of sources to load at the same time from the same host (or None for no per-host limit)
+    @param cache: if True, read all rows during loading (see L{data_async})
+    @param return_exceptions: if True, return exceptions in the result list instead of raising the first one
+    @param kwargs: other keyword arguments for L{data}
+    @returns: a list of L{hxl.model.Dataset} objects, in the same order as C{sources}
+    """
+    sources = list(sources)
+    host_limits = {}
+
+    def get_host(source):
+        if isinstance(source, six.string_types) and re.match(r'^(?:https?|s?ftp)://', source):
+            return urllib.parse.urlparse(source).netloc.lower()
+        return None
+
+    async def load(source, executor, limit):
+        host = get_host(source)
+        if per_host and host is not None:
+            host_limit = host_limits.setdefault(host, asyncio.Semaphore(per_host))
+        else:
+            host_limit = None
+        if host_limit is not None:
+            await host_limit.acquire()
+        try:
+            async with limit:
+                return await data_async(source, cache=cache, executor=executor, **kwargs)
+        finally:
+            if host_limit is not None:
+                host_limit.release()
+
+    limit = asyncio.Semaphore(concurrency)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return await asyncio.gather(
+            *[load(source, executor, limit) for source in sources],
+            return_exceptions=return_exceptions
+        )
+
+
+def source_registry(shared=None):
+    """Get a context manager for sharing sources (see L{SourceRegistry}).
+    Joins the active registry, if there is one; otherwise, starts a new one.
+    Usage::
+
+      with hxl.io.source_registry():
+          source = hxl.data(url).merge_data(url, keys='#adm1+code', tags='#adm1+name')
+
+    @param shared: for a new registry, share only these sources (see L{SourceRegistry.__init__})
+    @returns: a L{SourceRegistry}
+    """
+    registry = SourceRegistry.current()
+    if registry is None:
+        registry = SourceRegistry(shared)
+    return registry
 
     
 def tagger(data, specs, default_tag=None, match_all=False, allow_local=False, sheet_index=None, timeout=None, verify_ssl=True, http_headers=None, encoding=None):
@@ -171,8 +453,360 @@ def write_json(output, source, show_headers=True, show_tags=True, use_objects=Fa
         output.write(line)
 
 
+def write_xlsx(output, source, show_headers=True, show_tags=True, sheet_name='Sheet1'):
+    """Serialize a dataset to an Excel XLSX workbook, streaming.
+
+    The worksheet XML is written into the zip archive row by row, so
+    memory use doesn't grow with the number of rows, and the output
+    stream doesn't need to be seekable (e.g. standard output works).
+    The first L{XLSX_SHARED_STRING_LIMIT} distinct strings go into the
+    shared-string table (which Excel prefers, and which keeps
+    repetitive data small); any strings after that are written inline.
+    Numbers (Python int and float values, e.g. from another workbook)
+    become numeric cells; all other values are written as text,
+    exactly as they appear in CSV output.
+
+    @param output: a binary output stream
+    @param source: the HXL dataset to serialize
+    @param show_headers: if True (default), include the text-header row
+    @param show_tags: if True (default), include the hashtag row
+    @param sheet_name: the name of the worksheet
+    """
+
+    shared_strings = {}
+
+    def column_letters(index):
+        letters = ''
+        index += 1
+        while index > 0:
+            index, remainder = divmod(index - 1, 26)
+            letters = chr(65 + remainder) + letters
+        return letters
+
+    def make_cell(ref, value):
+        if isinstance(value, (int, float,)) and not isinstance(value, bool) and value == value and abs(value) != float('inf'):
+            return '<c r="{}"><v>{}</v></c>'.format(ref, repr(value))
+        value = XLSX_ILLEGAL_CHARS.sub('', '' if value is None else str(value))
+        if value == '':
+            return '<c r="{}"/>'.format(ref) # keep the row's width
+        index = shared_strings.get(value)
+        if index is None and len(shared_strings) < XLSX_SHARED_STRING_LIMIT:
+            index = shared_strings[value] = len(shared_strings)
+        if index is not None:
+            return '<c r="{}" t="s"><v>{}</v></c>'.format(ref, index)
+        else:
+            return '<c r="{}" t="inlineStr"><is>{}</is></c>'.format(ref, make_text(value))
+
+    def make_text(value):
+        if value != value.strip():
+            return '<t xml:space="preserve">{}</t>'.format(xml.sax.saxutils.escape(value))
+        return '<t>{}</t>'.format(xml.sax.saxutils.escape(value))
+
+    with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, content in XLSX_PARTS:
+            archive.writestr(name, content.format(sheet_name=xml.sax.saxutils.quoteattr(sheet_name[:31])))
+
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>')
+            buffer = []
+            for row_number, values in enumerate(source.gen_raw(show_headers, show_tags), start=1):
+                buffer.append('<row r="{}">'.format(row_number))
+                for column_number, value in enumerate(values):
+                    buffer.append(make_cell(column_letters(column_number) + str(row_number), value))
+                buffer.append('</row>')
+                if len(buffer) > 0x1000:
+                    sheet.write(''.join(buffer).encode('utf-8'))
+                    buffer = []
+            buffer.append('</sheetData></worksheet>')
+            sheet.write(''.join(buffer).encode('utf-8'))
+
+        with archive.open('xl/sharedStrings.xml', 'w', force_zip64=True) as strings:
+            strings.write('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" uniqueCount="{}">'.format(len(shared_strings)).encode('utf-8'))
+            # dicts keep insertion order, which is the index order
+            buffer = []
+            for value in shared_strings:
+                buffer.append('<si>{}</si>'.format(make_text(value)))
+                if len(buffer) > 0x1000:
+                    strings.write(''.join(buffer).encode('utf-8'))
+                    buffer = []
+            buffer.append('</sst>')
+            strings.write(''.join(buffer).encode('utf-8'))
+
+
+def write_hxlb(output, source):
+    """Serialize a dataset to a HXLB binary snapshot.
+
+    The snapshot stores the text headers, hashtags, and one
+    dictionary-encoded block per column: the distinct values (with
+    their types) followed by a packed array of 1-, 2- or 4-byte codes,
+    one per row. L{hxl.data} reads it back with L{HXLBInput}, which
+    memory-maps the file and decodes each column only when it's first
+    needed. Rows of uneven length are preserved, so CSV output from the
+    snapshot is identical to CSV output from the original.
+
+    The columns' codes are accumulated in memory before writing (a few
+    bytes per cell), so this is not a streaming writer.
+
+    @param output: a binary output stream
+    @param source: the HXL dataset to serialize
+    """
+    columns = source.columns
+    dictionaries = [] # value -> code for each column
+    column_values = [] # distinct values for each column, in code order
+    column_codes = [] # code for every row in each column
+    row_count = 0
+
+    def add_column():
+        dictionaries.append({})
+        column_values.append([])
+        column_codes.append(array.array('I', [HXLBInput.ABSENT_CODE]) * row_count)
+
+    for i in range(len(columns)):
+        add_column()
+
+    for row in source:
+        values = row.values
+        while len(values) > len(column_codes):
+            # extra untagged cells past the last column
+            add_column()
+        for i, codes in enumerate(column_codes):
+            if i < len(values):
+                value = values[i]
+                try:
+                    key = (type(value), value,)
+                    code = dictionaries[i].get(key)
+                except TypeError:
+                    # unhashable, so store as a string
+                    value = str(value)
+                    key = (str, value,)
+                    code = dictionaries[i].get(key)
+                if code is None:
+                    column_values[i].append(value)
+                    code = dictionaries[i][key] = len(column_values[i])
+                codes.append(code)
+            else:
+                codes.append(HXLBInput.ABSENT_CODE)
+        row_count += 1
+
+    # serialise each column's dictionary and (narrowest possible) codes
+    blocks = []
+    column_specs = []
+    offset = 0
+    for values, codes in zip(column_values, column_codes):
+        dictionary_bytes = json.dumps(values, default=str).encode('utf-8')
+        for code_type in ('B', 'H', 'I',):
+            if len(values) < 1 << (8 * array.array(code_type).itemsize):
+                break
+        codes = array.array(code_type, codes)
+        if sys.byteorder != 'little':
+            codes.byteswap()
+        code_bytes = codes.tobytes()
+        column_specs.append({
+            'dictionary': [offset, len(dictionary_bytes)],
+            'codes': [offset + HXLBInput._align(len(dictionary_bytes)), len(code_bytes)],
+            'type': code_type,
+        })
+        blocks += [dictionary_bytes, code_bytes]
+        offset += HXLBInput._align(len(dictionary_bytes)) + HXLBInput._align(len(code_bytes))
+
+    metadata = json.dumps({
+        'headers': [column.header for column in columns],
+        'tags': [column.display_tag for column in columns],
+        'rows': row_count,
+        'columns': column_specs,
+    }).encode('utf-8')
+
+    output.write(HXLBInput.HEADER.pack(HXLBInput.MAGIC, HXLBInput.VERSION, 0, len(metadata)))
+    output.write(metadata)
+    output.write(b'\0' * (HXLBInput._align(HXLBInput.HEADER.size + len(metadata)) - HXLBInput.HEADER.size - len(metadata)))
+    for block in blocks:
+        output.write(block)
+        output.write(b'\0' * (HXLBInput._align(len(block)) - len(block)))
+
+
+def to_arrow(source, batch_size=ARROW_BATCH_SIZE):
+    """Convert a dataset to an Arrow record-batch stream.
+
+    Each HXL column becomes a string field named for its text header,
+    with the hashtag and attributes (and the original header) stored in
+    the field metadata under C{hxl:tag} and C{hxl:header}. Rows are
+    converted lazily, C{batch_size} at a time, so memory use stays
+    bounded; call C{read_all()} on the result to get a C{pyarrow.Table}.
+
+    Values stay strings, as in HXL (e.g. "1" rather than a number).
+    The schema comes from the columns before the first row is read,
+    so cells past the last column (which have no header or hashtag)
+    are dropped, with a warning in the log.
+
+    Requires the optional C{pyarrow} package.
+
+    @param source: the HXL dataset to convert
+    @param batch_size: the number of rows in each record batch
+    @returns: a C{pyarrow.RecordBatchReader}
+    """
+    require_pyarrow()
+    schema = make_arrow_schema(source.columns)
+    return pyarrow.RecordBatchReader.from_batches(schema, gen_arrow_batches(source, schema, batch_size))
+
+
+def write_parquet(output, source, batch_size=ARROW_BATCH_SIZE):
+    """Serialize a dataset to Parquet, one record batch at a time.
+
+    As for L{to_arrow}, all values are strings, and cells past the
+    last column are dropped (with a warning in the log).
+
+    Requires the optional C{pyarrow} package.
+
+    @param output: a filename or binary output stream
+    @param source: the HXL dataset to serialize
+    @param batch_size: the number of rows in each record batch (and Parquet row group)
+    @see: L{to_arrow}
+    """
+    require_pyarrow()
+    schema = make_arrow_schema(source.columns)
+    with pyarrow.parquet.ParquetWriter(output, schema) as writer:
+        for batch in gen_arrow_batches(source, schema, batch_size):
+            writer.write_batch(batch, row_group_size=batch_size)
+
+
+def make_arrow_schema(columns):
+    """Make an Arrow schema for a list of HXL columns.
+    @param columns: a list of L{hxl.model.Column} objects
+    @returns: a C{pyarrow.Schema} with one string field per column
+    """
+    require_pyarrow()
+    return pyarrow.schema([
+        pyarrow.field(column.header or column.display_tag or '', pyarrow.string(), metadata={
+            'hxl:tag': column.display_tag or '',
+            'hxl:header': column.header or '',
+        }) for column in columns
+    ])
+
+
+def gen_arrow_batches(source, schema, batch_size=ARROW_BATCH_SIZE):
+    """Generate Arrow record batches from a dataset.
+    Short rows are padded with nulls, and cells past the last column are dropped
+    (logging a warning at the end with the number of rows affected).
+    @param source: the HXL dataset
+    @param schema: the Arrow schema (see L{make_arrow_schema})
+    @param batch_size: the maximum number of rows in each batch
+    """
+    width = len(schema)
+    rows = (row for row in source)
+    long_rows = 0
+    while True:
+        values_list = [row.values for row in itertools.islice(rows, batch_size)]
+        if not values_list:
+            break
+        long_rows += sum([1 for values in values_list if len(values) > width and any(values[width:])])
+        arrays = []
+        for i in range(width):
+            arrays.append(pyarrow.array([
+                (None if i >= len(values) or values[i] is None else str(values[i])) for values in values_list
+            ], type=pyarrow.string()))
+        yield pyarrow.RecordBatch.from_arrays(arrays, schema=schema)
+        if len(values_list) < batch_size:
+            break
+    if long_rows:
+        logger.warning("Dropped values past the last column in %d row(s) for Arrow output", long_rows)
+
+
+def require_pyarrow():
+    """Raise an exception if the optional pyarrow package isn't installed."""
+    if pyarrow is None:
+        raise HXLIOException("Arrow and Parquet support requires the pyarrow package (pip install libhxl[arrow])")
+
+
+def write_sqlite(filename, source, table=SQLITE_DEFAULT_TABLE, batch_size=SQLITE_BATCH_SIZE):
+    """Store a dataset in a SQLite database table.
+
+    Any existing table with the same name is replaced. Values go into
+    columns C{c0}, C{c1}, etc., with a C{_row} primary key preserving
+    the original order, and the text headers and hashtags go into the
+    C{hxl_columns} metadata table, so that C{hxl.data("sqlite:///I{filename}?table=I{table}")}
+    can read the dataset back. Rows are inserted with C{executemany},
+    in one transaction for each C{batch_size} rows.
+
+    @param filename: the SQLite database file (created if it doesn't exist)
+    @param source: the HXL dataset to store
+    @param table: the name of the table to create
+    @param batch_size: the number of rows to insert in each transaction
+    """
+    columns = source.columns
+    width = len(columns)
+    quoted_table = SQLiteInput.quote(table)
+
+    def make_insert():
+        return 'INSERT INTO {} VALUES ({})'.format(quoted_table, ', '.join(['?'] * (width + 1)))
+
+    def fix_value(value):
+        if value is None or isinstance(value, (str, int, float,)):
+            return value
+        else:
+            return str(value)
+
+    connection = sqlite3.connect(filename)
+    try:
+        with connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS hxl_columns (table_name TEXT, column_number INTEGER, header TEXT, tag TEXT)')
+            connection.execute('DELETE FROM hxl_columns WHERE table_name=?', (table,))
+            connection.execute('DROP TABLE IF EXISTS {}'.format(quoted_table))
+            connection.execute('CREATE TABLE {} (_row INTEGER PRIMARY KEY{})'.format(
+                quoted_table,
+                ''.join([', c{}'.format(i) for i in range(width)])
+            ))
+            connection.executemany('INSERT INTO hxl_columns VALUES (?, ?, ?, ?)', [
+                (table, i, column.header or '', column.display_tag or '',) for i, column in enumerate(columns)
+            ])
+
+        insert = make_insert()
+        rows = (row for row in source)
+        row_number = 0
+        while True:
+            batch = []
+            for row in itertools.islice(rows, batch_size):
+                values = [fix_value(value) for value in row.values]
+                if len(values) > width:
+                    # extra untagged cells: widen the table first
+                    if batch:
+                        with connection:
+                            connection.executemany(insert, batch)
+                        batch = []
+                    with connection:
+                        for i in range(width, len(values)):
+                            connection.execute('ALTER TABLE {} ADD COLUMN c{}'.format(quoted_table, i))
+                    width = len(values)
+                    insert = make_insert()
+                batch.append([row_number] + values + [None] * (width - len(values)))
+                row_number += 1
+            if not batch:
+                break
+            with connection:
+                connection.executemany(insert, batch)
+    finally:
+        connection.close()
+
+
 def munge_url(url, verify_ssl=True, http_headers=None):
-    """Munge a URL to get at underlying data for well-known types."""
+    """Munge a URL to get at underlying data for well-known types.
+
+    Resolving some URLs (CKAN datasets and resources, or Google Drive
+    "open" links) takes an extra HTTP request, so the results are
+    cached in L{URL_CACHE} for L{URL_CACHE_TTL} seconds. Concurrent
+    callers resolving the same URL share a single lookup. Failed
+    lookups are not cached.
+
+    @param url: the URL to munge
+    @param verify_ssl: if False, don't verify SSL certificates for API lookups
+    @param http_headers: optional dict of HTTP headers to send with API lookups
+    @returns: the direct-download URL (or the original URL, if no changes are needed)
+    """
+    key = (url, verify_ssl, tuple(sorted(http_headers.items())) if http_headers else None,)
+    return URL_CACHE.get(key, lambda: _munge_url(url, verify_ssl, http_headers))
+
+
+def _munge_url(url, verify_ssl=True, http_headers=None):
+    """Uncached version of L{munge_url}."""
 
     #
     # Stage 1: unpack indirect links
@@ -260,7 +894,7 @@ def munge_url(url, verify_ssl=True, http_headers=None):
     return url
 
 
-def make_input(raw_source, allow_local=False, sheet_index=None, timeout=None, verify_ssl=True, http_headers=None, selector=None, encoding=None):
+def make_input(raw_source, allow_local=False, sheet_index=None, timeout=None, verify_ssl=True, http_headers=None, selector=None, encoding=None, incremental_json=False, json_lookahead=None, zip_members=None, range_workers=None, progress=None):
     """Figure out what kind of input to create.
 
     Can detect a URL or filename, an input stream, or an array.
@@ -275,16 +909,79 @@ def make_input(raw_source, allow_local=False, sheet_index=None, timeout=None, ve
     @param http_headers: an optional dict of HTTP headers to send with a request.
     @param selector: a property to select the data in a JSON record (may later extend to spreadsheet tabs).
     @param encoding: specify a character encoding
+    @param incremental_json: if True, decode JSON input one row at a time instead of loading the whole document (default: False)
+    @param json_lookahead: number of JSON objects to scan for headers in incremental mode (see L{JSONInput})
+    @param zip_members: glob pattern for CSV members of a zip archive to read as a single appended dataset (default: None, to read only the first CSV member)
+    @param range_workers: if more than 1, download large remote files in byte ranges over this many parallel connections (see L{RangedDownloadIOWrapper})
+    @param progress: an optional function to call with the input's L{IOStats} as reading progresses (at most every L{PROGRESS_INTERVAL} seconds, and once at the end)
     @return: an object belonging to a subclass of AbstractInput, returning rows of raw data.
     """
 
-    def make_tempfile(input):
+    if isinstance(raw_source, AbstractInput):
+        # already an input source: no op
+        return raw_source
+
+    stats = IOStats(progress=progress)
+    start = time.perf_counter()
+    input = _make_input(
+        raw_source,
+        stats,
+        allow_local=allow_local,
+        sheet_index=sheet_index,
+        timeout=timeout,
+        verify_ssl=verify_ssl,
+        http_headers=http_headers,
+        selector=selector,
+        encoding=encoding,
+        incremental_json=incremental_json,
+        json_lookahead=json_lookahead,
+        zip_members=zip_members,
+        range_workers=range_workers
+    )
+    stats.read_time += time.perf_counter() - start # e.g. workbooks, which load up front
+    stats.format = input.FORMAT
+    if stats.format not in TEXT_FORMATS:
+        stats.encoding = None
+    input.stats = stats
+    return input
+
+
+def _make_input(raw_source, stats, allow_local=False, sheet_index=None, timeout=None, verify_ssl=True, http_headers=None, selector=None, encoding=None, incremental_json=False, json_lookahead=None, zip_members=None, range_workers=None):
+    """Do the work for L{make_input}, counting raw bytes in C{stats} (an L{IOStats} object)."""
+
+    def make_seekable_file(input):
+        # a local file can be opened again directly by name (unless we're decompressing it)
+        name = getattr(input, 'name', None)
+        if isinstance(name, six.string_types) and os.path.isfile(name) and not is_compressed:
+            input.close()
+            stats.bytes_read = os.path.getsize(name) # the whole file will be read (or mapped) by name
+            return name
+
+        # keep small workbooks in memory
+        data = input.read(WORKBOOK_SPOOL_SIZE + 1)
+        if len(data) <= WORKBOOK_SPOOL_SIZE:
+            input.close()
+            return io.BytesIO(data)
+
+        # spill large ones to disk
         tmpfile = tempfile.NamedTemporaryFile();
+        tmpfile.write(data)
+        del data
         shutil.copyfileobj(input, tmpfile)
         tmpfile.seek(0)
         input.close()
         return tmpfile # have to return the object, so it doesn't get garbage collected and delete the file
 
+    def inner_file_ext(raw_source):
+        # e.g. "csv" for "data.csv.gz"
+        if isinstance(raw_source, six.string_types):
+            # strip the outer extension (e.g. ".gz") first
+            path = os.path.splitext(urllib.parse.urlparse(raw_source).path)[0]
+            ext = os.path.splitext(path)[1][1:].lower()
+            if ext:
+                return ext
+        return None
+
     def wrap_stream(stream):
         if hasattr(stream, 'peek'):
             # already buffered
@@ -299,15 +996,25 @@ def make_input(raw_source, allow_local=False, sheet_index=None, timeout=None, ve
                 return True
         return False
 
-    if isinstance(raw_source, AbstractInput):
-        # already an input source: no op
-        return raw_source
+    def instrument_stream(stream):
+        name = getattr(stream, 'name', None)
+        if isinstance(getattr(stream, 'raw', None), io.FileIO) and isinstance(name, six.string_types) and os.path.isfile(name):
+            # an open local file: leave it alone, so that it can still be reopened by name (no byte counts)
+            stats.total_bytes = os.path.getsize(name)
+            return stream
+        else:
+            return InstrumentedIOWrapper(stream, stats)
 
-    elif hasattr(raw_source, '__len__') and (not isinstance(raw_source, six.string_types)):
+    if hasattr(raw_source, '__len__') and (not isinstance(raw_source, six.string_types)):
         # it's an array
         logger.debug('Making input from an array')
         return ArrayInput(raw_source)
 
+    elif isinstance(raw_source, six.string_types) and re.match(SQLITE_URL, raw_source):
+        # SQLite database (local only)
+        logger.debug('Making input from SQLite URL %s', raw_source)
+        return SQLiteInput.from_url(raw_source, allow_local=allow_local)
+
     else:
         mime_type = None
         file_ext = None
@@ -315,7 +1022,7 @@ def make_input(raw_source, allow_local=False, sheet_index=None, timeout=None, ve
         if hasattr(raw_source, 'read'):
             # it's an input stream
             logger.debug('Making input from a stream')
-            input = wrap_stream(raw_source)
+            input = wrap_stream(instrument_stream(raw_source))
         else:
             # assume a URL or filename
             logger.debug('Opening source %s as a URL or file', raw_source)
@@ -324,8 +1031,13 @@ def make_input(raw_source, allow_local=False, sheet_index=None, timeout=None, ve
                 allow_local=allow_local,
                 timeout=timeout,
                 verify_ssl=verify_ssl,
-                http_headers=http_headers
+                http_headers=http_headers,
+                range_workers=range_workers
             )
+            raw = getattr(input, 'raw', input)
+            if hasattr(raw, 'stats'):
+                raw.stats = stats
+                stats.total_bytes = raw.size
             input = wrap_stream(input)
             if encoding is None: # if no encoding was provided, use the inferred one
                 if specified_encoding:
@@ -333,6 +1045,43 @@ def make_input(raw_source, allow_local=False, sheet_index=None, timeout=None, ve
 
         if not encoding: # if we still have no character encoding, default to UTF-8
             encoding = "utf-8"
+        stats.encoding = encoding
+
+        # unwrap compressed input first (the format inside still needs detecting)
+        def is_compression(sigs, mime_types, file_exts):
+            # the signature decides (an HTTP client may already have decoded a .gz file);
+            # the MIME type or extension only when there are too few bytes to tell
+            if len(sig) < 6:
+                return (mime_type in mime_types) or (file_ext in file_exts)
+            else:
+                return match_sigs(sig, sigs)
+
+        is_compressed = True
+        sig = input.peek(6)[:6]
+        if is_compression(GZIP_SIGS, GZIP_MIME_TYPES, GZIP_FILE_EXTS):
+            logger.debug('Decompressing gzip input')
+            stats.compression = 'gzip'
+            input = gzip.GzipFile(fileobj=input, mode='rb')
+        elif is_compression(BZIP2_SIGS, BZIP2_MIME_TYPES, BZIP2_FILE_EXTS):
+            logger.debug('Decompressing bzip2 input')
+            stats.compression = 'bzip2'
+            input = bz2.BZ2File(input, mode='rb')
+        elif is_compression(XZ_SIGS, XZ_MIME_TYPES, XZ_FILE_EXTS):
+            logger.debug('Decompressing xz input')
+            stats.compression = 'xz'
+            input = lzma.LZMAFile(input, mode='rb')
+        else:
+            is_compressed = False
+            if (mime_type in GZIP_MIME_TYPES + BZIP2_MIME_TYPES + XZ_MIME_TYPES) or (file_ext in GZIP_FILE_EXTS + BZIP2_FILE_EXTS + XZ_FILE_EXTS):
+                # labelled as compressed, but already decoded
+                logger.debug('Input labelled as compressed is not compressed')
+                mime_type = None
+                file_ext = inner_file_ext(raw_source)
+        if is_compressed:
+            # decompress on the fly, with enough buffer for format sniffing
+            input = io.BufferedReader(input, buffer_size=0x10000)
+            mime_type = None
+            file_ext = inner_file_ext(raw_source)
 
         sig = input.peek(4)[:4]
 
@@ -341,17 +1090,28 @@ def make_input(raw_source, allow_local=False, sheet_index=None, timeout=None, ve
                 "Received HTML5 markup.\nCheck that the resource (e.g. a Google Sheet) is publicly readable.",
                 {
                     'input': input,
-                    'source': raw_source,
-                    'munged': munge_url(raw_source, http_headers=http_headers) if str(raw_source).startswith('http') else None
+                    'source': raw_source
                 }
             ))
 
+        if (file_ext in HXLB_FILE_EXTS) or match_sigs(sig, HXLB_SIGS): # binary snapshot
+            logger.debug('Making input from a HXLB snapshot')
+            return HXLBInput(make_seekable_file(input))
+
+        if (file_ext in PARQUET_FILE_EXTS) or match_sigs(sig, PARQUET_SIGS): # Parquet file
+            logger.debug('Making input from a Parquet file')
+            return ParquetInput(make_seekable_file(input))
+
+        if (file_ext in ARROW_FILE_EXTS) or match_sigs(input.peek(6)[:6], ARROW_SIGS): # Arrow IPC file
+            logger.debug('Making input from an Arrow IPC file')
+            return ArrowInput(make_seekable_file(input))
+
         if match_sigs(sig, XLS_SIGS): # legacy XLS Excel workbook
-            tmpfile = make_tempfile(input)
+            tmpfile = make_seekable_file(input)
             return XLSInput(tmpfile, sheet_index=sheet_index)
 
         if match_sigs(sig, XLSX_SIGS): # superset of ZIP_SIGS - could be zipfile or XLSX Excel workbook
-            tmpfile = make_tempfile(input)
+            tmpfile = make_seekable_file(input)
 
             try:
                 logger.debug('Trying input from an Excel file')
@@ -359,22 +1119,33 @@ def make_input(raw_source, allow_local=False, sheet_index=None, timeout=None, ve
             except:
                 if match_sigs(sig, ZIP_SIGS): # more-restrictive
                     zf = zipfile.ZipFile(tmpfile, "r")
-                    for name in zf.namelist():
-                        if os.path.splitext(name)[1].lower()==".csv":
-                            return CSVInput(wrap_stream(io.BytesIO(zf.read(name))), encoding=encoding)
+                    if zip_members is None:
+                        # first CSV member only
+                        names = [name for name in zf.namelist() if os.path.splitext(name)[1].lower()==".csv"][:1]
+                    else:
+                        names = [name for name in zf.namelist() if fnmatch.fnmatch(name, zip_members)]
+                    stats.compression = 'zip'
+                    if len(names) == 1:
+                        return CSVInput(ZipCSVInput.open_member(zf, names[0]), encoding=encoding)
+                    elif len(names) > 1:
+                        return ZipCSVInput(zf, names, encoding=encoding)
 
             raise HXLIOException("Cannot find CSV file or Excel content in zip archive")
 
+        elif (mime_type in NDJSON_MIME_TYPES) or (file_ext in NDJSON_FILE_EXTS) or (match_sigs(sig, JSON_SIGS) and NDJSONInput.detect(input, encoding)):
+            logger.debug('Trying to make input as JSON Lines')
+            return NDJSONInput(input, encoding=encoding, lookahead=json_lookahead)
+
         elif (mime_type in JSON_MIME_TYPES) or (file_ext in JSON_FILE_EXTS) or match_sigs(sig, JSON_SIGS):
             logger.debug('Trying to make input as JSON')
-            return JSONInput(input, selector=selector, encoding=encoding)
+            return JSONInput(input, selector=selector, encoding=encoding, incremental=incremental_json, lookahead=json_lookahead)
 
         # fall back to CSV if all else fails
         logger.debug('Making input from CSV')
         return CSVInput(input, encoding=encoding)
 
 
-def open_url_or_file(url_or_filename, allow_local=False, timeout=None, verify_ssl=True, http_headers=None):
+def open_url_or_file(url_or_filename, allow_local=False, timeout=None, verify_ssl=True, http_headers=None, range_workers=None):
     """Try opening a local or remote resource.
     Allows only HTTP(S) and (S)FTP URLs.
     @param url_or_filename: the string to try openining.
@@ -382,6 +1153,7 @@ def open_url_or_file(url_or_filename, allow_local=False, timeout=None, verify_ss
     @param timeout: if supplied, time out an HTTP(S) request after the specified number of seconds with no data received (default: None)
     @param verify_ssl: if True, then fail on an SSL error.
     @param http_headers: dictionary of headers to add to the request.
+    @param range_workers: if more than 1, and the server accepts byte ranges for a file of at least L{RANGE_MIN_SIZE} bytes with a strong ETag or a Last-Modified date, download ranges in parallel over this many connections (see L{RangedDownloadIOWrapper})
     @return: an io stream.
     """
     mime_type = None
@@ -389,13 +1161,11 @@ def open_url_or_file(url_or_filename, allow_local=False, timeout=None, verify_ss
     encoding = None
 
     # Try for file extension
-    result = re.search(r'\.([A-Za-z0-9]{1,5})$', url_or_filename)
-    if result:
-        file_ext = result.group(1).lower()
+    file_ext = os.path.splitext(url_or_filename)[1][1:].lower() or None
     
     if re.match(r'^(?:https?|s?ftp)://', url_or_filename):
         # It looks like a URL
-        file_ext = os.path.splitext(urllib.parse.urlparse(url_or_filename).path)[1]
+        file_ext = os.path.splitext(urllib.parse.urlparse(url_or_filename).path)[1][1:].lower()
         try:
             url = munge_url(url_or_filename, verify_ssl, http_headers=http_headers)
             response = requests.get(
@@ -422,12 +1192,29 @@ def open_url_or_file(url_or_filename, allow_local=False, timeout=None, verify_ss
             else:
                 mime_type = content_type.lower()
 
-        return (RequestResponseIOWrapper(response), mime_type, file_ext, encoding)
+        length = RangedDownloadIOWrapper.get_range_length(response)
+        if_range = RangedDownloadIOWrapper.get_if_range(response)
+        if range_workers and range_workers > 1 and length is not None and length >= RANGE_MIN_SIZE and if_range:
+            logger.debug('Downloading %s in ranges over %d connections', url_or_filename, range_workers)
+            response.close()
+            stream = RangedDownloadIOWrapper(
+                response.url,
+                length,
+                workers=range_workers,
+                timeout=timeout,
+                verify_ssl=verify_ssl,
+                http_headers=http_headers,
+                if_range=if_range
+            )
+        else:
+            stream = RequestResponseIOWrapper(response)
+
+        return (stream, mime_type, file_ext, encoding)
 
     elif allow_local:
         # Default to a local file, if allowed
         try:
-            return (io.open(url_or_filename, 'rb'), mime_type, file_ext, encoding)
+            return (io.BufferedReader(InstrumentedFileIO(url_or_filename)), mime_type, file_ext, encoding)
         except Exception as e:
             logger.exception("Cannot open local HXL file %s (%s)", url_or_filename, str(e))
             raise e
@@ -477,6 +1264,74 @@ class HXLTagsNotFoundException(HXLParseException):
         super().__init__(message, url)
 
 
+class TTLCache(object):
+    """Thread-safe cache whose entries expire after a fixed time-to-live.
+
+    L{get} computes a missing value only once, even if several threads
+    ask for the same key at the same time: the first caller does the
+    work, and the others wait for its result. If the computation
+    raises an exception, nothing is cached, and the next waiting
+    caller tries again.
+    """
+
+    def __init__(self, ttl):
+        """Constructor
+        @param ttl: number of seconds to keep each value
+        """
+        self.ttl = ttl
+        self._entries = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, compute):
+        """Get a cached value, computing it if it's missing or expired.
+        @param key: a hashable cache key
+        @param compute: a function with no arguments that computes the value
+        @returns: the cached or newly-computed value
+        """
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry[1] > time.monotonic():
+                    return entry[0]
+                event = self._pending.get(key)
+                if event is None:
+                    # we're the one doing the work
+                    event = self._pending[key] = threading.Event()
+                    break
+            # someone else is already computing the value; wait, then look again
+            event.wait()
+
+        try:
+            value = compute()
+            with self._lock:
+                self._purge()
+                self._entries[key] = (value, time.monotonic() + self.ttl,)
+            return value
+        finally:
+            with self._lock:
+                del self._pending[key]
+            event.set()
+
+    def clear(self):
+        """Remove all cached values."""
+        with self._lock:
+            self._entries.clear()
+
+    def _purge(self):
+        """Drop expired entries (caller must hold the lock)."""
+        now = time.monotonic()
+        for key in [key for key, entry in self._entries.items() if entry[1] <= now]:
+            del self._entries[key]
+
+
+URL_CACHE_TTL = 300
+"""Number of seconds to remember resolved URLs"""
+
+URL_CACHE = TTLCache(URL_CACHE_TTL)
+"""Cache of resolved URLs used by L{munge_url}"""
+
+
 class RequestResponseIOWrapper(io.RawIOBase):
     """Wrapper for a Response object from the requests library.  Streaming
     in requests is a bit broken: for example, if you're streaming, the
@@ -497,12 +1352,26 @@ class RequestResponseIOWrapper(io.RawIOBase):
         self.buffer = None
         self.buffer_pos = -1
         self.iter = response.iter_content(self.BUFFER_SIZE) # iterator through the input
+        self.stats = None
+        """L{IOStats} object for counting bytes, if any"""
+
+    @property
+    def size(self):
+        """The Content-Length, if known (and not changed by a Content-Encoding)."""
+        headers = self.response.headers
+        if headers.get('Content-Encoding', 'identity').lower() == 'identity':
+            try:
+                return int(headers.get('Content-Length'))
+            except (TypeError, ValueError):
+                pass
+        return None
 
     def read(self, size=-1):
         """Read raw byte input from the requests raw.iter_content iterator
         The function will unzip zipped content.
         @param size: the maximum number of bytes to read, or -1 for all available.
         """
+        start = time.perf_counter()
         result = bytearray()
 
         if size == -1:
@@ -527,6 +1396,8 @@ class RequestResponseIOWrapper(io.RawIOBase):
                 if self.buffer_pos >= len(self.buffer):
                     self.buffer = None
 
+        if self.stats is not None:
+            self.stats.record_read(len(result), time.perf_counter() - start)
         return bytes(result) # FIXME - how can we avoid a copy?
 
     def readinto(self, b):
@@ -555,14 +1426,420 @@ class RequestResponseIOWrapper(io.RawIOBase):
         return self.response.close()
 
 
+class RangedDownloadIOWrapper(io.RawIOBase):
+    """Download a remote file in parallel byte ranges, and read it back in order.
+
+    The file is divided into ranges of L{RANGE_CHUNK_SIZE} bytes,
+    which a pool of worker threads fetches, roughly in order, with
+    HTTP C{Range} requests into a temporary spool file on disk.
+    Reading starts as soon as the first bytes of the first range
+    arrive, and blocks only when it catches up with the download.
+
+    If a range is interrupted (e.g. a dropped connection), the worker
+    requests just the missing bytes again, up to L{RANGE_RETRIES} times.
+    Each request sends the original response's strong ETag (or its
+    Last-Modified date) in C{If-Range}, so a file that changed during
+    the download causes an error rather than a mixture of old and new
+    content.
+    """
+
+    BUFFER_SIZE = 0x10000
+    """Size of input chunks from each range response"""
+
+    def __init__(self, url, length, workers, timeout=None, verify_ssl=True, http_headers=None, if_range=None):
+        """Start downloading.
+        @param url: the URL to download (after redirects)
+        @param length: the total length of the file in bytes
+        @param workers: the number of parallel connections
+        @param timeout: if supplied, time out each request after this many seconds with no data received
+        @param verify_ssl: if False, don't verify SSL certificates
+        @param http_headers: an optional dict of HTTP headers to add to each request
+        @param if_range: the validator for C{If-Range}, if any (see L{get_if_range})
+        """
+        super().__init__()
+        self.url = url
+        self.length = length
+        self.timeout = timeout
+        self.verify_ssl = verify_ssl
+        self.http_headers = http_headers
+        self.if_range = if_range
+
+        self.chunk_count = max(1, (length + RANGE_CHUNK_SIZE - 1) // RANGE_CHUNK_SIZE)
+        self.received = [0] * self.chunk_count # contiguous bytes received for each range
+        self.pos = 0
+        self.error = None
+        self.is_closed = False
+        self.stats = None
+        """L{IOStats} object for counting bytes, if any"""
+
+        self._spool = tempfile.TemporaryFile()
+        self._spool_lock = threading.Lock()
+        self._condition = threading.Condition()
+        self._next_chunk = 0
+
+        self._threads = [threading.Thread(target=self._work, daemon=True) for i in range(min(workers, self.chunk_count))]
+        for thread in self._threads:
+            thread.start()
+
+    def readable(self):
+        return True
+
+    @property
+    def size(self):
+        """The total length of the file."""
+        return self.length
+
+    def readinto(self, b):
+        """Read the next available bytes, waiting for them to download if necessary.
+        @param b: the buffer to read into (will read up to its length)
+        @returns: the number of bytes read (0 at the end of the file)
+        """
+        if self.pos >= self.length or len(b) == 0:
+            return 0
+        start = time.perf_counter()
+        index, offset = divmod(self.pos, RANGE_CHUNK_SIZE)
+        with self._condition:
+            while self.received[index] <= offset and self.error is None:
+                self._condition.wait()
+            if self.received[index] <= offset:
+                raise self.error
+            available = self.received[index] - offset
+        size = min(len(b), available)
+        with self._spool_lock:
+            self._spool.seek(self.pos)
+            data = self._spool.read(size)
+        b[:len(data)] = data
+        self.pos += len(data)
+        if self.stats is not None:
+            self.stats.record_read(len(data), time.perf_counter() - start)
+        return len(data)
+
+    def close(self):
+        """Stop downloading, and delete the spool file."""
+        if not self.is_closed:
+            with self._condition:
+                self.is_closed = True
+                self._condition.notify_all()
+            for thread in self._threads:
+                thread.join()
+            self._spool.close()
+        super().close()
+
+    def _work(self):
+        """Worker thread: fetch ranges in order until there are none left."""
+        while True:
+            with self._condition:
+                if self.is_closed or self.error is not None or self._next_chunk >= self.chunk_count:
+                    return
+                index = self._next_chunk
+                self._next_chunk += 1
+            try:
+                self._fetch(index)
+            except Exception as e:
+                logger.error("Failed to download range %d of %s (%s)", index, self.url, str(e))
+                with self._condition:
+                    if self.error is None:
+                        self.error = e
+                    self._condition.notify_all()
+                return
+
+    def _fetch(self, index):
+        """Fetch a single range, resuming after interruptions."""
+        start = index * RANGE_CHUNK_SIZE
+        size = min(RANGE_CHUNK_SIZE, self.length - start)
+        failures = 0
+        while self.received[index] < size and not self.is_closed:
+            headers = dict(self.http_headers or {})
+            headers['Range'] = 'bytes={}-{}'.format(start + self.received[index], start + size - 1)
+            headers['Accept-Encoding'] = 'identity'
+            if self.if_range:
+                headers['If-Range'] = self.if_range
+            try:
+                with requests.get(self.url, stream=True, verify=self.verify_ssl, timeout=self.timeout, headers=headers) as response:
+                    if response.status_code != 206:
+                        raise HXLIOException("Expected a partial response for a byte range, but got HTTP status {} (has the file changed?)".format(response.status_code), url=self.url)
+                    # read1 returns whatever has arrived, so nothing is lost if the connection drops
+                    read = getattr(response.raw, 'read1', response.raw.read)
+                    while True:
+                        data = read(self.BUFFER_SIZE)
+                        if not data:
+                            break
+                        data = data[:size - self.received[index]]
+                        with self._spool_lock:
+                            self._spool.seek(start + self.received[index])
+                            self._spool.write(data)
+                        with self._condition:
+                            self.received[index] += len(data)
+                            self._condition.notify_all()
+                        if self.received[index] >= size or self.is_closed:
+                            break
+                if self.received[index] < size and not self.is_closed:
+                    raise IOError("Range ended early")
+            except HXLIOException:
+                raise
+            except Exception as e:
+                failures += 1
+                if failures > RANGE_RETRIES:
+                    raise
+                logger.warning("Resuming interrupted range %d of %s at byte %d (%s)", index, self.url, start + self.received[index], str(e))
+                time.sleep(0.1 * failures)
+
+    @staticmethod
+    def get_if_range(response):
+        """Choose a validator to send in C{If-Range}.
+        A weak ETag (C{W/"..."}) isn't allowed in C{If-Range}, so fall back to the Last-Modified date.
+        @param response: the original (full) HTTP response
+        @returns: a strong ETag or a Last-Modified date, or None if there is neither
+        """
+        etag = response.headers.get('ETag')
+        if etag and not etag.startswith('W/'):
+            return etag
+        else:
+            return response.headers.get('Last-Modified')
+
+    @staticmethod
+    def get_range_length(response):
+        """Check whether a response supports parallel ranged download.
+        @param response: a full (status 200) response from the requests library
+        @returns: the content length if the server accepts byte ranges for identity-encoded content, otherwise None
+        """
+        headers = response.headers
+        if response.status_code != 200 or headers.get('Accept-Ranges', '').lower() != 'bytes' or headers.get('Content-Encoding', 'identity').lower() != 'identity':
+            return None
+        try:
+            return int(headers.get('Content-Length'))
+        except (TypeError, ValueError):
+            return None
+
+
+class InstrumentedFileIO(io.FileIO):
+    """Local file that counts the bytes read, and the time spent reading them.
+    Still a C{io.FileIO}, so it can be reopened by name like any other local file.
+    """
+
+    stats = None
+    """L{IOStats} object for counting bytes, if any"""
+
+    @property
+    def size(self):
+        """The size of the file."""
+        return os.fstat(self.fileno()).st_size
+
+    def readinto(self, b):
+        start = time.perf_counter()
+        result = super().readinto(b)
+        if self.stats is not None and result:
+            self.stats.record_read(result, time.perf_counter() - start)
+        return result
+
+    def readall(self):
+        start = time.perf_counter()
+        result = super().readall()
+        if self.stats is not None:
+            self.stats.record_read(len(result), time.perf_counter() - start)
+        return result
+
+
+class InstrumentedIOWrapper(io.RawIOBase):
+    """Wrap a byte stream to count the bytes read, and the time spent reading them."""
+
+    def __init__(self, stream, stats):
+        """Constructor
+        @param stream: the byte stream to wrap
+        @param stats: the L{IOStats} object for counting
+        """
+        super().__init__()
+        self.stream = stream
+        self.stats = stats
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        start = time.perf_counter()
+        if hasattr(self.stream, 'readinto'):
+            result = self.stream.readinto(b)
+        else:
+            data = self.stream.read(len(b))
+            result = len(data)
+            b[:result] = data
+        if result:
+            self.stats.record_read(result, time.perf_counter() - start)
+        return result
+
+    def close(self):
+        self.stream.close()
+        super().close()
+
+
+class IOStats(object):
+    """Counters for reading a data source.
+
+    Every input from L{make_input} has one of these as its C{stats}
+    property (also available as L{HXLReader.stats}). The time spent
+    producing raw rows is split between I/O (blocked waiting for
+    bytes from the network or disk) and decoding (everything else:
+    decompression, character decoding, and parsing). For compressed
+    input, the byte counts are for the compressed data, so that they
+    can be compared with the total size. Counts stop at the end of the
+    first pass through a repeatable input.
+
+    Example::
+
+      def show_progress(stats):
+          print(stats, file=sys.stderr)
+
+      source = hxl.data(url, progress=show_progress)
+    """
+
+    def __init__(self, progress=None):
+        """Constructor
+        @param progress: an optional function to call with this object as reading progresses (see L{PROGRESS_INTERVAL})
+        """
+        super().__init__()
+
+        self.bytes_read = 0
+        """Number of raw bytes read"""
+
+        self.total_bytes = None
+        """Expected number of raw bytes (from the Content-Length or file size), or None if unknown"""
+
+        self.rows = 0
+        """Number of data rows produced"""
+
+        self.io_time = 0.0
+        """Seconds spent blocked on I/O"""
+
+        self.read_time = 0.0
+        """Seconds spent producing raw rows, including I/O"""
+
+        self.format = None
+        """The detected input format (e.g. "csv" or "xlsx")"""
+
+        self.encoding = None
+        """The character encoding, for text formats"""
+
+        self.compression = None
+        """The compression, if any (e.g. "gzip" or "zip")"""
+
+        self.is_finished = False
+        """True once the end of the input has been reached"""
+
+        self.progress = progress
+        self.start_time = time.monotonic()
+        self._last_report = self.start_time
+
+    @property
+    def decode_time(self):
+        """Seconds spent producing raw rows, not counting I/O."""
+        return max(0.0, self.read_time - self.io_time)
+
+    @property
+    def elapsed(self):
+        """Seconds since the input was opened."""
+        return time.monotonic() - self.start_time
+
+    @property
+    def bytes_per_second(self):
+        """Average raw bytes read per second."""
+        elapsed = self.elapsed
+        return self.bytes_read / elapsed if elapsed > 0 else None
+
+    @property
+    def rows_per_second(self):
+        """Average data rows produced per second."""
+        elapsed = self.elapsed
+        return self.rows / elapsed if elapsed > 0 else None
+
+    @property
+    def fraction(self):
+        """Fraction of the input read so far (0.0 to 1.0), or None if the total size is unknown."""
+        if self.is_finished:
+            return 1.0
+        elif self.total_bytes:
+            return min(1.0, self.bytes_read / self.total_bytes)
+        else:
+            return None
+
+    @property
+    def eta(self):
+        """Estimated seconds until all of the input is read, or None if unknown."""
+        if self.is_finished:
+            return 0.0
+        elif self.total_bytes and self.bytes_read:
+            return max(0.0, (self.total_bytes - self.bytes_read) / self.bytes_per_second)
+        else:
+            return None
+
+    def record_read(self, size, seconds):
+        """Count raw bytes read.
+        @param size: the number of bytes
+        @param seconds: the time spent waiting for them
+        """
+        self.bytes_read += size
+        self.io_time += seconds
+        self._report()
+
+    def record_row(self):
+        """Count a data row produced (ignored after the end of the input, e.g. for a second pass through a local file)."""
+        if not self.is_finished:
+            self.rows += 1
+            self._report()
+
+    def finish(self):
+        """Note the end of the input, and make a final progress report."""
+        if not self.is_finished:
+            self.is_finished = True
+            self._report(force=True)
+
+    def as_dict(self):
+        """@returns: the counters as a dict (e.g. for exporting as metrics)"""
+        return {
+            'format': self.format,
+            'encoding': self.encoding,
+            'compression': self.compression,
+            'bytes_read': self.bytes_read,
+            'total_bytes': self.total_bytes,
+            'rows': self.rows,
+            'io_time': self.io_time,
+            'decode_time': self.decode_time,
+            'elapsed': self.elapsed,
+            'eta': self.eta,
+            'is_finished': self.is_finished,
+        }
+
+    def _report(self, force=False):
+        if self.progress is not None:
+            now = time.monotonic()
+            if force or now - self._last_report >= PROGRESS_INTERVAL:
+                self._last_report = now
+                self.progress(self)
+
+    def __str__(self):
+        s = '{:,} rows, {:,.1f} MB'.format(self.rows, self.bytes_read / 1e6)
+        if self.total_bytes:
+            s += ' of {:,.1f} MB ({:.0%})'.format(self.total_bytes / 1e6, self.fraction)
+        if self.bytes_per_second is not None:
+            s += ', {:,.1f} MB/s'.format(self.bytes_per_second / 1e6)
+        eta = self.eta
+        if eta is not None and not self.is_finished:
+            s += ', ETA {}s'.format(int(round(eta)))
+        return s
+
+
 class AbstractInput(object):
     """Abstract base class for input classes."""
 
     __metaclass__ = abc.ABCMeta
 
+    FORMAT = None
+    """Short name of the input format (e.g. "csv")"""
+
     def __init__(self):
         super().__init__()
         self.is_repeatable = False
+        self.stats = IOStats()
+        """Counters for reading the input (see L{IOStats})"""
 
     @abc.abstractmethod
     def __iter__(self):
@@ -576,7 +1853,14 @@ class AbstractInput(object):
 
 
 class CSVInput(AbstractInput):
-    """Read raw CSV input from a URL or filename."""
+    """Read raw CSV input from a URL or filename.
+
+    If the input is a local file, the input is repeatable: the first
+    iteration reads the stream passed to the constructor, and each
+    later one reopens the file by name, so iterations are independent.
+    """
+
+    FORMAT = 'csv'
 
     DELIMITERS = [",", "\t", ";", ":", "|"]
     """Field delimiters allowed"""
@@ -585,17 +1869,35 @@ class CSVInput(AbstractInput):
         super().__init__()
 
         # guess the delimiter
-        delimiter = CSVInput.detect_delimiter(input, encoding)
+        self._delimiter = CSVInput.detect_delimiter(input, encoding)
+        self._encoding = encoding
+
+        # only a plain local file can be reopened (not, e.g., a decompressed stream)
+        self._filename = None
+        if isinstance(getattr(input, 'raw', None), io.FileIO) and isinstance(input.name, six.string_types) and os.path.isfile(input.name):
+            self._filename = input.name
+            self.is_repeatable = True
         
         self._input = io.TextIOWrapper(input, encoding=encoding)
-        self._reader = csv.reader(self._input, delimiter=delimiter)
+        self._reader = csv.reader(self._input, delimiter=self._delimiter)
+        self._is_reader_used = False
 
     def __exit__(self, value, type, traceback):
         self._input.close()
 
     def __iter__(self):
+        if self.is_repeatable and self._is_reader_used:
+            return self._gen_reopened()
+        self._is_reader_used = True
         return self._reader
 
+    def _gen_reopened(self):
+        """Read the local file again from the start, with its own file handle."""
+        with io.open(self._filename, 'rb') as input:
+            with io.TextIOWrapper(input, encoding=self._encoding) as _input:
+                for row in csv.reader(_input, delimiter=self._delimiter):
+                    yield row
+
     @staticmethod
     def detect_delimiter(input, encoding):
         """Detect the CSV delimiter in use
@@ -630,17 +1932,130 @@ class CSVInput(AbstractInput):
                     
         return most_common_delim
     
-class JSONInput(AbstractInput):
-    """Iterable: Read raw CSV input from an input stream.
-    The iterable values will be arrays usable as raw input for HXL.
+class ZipCSVInput(AbstractInput):
+    """Iterable: Read several CSV members of a zip archive as one appended dataset.
+
+    The members are streamed one after another, decompressing as they
+    go, so only one member is open at a time. Before any rows are
+    returned, each member's hashtag row is located (reading no further
+    than necessary) so that the columns can be lined up the same way
+    as L{hxl.filters.AppendFilter} does: columns match when their
+    hashtags and attributes match, and columns appearing in only some
+    members are added at the end (and left blank elsewhere).
+
+    The output is a single text-header row and hashtag row, followed
+    by the data rows of every member, in archive order.
     """
 
-    def __init__(self, input, encoding='utf-8', selector=None):
+    FORMAT = 'csv'
+
+    BUFFER_SIZE = 0x10000
+    """Read-buffer size for zip members (large enough to sniff a CSV delimiter)"""
+
+    def __init__(self, zf, names, encoding='utf-8'):
+        """Constructor
+        @param zf: an open C{zipfile.ZipFile}
+        @param names: the names of the CSV members to read, in order
+        @param encoding: the character encoding of the members (defaults to "utf-8")
+        """
+        super().__init__()
+        self._zipfile = zf
+        self._names = names
+        self._encoding = encoding
+        self.is_repeatable = True # each iteration reopens the members
+
+        self.columns = []
+        """The combined columns for all members"""
+
+        self._column_positions = []
+        """Output position for each column of each member"""
+
+        self._skip_rows = []
+        """Number of leading rows (up to and including the hashtag row) to skip in each member"""
+
+        for name in names:
+            self._scan_member(name)
+
+    def __iter__(self):
+        yield [column.header or '' for column in self.columns]
+        yield [column.display_tag or '' for column in self.columns]
+        for name, positions, skip_rows in zip(self._names, self._column_positions, self._skip_rows):
+            with self.open_member(self._zipfile, name) as input:
+                for raw_row in itertools.islice(CSVInput(input, encoding=self._encoding), skip_rows, None):
+                    row = [''] * len(self.columns)
+                    for i, value in enumerate(raw_row):
+                        if i < len(positions):
+                            row[positions[i]] = value
+                    yield row
+
+    def _scan_member(self, name):
+        """Find a member's hashtag row, and map its columns onto the combined ones."""
+        columns_in = list(self.columns)
+        with self.open_member(self._zipfile, name) as input:
+            previous_row = []
+            for row_number, raw_row in enumerate(itertools.islice(CSVInput(input, encoding=self._encoding), 25)):
+                # FIXME nasty violation of encapsulation
+                columns = HXLReader.parse_tags(raw_row, previous_row)
+                if columns is not None:
+                    break
+                previous_row = raw_row
+            else:
+                raise HXLTagsNotFoundException("HXL tags not found in first 25 rows of zip member {}".format(name))
+
+        positions = []
+        for column in columns:
+            for k, original_column in enumerate(columns_in):
+                if column == original_column:
+                    # yes, there is one; clear it, so it's not reused
+                    positions.append(k)
+                    columns_in[k] = None
+                    break
+            else:
+                # no -- we need to add a new column
+                positions.append(len(self.columns))
+                self.columns.append(column)
+        self._column_positions.append(positions)
+        self._skip_rows.append(row_number + 1)
+
+    @staticmethod
+    def open_member(zf, name):
+        """Open a zip member as a buffered byte stream, decompressing on the fly.
+        @param zf: an open C{zipfile.ZipFile}
+        @param name: the member name
+        @returns: a byte stream with a peek() method
+        """
+        return io.BufferedReader(zf.open(name), buffer_size=ZipCSVInput.BUFFER_SIZE)
+
+
+class JSONInput(AbstractInput):
+    """Iterable: Read raw CSV input from an input stream.
+    The iterable values will be arrays usable as raw input for HXL.
+
+    By default, the whole JSON document is loaded before the first
+    row is returned. In incremental mode, the data array is decoded
+    one element at a time instead, so memory use does not grow with
+    the size of the document; that mode supports a top-level array,
+    a simple (top-level property) selector, or the first top-level
+    property holding an array of arrays or objects, but not full
+    JSONPath selectors (which fall back to loading the whole document).
+    """
+
+    FORMAT = 'json'
+
+    LOOKAHEAD = 1000
+    """Default number of JSON objects to scan for headers in incremental mode"""
+
+    SCAN_ALL = -1
+    """Lookahead value to scan all of the JSON objects for headers first, in incremental mode (needs a stream that can be rewound)"""
+
+    def __init__(self, input, encoding='utf-8', selector=None, incremental=False, lookahead=None):
         """Constructor
         The selector is used only if the top-level JSON is an object rather than an array.
         @param input: an input stream
         @param encoding: the default encoding to use (defaults to "utf-8")
         @param selector: the default dictionary key for the HXL data (defaults to "hxl")
+        @param incremental: if True, decode one row at a time rather than loading the whole document (default: False)
+        @param lookahead: in incremental mode, the number of JSON objects to scan for headers (default: L{LOOKAHEAD}), or L{SCAN_ALL} to read through the whole document once first
         """
         super().__init__()
 
@@ -649,9 +2064,23 @@ class JSONInput(AbstractInput):
         self.headers = []
         self.show_headers = False
 
-        # read the JSON data from the stream
+        if incremental and (selector is None or hxl.datatypes.is_token(selector)):
+            self._input = io.TextIOWrapper(input, encoding=encoding)
+            self._selector = selector
+            self._lookahead = lookahead
+            self._header_set = set()
+            self._skipped_headers = set()
+            self._scanned = 0
+            self._pending = collections.deque()
+            self._iterator = self._open_incremental()
+            return
+        elif incremental:
+            logger.warning("Incremental JSON parsing does not support JSONPath selectors; loading the whole document")
+
+        # read the JSON data from the stream (after that, it's in memory, so it's repeatable)
+        self.is_repeatable = True
         with io.TextIOWrapper(input, encoding=encoding) as _input:
-            self.json_data = self._select(selector, json.load(_input, encoding=encoding, object_pairs_hook=collections.OrderedDict))
+            self.json_data = self._select(selector, json.load(_input, object_pairs_hook=collections.OrderedDict))
         if not self._scan_data_element(self.json_data):
             self.json_data = self._search_data(self.json_data)
         if self.json_data is None:
@@ -659,7 +2088,116 @@ class JSONInput(AbstractInput):
 
     def __iter__(self):
         """@returns: an iterator over raw HXL data (arrays of scalar values)"""
-        return JSONInput.JSONIter(self)
+        if hasattr(self, '_iterator'):
+            return self._gen_incremental_rows()
+        else:
+            return JSONInput.JSONIter(self)
+
+    def _open_incremental(self):
+        """Find the data array in the stream, and detect the row type and headers.
+        For an array of objects, buffer the objects in the lookahead window, or
+        (with L{SCAN_ALL}) scan all of the objects once for their keys and start again.
+        @returns: an iterator over the remaining (undecoded) array elements
+        """
+        reader = JSONInput._StreamReader(self._input)
+        items = self._find_incremental_data(reader)
+        c = reader.peek()
+        if c == '{':
+            self.type = 'object'
+            self.show_headers = True
+            lookahead = self.LOOKAHEAD if self._lookahead is None else self._lookahead
+            if lookahead == self.SCAN_ALL and not self._input.seekable():
+                logger.warning("Can't rewind JSON input to scan for headers; using the first %d objects", self.LOOKAHEAD)
+                lookahead = self.LOOKAHEAD
+            if lookahead == self.SCAN_ALL:
+                # first pass keeps only the keys, then start again
+                for item in items:
+                    self._add_headers(item)
+                    self._scanned += 1
+                self._input.seek(0)
+                items = self._find_incremental_data(JSONInput._StreamReader(self._input))
+            else:
+                for item in itertools.islice(items, lookahead):
+                    self._add_headers(item)
+                    self._pending.append(item)
+                    self._scanned += 1
+        elif c == '[':
+            self.type = 'array'
+        elif c != ']':
+            raise HXLParseException("Could not find usable JSON data (need array of objects or array of arrays)")
+        return items
+
+    def _find_incremental_data(self, reader):
+        """Advance the reader to the start of the data array.
+        @param reader: the L{JSONInput._StreamReader} at the start of the document
+        @returns: an iterator over the array elements
+        """
+        selector = self._selector
+        c = reader.peek()
+        if c == '[':
+            if selector is not None:
+                raise HXLParseException("Expected a JSON object at the top level for simple selector {}".format(selector))
+            reader.expect('[')
+            return reader.iter_array()
+        elif c == '{':
+            reader.expect('{')
+            for key in reader.iter_object():
+                if selector is not None:
+                    if key == selector:
+                        if reader.peek() != '[':
+                            raise HXLParseException("Selector {} does not contain a JSON array".format(selector))
+                        reader.expect('[')
+                        return reader.iter_array()
+                    else:
+                        reader.read_value()
+                elif reader.peek() == '[':
+                    # use the first property holding an array of arrays or objects
+                    reader.expect('[')
+                    items = reader.iter_array()
+                    if reader.peek() in ('[', '{',):
+                        return items
+                    for item in items:
+                        pass # not tabular, so skip the rest of the array
+                else:
+                    reader.read_value()
+        if selector is not None:
+            raise HXLParseException("Selector {} not found at top level of JSON data".format(selector))
+        raise HXLParseException("Could not find usable JSON data (need array of objects or array of arrays)")
+
+    def _add_headers(self, item):
+        """Add any new keys from a JSON object to the headers."""
+        if not isinstance(item, dict):
+            raise HXLParseException("Mixed objects and arrays in JSON data")
+        for key in item:
+            if key not in self._header_set:
+                self._header_set.add(key)
+                self.headers.append(key)
+
+    def _gen_incremental_rows(self):
+        """Generate rows in incremental mode, starting with any buffered objects."""
+        if self.show_headers:
+            # Add the header row first if reading an array of JSON objects
+            self.show_headers = False
+            yield self.headers
+        while self._pending:
+            yield self._make_incremental_row(self._pending.popleft())
+        for item in self._iterator:
+            yield self._make_incremental_row(item)
+
+    def _make_incremental_row(self, item):
+        """Convert a single JSON array element to a row."""
+        if self.type == 'object':
+            if not isinstance(item, dict):
+                raise HXLParseException("Mixed objects and arrays in JSON data")
+            for key in item:
+                if key not in self._header_set and key not in self._skipped_headers:
+                    logger.warning("Skipping JSON property %s (not seen in the first %d objects)", key, self._scanned)
+                    self._skipped_headers.add(key)
+            return [hxl.datatypes.flatten(item.get(header)) for header in self.headers]
+        elif hxl.datatypes.is_list(item):
+            return [hxl.datatypes.flatten(value) for value in item]
+        else:
+            raise HXLParseException("Mixed objects and arrays in JSON data")
 
     def _select(self, selector, data):
         """Find the JSON matching the selector"""
@@ -751,18 +2289,121 @@ class JSONInput(AbstractInput):
 
         return None # didn't find anything
 
+    class _StreamReader:
+        """Minimal pull parser for walking through a JSON text stream.
+        Containers are entered one token at a time, and each array element
+        is decoded separately, so only one element is ever held in memory.
+        """
+
+        CHUNK_SIZE = 0x10000
+        """Number of characters to read from the stream at a time"""
+
+        WHITESPACE = re.compile(r'[ \t\r\n]*')
+
+        def __init__(self, input):
+            """Constructor
+            @param input: a text stream
+            """
+            self._input = input
+            self._buffer = ''
+            self._pos = 0
+            self._eof = False
+            self._decoder = json.JSONDecoder(object_pairs_hook=collections.OrderedDict)
+
+        def _fill(self, size=None):
+            """Read another chunk of input, discarding what's been consumed.
+            @param size: the number of characters to read, if more than L{CHUNK_SIZE}
+            @returns: False if there is no more input
+            """
+            if not self._eof:
+                chunk = self._input.read(max(self.CHUNK_SIZE, size or 0))
+                if chunk:
+                    self._buffer = self._buffer[self._pos:] + chunk
+                    self._pos = 0
+                    return True
+                self._eof = True
+            return False
+
+        def peek(self):
+            """Return the next non-whitespace character without consuming it.
+            @returns: a single character, or None at the end of input
+            """
+            while True:
+                self._pos = self.WHITESPACE.match(self._buffer, self._pos).end()
+                if self._pos < len(self._buffer):
+                    return self._buffer[self._pos]
+                elif not self._fill():
+                    return None
+
+        def expect(self, c):
+            """Consume an expected punctuation character."""
+            if self.peek() != c:
+                raise HXLParseException("Expected '{}' in JSON input".format(c))
+            self._pos += 1
+
+        def read_value(self):
+            """Decode the next complete JSON value."""
+            self.peek()
+            while True:
+                try:
+                    value, end = self._decoder.raw_decode(self._buffer, self._pos)
+                    # a value running to the end of the buffer (e.g. a number) might continue in the next chunk
+                    if end < len(self._buffer) or self._eof:
+                        self._pos = end
+                        return value
+                except json.JSONDecodeError as e:
+                    if self._eof:
+                        raise HXLParseException("Malformed JSON input: {}".format(e))
+                # double the unconsumed buffer each time, so a large value is decoded only O(log n) times
+                self._fill(len(self._buffer) - self._pos)
+
+        def iter_array(self):
+            """Iterate over the values of an array whose opening bracket has been consumed."""
+            if self.peek() == ']':
+                self._pos += 1
+                return
+            while True:
+                yield self.read_value()
+                c = self.peek()
+                self._pos += 1
+                if c == ']':
+                    return
+                elif c != ',':
+                    raise HXLParseException("Expected ',' or ']' in JSON array")
+
+        def iter_object(self):
+            """Iterate over the property names of an object whose opening brace has been consumed.
+            The caller must consume each property's value before continuing.
+            """
+            if self.peek() == '}':
+                self._pos += 1
+                return
+            while True:
+                key = self.read_value()
+                if not isinstance(key, six.string_types):
+                    raise HXLParseException("Expected a property name in JSON object")
+                self.expect(':')
+                yield key
+                c = self.peek()
+                self._pos += 1
+                if c == '}':
+                    return
+                elif c != ',':
+                    raise HXLParseException("Expected ',' or '}' in JSON object")
+
     class JSONIter:
         """Iterator over JSON data"""
 
         def __init__(self, outer):
             self.outer = outer
             self._iterator = iter(self.outer.json_data)
+            self._show_headers = self.outer.show_headers
             
         def __next__(self):
             """Return the next row in a tabular view of the data."""
-            if self.outer.show_headers:
+            if self._show_headers:
                 # Add the header row first if reading an array of JSON objects
-                self.outer.show_headers = False
+                self._show_headers = False
                 row = self.outer.headers
             elif self.outer.type == 'object':
                 # Construct a row in an array of JSON objects
@@ -776,21 +2417,136 @@ class JSONInput(AbstractInput):
             return row
 
 
+class NDJSONInput(AbstractInput):
+    """Iterable: Read raw input from a JSON Lines (newline-delimited JSON) stream.
+
+    Each non-blank line must hold a single JSON array (a row of
+    values) or object. For objects, the headers come from the keys
+    seen in the first few lines (see L{JSONInput.LOOKAHEAD}), and a
+    header row is added at the start. Lines are decoded one at a time,
+    so memory use does not grow with the size of the input.
+    """
+
+    FORMAT = 'ndjson'
+
+    def __init__(self, input, encoding='utf-8', lookahead=None):
+        """Constructor
+        @param input: an input stream
+        @param encoding: the default encoding to use (defaults to "utf-8")
+        @param lookahead: the number of JSON objects to scan for headers (defaults to L{JSONInput.LOOKAHEAD}), or L{JSONInput.SCAN_ALL} to hold every line in memory first
+        """
+        super().__init__()
+        self.type = None
+        self.headers = []
+        self._header_set = set()
+        self._skipped_headers = set()
+        self._input = io.TextIOWrapper(input, encoding=encoding)
+        self._line_number = 0
+        self._items = self._gen_items()
+
+        # look at the first item (and the lookahead window, for objects)
+        self._pending = collections.deque(itertools.islice(self._items, 1))
+        if self._pending and isinstance(self._pending[0], dict):
+            self.type = 'object'
+            lookahead = JSONInput.LOOKAHEAD if lookahead is None else lookahead
+            self._pending.extend(itertools.islice(
+                self._items,
+                None if lookahead == JSONInput.SCAN_ALL else lookahead - 1
+            ))
+            self._lookahead_count = len(self._pending)
+            for item in self._pending:
+                if not isinstance(item, dict):
+                    raise HXLParseException("Mixed objects and arrays in JSON Lines data")
+                for key in item:
+                    if key not in self._header_set:
+                        self._header_set.add(key)
+                        self.headers.append(key)
+        else:
+            self.type = 'array'
+
+    def __exit__(self, value, type, traceback):
+        self._input.close()
+
+    def __iter__(self):
+        """@returns: an iterator over raw HXL data (arrays of scalar values)"""
+        if self.type == 'object':
+            yield self.headers
+        while self._pending:
+            yield self._make_row(self._pending.popleft())
+        for item in self._items:
+            yield self._make_row(item)
+
+    def _gen_items(self):
+        """Decode the JSON value on each non-blank line."""
+        for line in self._input:
+            self._line_number += 1
+            if line.strip():
+                try:
+                    yield json.loads(line, object_pairs_hook=collections.OrderedDict)
+                except ValueError as e:
+                    raise HXLParseException(
+                        "Malformed JSON on line {}: {}".format(self._line_number, e),
+                        source_row_number=self._line_number
+                    )
+
+    def _make_row(self, item):
+        """Convert a decoded line to a row of flattened values."""
+        if self.type == 'object' and isinstance(item, dict):
+            for key in item:
+                if key not in self._header_set and key not in self._skipped_headers:
+                    logger.warning("Skipping JSON property %s (not seen in the first %d lines)", key, self._lookahead_count)
+                    self._skipped_headers.add(key)
+            return [hxl.datatypes.flatten(item.get(header)) for header in self.headers]
+        elif self.type == 'array' and hxl.datatypes.is_list(item):
+            return [hxl.datatypes.flatten(value) for value in item]
+        else:
+            raise HXLParseException(
+                "Mixed objects and arrays in JSON Lines data (line {})".format(self._line_number),
+                source_row_number=self._line_number
+            )
+
+    @staticmethod
+    def detect(input, encoding):
+        """Detect JSON Lines content from its opening.
+        The first line must be a complete JSON array or object on its own,
+        followed by another line starting with an array or object.
+        @param input: the input byte stream (with a peek() method)
+        @param encoding: the character encoding to use
+        @returns: True if the input looks like JSON Lines
+        """
+        sample = input.peek(16384).decode(encoding, errors='replace')
+        lines = sample.lstrip().split('\n', 1)
+        if len(lines) < 2 or not lines[1].lstrip()[:1] in ('[', '{',):
+            return False
+        try:
+            return isinstance(json.loads(lines[0]), (list, dict,))
+        except ValueError:
+            return False
+
+
 class XLSInput(AbstractInput):
     """Iterable: Read raw XLS input from a URL or filename.
     If sheet number is not specified, will scan for the first tab with a HXL tag row.
     """
 
+    FORMAT = 'xls'
+
     def __init__(self, tmpfile, sheet_index=None):
         """
         Constructor
-        @param tmpfile: a named temporary file object holding the workbook contents
+        Sheets are loaded on demand, so only the ones actually read are parsed.
+        @param tmpfile: the workbook contents, as a local filename, a named (temporary) file object, or an in-memory byte stream
         @param sheet_index (optional) the 0-based index of the sheet (if unspecified, scan)
         """
         super().__init__()
         self.tmpfile = tmpfile # prevent garbage collection as long as this object exists
         self.is_repeatable = True
-        self._workbook = xlrd.open_workbook(filename=tmpfile.name)
+        if isinstance(tmpfile, six.string_types):
+            self._workbook = xlrd.open_workbook(filename=tmpfile, on_demand=True)
+        elif hasattr(tmpfile, 'getvalue'):
+            self._workbook = xlrd.open_workbook(file_contents=tmpfile.getvalue(), on_demand=True)
+        else:
+            self._workbook = xlrd.open_workbook(filename=tmpfile.name, on_demand=True)
         if sheet_index is None:
             sheet_index = self._find_hxl_sheet_index()
         self._sheet = self._workbook.sheet_by_index(sheet_index)
@@ -807,6 +2563,8 @@ class XLSInput(AbstractInput):
                 # FIXME nasty violation of encapsulation
                 if HXLReader.parse_tags(raw_row):
                     return sheet_index
+            # release sheets that don't contain HXL
+            self._workbook.unload_sheet(sheet_index)
         # if no sheet has tags, default to the first one for now
         return 0
 
@@ -855,91 +2613,582 @@ class XLSInput(AbstractInput):
 
 
 class XLSXInput(AbstractInput):
-    """Iterable: Read raw XLS input from a URL or filename.
+    """Iterable: Read raw XLSX input from a URL or filename.
+
+    Reads the worksheet XML straight out of the zip archive with an
+    incremental parser, so rows are returned as they are decoded,
+    rather than after the whole workbook has been loaded into memory.
+    Only the shared-string table (one entry per I{unique} string) is
+    held in memory.
+
     If sheet number is not specified, will scan for the first tab with a HXL tag row.
     """
 
+    FORMAT = 'xlsx'
+
+    MAIN_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+    """XML namespace for SpreadsheetML elements"""
+
+    REL_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+    """XML namespace for relationship attributes in the workbook"""
+
+    PKG_REL_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+    """XML namespace for package relationship files"""
+
+    DATE_FORMAT_IDS = set(range(14, 23)) | set(range(27, 37)) | set(range(45, 48)) | set(range(50, 59))
+    """Built-in Excel number formats that represent dates"""
+
     def __init__(self, tmpfile, sheet_index=None):
         """
         Constructor
-        @param tmpfile: temporary file object holding the contents
+        @param tmpfile: the workbook contents, as a local filename, a temporary file object, or an in-memory byte stream
         @param sheet_index (optional) the 0-based index of the sheet (if unspecified, scan)
         """
         super().__init__()
         self.tmpfile = tmpfile # prevent garbage collection
         self.is_repeatable = True
         try:
-            self._workbook = xlrd.open_workbook(filename=tmpfile.name)
-        except TypeError as e:
-            # xlrd throws a TypeError when it's trying to open a non-XLSX zip
-            # there are probably other exceptions we need to trap here
+            self._zipfile = zipfile.ZipFile(tmpfile, 'r')
+            self._sheet_paths = self._read_sheet_paths()
+        except (zipfile.BadZipFile, KeyError, xml.etree.ElementTree.ParseError) as e:
+            # not every zip archive is a workbook
             raise HXLIOException("Not an Excel workbook (possibly a zip archive)")
+        self._shared_strings = None
+        self._date_styles = self._read_date_styles()
         if sheet_index is None:
             sheet_index = self._find_hxl_sheet_index()
-        self._sheet = self._workbook.sheet_by_index(sheet_index)
+        self._sheet_path = self._sheet_paths[sheet_index]
 
     def __iter__(self):
-        return XLSXInput.XLSXIter(self)
+        return self._gen_rows(self._sheet_path)
 
     def _find_hxl_sheet_index(self):
-        """Scan for a tab containing a HXL dataset."""
-        for sheet_index in range(0, self._workbook.nsheets):
-            sheet = self._workbook.sheet_by_index(sheet_index)
-            for row_index in range(0, min(25, sheet.nrows)):
-                raw_row = [XLSXInput._fix_value(cell) for cell in sheet.row(row_index)]
-                # FIXME nasty violation of encapsulation
-                if HXLReader.parse_tags(raw_row):
-                    return sheet_index
+        """Scan for a tab containing a HXL dataset.
+        Reads only the first 25 rows of each sheet, and stops as soon as it finds a hashtag row.
+        """
+        for sheet_index, sheet_path in enumerate(self._sheet_paths):
+            rows = self._gen_rows(sheet_path)
+            try:
+                for raw_row in itertools.islice(rows, 25):
+                    # FIXME nasty violation of encapsulation
+                    if HXLReader.parse_tags(raw_row):
+                        return sheet_index
+            finally:
+                rows.close()
         # if no sheet has tags, default to the first one for now
         return 0
 
-    @staticmethod
-    def _fix_value(cell):
+    def _read_sheet_paths(self):
+        """Get the archive paths for the worksheets, in workbook order."""
+        targets = {}
+        with self._zipfile.open('xl/_rels/workbook.xml.rels') as input:
+            for event, elem in xml.etree.ElementTree.iterparse(input):
+                if elem.tag == self.PKG_REL_NS + 'Relationship':
+                    target = elem.get('Target')
+                    if target.startswith('/'):
+                        target = target[1:]
+                    else:
+                        target = 'xl/' + target
+                    targets[elem.get('Id')] = target
+
+        self._datemode = 0
+        sheet_paths = []
+        with self._zipfile.open('xl/workbook.xml') as input:
+            for event, elem in xml.etree.ElementTree.iterparse(input):
+                if elem.tag == self.MAIN_NS + 'workbookPr':
+                    if elem.get('date1904') in ('1', 'true',):
+                        self._datemode = 1
+                elif elem.tag == self.MAIN_NS + 'sheet':
+                    sheet_paths.append(targets[elem.get(self.REL_NS + 'id')])
+        return sheet_paths
+
+    def _read_date_styles(self):
+        """Get the set of cell-style indices that format numbers as dates."""
+        if 'xl/styles.xml' not in self._zipfile.namelist():
+            return set()
+        date_formats = set(self.DATE_FORMAT_IDS)
+        date_styles = set()
+        style_index = 0
+        in_cell_xfs = False
+        with self._zipfile.open('xl/styles.xml') as input:
+            for event, elem in xml.etree.ElementTree.iterparse(input, events=('start', 'end',)):
+                if elem.tag == self.MAIN_NS + 'numFmt' and event == 'end':
+                    if XLSXInput._is_date_format(elem.get('formatCode', '')):
+                        date_formats.add(int(elem.get('numFmtId')))
+                elif elem.tag == self.MAIN_NS + 'cellXfs':
+                    in_cell_xfs = (event == 'start')
+                elif elem.tag == self.MAIN_NS + 'xf' and event == 'end' and in_cell_xfs:
+                    if int(elem.get('numFmtId', 0)) in date_formats:
+                        date_styles.add(style_index)
+                    style_index += 1
+        return date_styles
+
+    def _read_shared_strings(self):
+        """Load the table of unique strings, one element at a time."""
+        shared_strings = []
+        if 'xl/sharedStrings.xml' in self._zipfile.namelist():
+            with self._zipfile.open('xl/sharedStrings.xml') as input:
+                for event, elem in xml.etree.ElementTree.iterparse(input):
+                    if elem.tag == self.MAIN_NS + 'si':
+                        shared_strings.append(self._get_text(elem))
+                        elem.clear()
+        return shared_strings
+
+    def _get_text(self, elem):
+        """Get the text of a string item, including rich-text runs, but skipping phonetic hints."""
+        text = elem.find(self.MAIN_NS + 't')
+        if text is not None:
+            return text.text or ''
+        return ''.join(
+            t.text or '' for t in elem.iterfind('{ns}r/{ns}t'.format(ns=self.MAIN_NS))
+        )
+
+    def _gen_rows(self, sheet_path):
+        """Generate rows from a worksheet as they are parsed.
+        Missing rows and cells are filled in with empty strings.
+        """
+        row_tag = self.MAIN_NS + 'row'
+        with self._zipfile.open(sheet_path) as input:
+            width = 0
+            row_index = 0
+            parent = None
+            for event, elem in xml.etree.ElementTree.iterparse(input, events=('start', 'end',)):
+                if event == 'start':
+                    if elem.tag == self.MAIN_NS + 'dimension':
+                        # used only to pad short rows, as xlrd did
+                        result = re.match(r'^[A-Z]+[0-9]+:([A-Z]+)[0-9]+$', elem.get('ref', ''))
+                        if result:
+                            width = XLSXInput._column_index(result.group(1)) + 1
+                    elif elem.tag == self.MAIN_NS + 'sheetData':
+                        parent = elem
+                elif elem.tag == row_tag:
+                    if elem.get('r'):
+                        # fill in any rows with no cells
+                        while row_index < int(elem.get('r')) - 1:
+                            yield [''] * width
+                            row_index += 1
+                    row = self._parse_row(elem)
+                    if len(row) < width:
+                        row += [''] * (width - len(row))
+                    yield row
+                    row_index += 1
+                    # drop the parsed row, so that memory use stays flat
+                    parent.clear()
+
+    def _parse_row(self, elem):
+        """Convert a row element into a list of values."""
+        row = []
+        for cell in elem.iterfind(self.MAIN_NS + 'c'):
+            ref = cell.get('r')
+            if ref:
+                column_index = XLSXInput._column_index(re.match(r'^[A-Z]+', ref).group(0))
+                if column_index > len(row):
+                    row += [''] * (column_index - len(row))
+            row.append(self._fix_value(cell))
+        return row
+
+    def _fix_value(self, cell):
         """Clean up an Excel value for CSV-like representation."""
 
-        if cell.value is None or cell.ctype == xlrd.XL_CELL_EMPTY:
+        type = cell.get('t', 'n')
+
+        if type == 'inlineStr':
+            is_elem = cell.find(self.MAIN_NS + 'is')
+            return self._get_text(is_elem) if is_elem is not None else ''
+
+        value = cell.findtext(self.MAIN_NS + 'v')
+        if value is None:
             return ''
 
-        elif cell.ctype == xlrd.XL_CELL_NUMBER:
+        elif type == 's':
+            if self._shared_strings is None:
+                # load only when first needed
+                self._shared_strings = self._read_shared_strings()
+            return self._shared_strings[int(value)]
+
+        elif type == 'n':
+            value = float(value)
+            if int(cell.get('s', 0)) in self._date_styles:
+                # dates need to be formatted
+                try:
+                    data = xlrd.xldate_as_tuple(value, self._datemode)
+                    return '{0[0]:04d}-{0[1]:02d}-{0[2]:02d}'.format(data)
+                except:
+                    return value
             # let numbers be integers if possible
-            if float(cell.value).is_integer():
-                return int(cell.value)
+            elif value.is_integer():
+                return int(value)
             else:
-                return cell.value
+                return value
 
-        elif cell.ctype == xlrd.XL_CELL_DATE:
-            # dates need to be formatted
+        elif type == 'b':
+            return int(value)
+
+        else: # str, e, or anything else
+            return value
+
+    @staticmethod
+    def _column_index(letters):
+        """Convert spreadsheet column letters (e.g. "AB") to a 0-based index."""
+        index = 0
+        for c in letters:
+            index = index * 26 + (ord(c) - 64)
+        return index - 1
+
+    @staticmethod
+    def _is_date_format(format_code):
+        """Guess whether a custom number format displays a date."""
+        # ignore quoted literals, escapes, and bracketed colours/conditions
+        format_code = re.sub(r'"[^"]*"|\\.|\[[^\]]*\]', '', format_code)
+        return re.search(r'[dmyhs]', format_code, re.IGNORECASE) is not None
+
+
+class HXLBInput(AbstractInput):
+    """Iterable: Read raw input from a HXLB binary snapshot (see L{write_hxlb}).
+
+    A local file is memory-mapped rather than read. Opening the
+    snapshot reads only the small metadata block; each column's
+    dictionary and codes are decoded the first time the rows are
+    iterated, and the codes are used in place, straight from the
+    mapped file.
+
+    File layout (all integers little-endian)::
+
+      "HXLB" | version (uint16) | reserved (uint16) | metadata length (uint64)
+      metadata (UTF-8 JSON: headers, tags, row count, and column block offsets)
+      column blocks (each 8-byte aligned, offsets relative to the first)
+    """
+
+    FORMAT = 'hxlb'
+
+    MAGIC = b'HXLB'
+
+    VERSION = 1
+
+    HEADER = struct.Struct('<4sHHQ')
+    """Fixed-size file header"""
+
+    ABSENT_CODE = 0
+    """Code for a cell missing from the end of a short row"""
+
+    def __init__(self, source):
+        """Constructor
+        @param source: a local filename, a file object, or an in-memory byte stream
+        """
+        super().__init__()
+        self.is_repeatable = True
+        self._file = None
+        self._owns_file = False
+        if isinstance(source, six.string_types):
+            self._file = io.open(source, 'rb')
+            self._owns_file = True
             try:
-                data = xlrd.xldate_as_tuple(cell.value, 0)
-                return '{0[0]:04d}-{0[1]:02d}-{0[2]:02d}'.format(data)
+                self._buffer = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
             except:
-                return cell.value
+                self._file.close()
+                raise
+        elif hasattr(source, 'getbuffer'):
+            self._buffer = source.getbuffer()
+        else:
+            self._file = source # keep a reference, so that a temporary file isn't deleted
+            self._buffer = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
 
-        elif cell.ctype == xlrd.XL_CELL_BOOLEAN:
-            return int(cell.value)
+        try:
+            magic, version, reserved, metadata_length = self.HEADER.unpack_from(self._buffer, 0)
+        except struct.error:
+            self._close()
+            raise HXLParseException("Truncated HXLB snapshot")
+        if magic != self.MAGIC or version != self.VERSION:
+            self._close()
+            raise HXLParseException("Not a HXLB snapshot, or unsupported version")
+        metadata = json.loads(bytes(self._buffer[self.HEADER.size:self.HEADER.size+metadata_length]).decode('utf-8'))
+        self._data_offset = self._align(self.HEADER.size + metadata_length)
+        self.headers = metadata['headers']
+        self.tags = metadata['tags']
+        self.row_count = metadata['rows']
+        self._column_specs = metadata['columns']
+        self._decoded_columns = [None] * len(self._column_specs)
 
-        else: # XL_CELL_TEXT, or anything else
-            return cell.value
+    def __exit__(self, value, type, traceback):
+        self._decoded_columns = [None] * len(self._column_specs)
+        self._close()
 
-    class XLSXIter:
-        """Internal iterator class for reading through an Excel sheet multiple times."""
+    def _close(self):
+        """Release the memory map, and the file if this object opened it."""
+        if isinstance(self._buffer, mmap.mmap):
+            try:
+                self._buffer.close()
+            except BufferError:
+                pass # a row iterator is still using it
+        if self._owns_file:
+            # the map has its own handle, so it stays valid after this
+            self._file.close()
 
-        def __init__(self, outer):
-            self.outer = outer
-            self._row_index = 0
-            
-        def __next__(self):
-            if self._row_index < self.outer._sheet.nrows:
-                row = [XLSXInput._fix_value(cell) for cell in self.outer._sheet.row(self._row_index)]
-                self._row_index += 1
-                return row
+    def __iter__(self):
+        yield [header or '' for header in self.headers]
+        yield [tag or '' for tag in self.tags]
+        columns = [self._get_column(i) for i in range(len(self._column_specs))]
+        if not columns:
+            for i in range(self.row_count):
+                yield []
+            return
+        for values in zip(*[map(dictionary.__getitem__, codes) for dictionary, codes in columns]):
+            values = list(values)
+            while values and values[-1] is HXLBInput._ABSENT:
+                values.pop()
+            yield values
+
+    def _get_column(self, index):
+        """Decode a column's dictionary and codes (once only).
+        @returns: a tuple of the dictionary (a list, indexed by code) and the codes
+        """
+        if self._decoded_columns[index] is None:
+            spec = self._column_specs[index]
+            start, length = spec['dictionary']
+            start += self._data_offset
+            dictionary = [HXLBInput._ABSENT] + json.loads(bytes(self._buffer[start:start+length]).decode('utf-8'))
+            start, length = spec['codes']
+            start += self._data_offset
+            codes = memoryview(self._buffer)[start:start+length]
+            if sys.byteorder == 'little':
+                codes = codes.cast(spec['type'])
             else:
-                raise StopIteration()
+                codes = array.array(spec['type'], codes)
+                codes.byteswap()
+            self._decoded_columns[index] = (dictionary, codes,)
+        return self._decoded_columns[index]
+
+    @staticmethod
+    def _align(n):
+        """Round up to the next multiple of 8."""
+        return (n + 7) & ~7
+
+    class _Absent:
+        """Placeholder for a cell missing from a short row."""
+
+    _ABSENT = _Absent()
+
+
+class AbstractArrowInput(AbstractInput):
+    """Base class for input from Arrow record batches.
+
+    Headers and hashtags come from the C{hxl:header} and C{hxl:tag}
+    field metadata written by L{write_parquet} and L{to_arrow}. For
+    files from elsewhere, the field names are used as the text headers,
+    and any hashtags in them will be found by the usual header scan.
+
+    Values are converted to strings; nulls become empty cells.
+    """
+
+    def __init__(self, source):
+        """Constructor
+        @param source: a local filename, a file object, or an in-memory byte stream
+        """
+        super().__init__()
+        require_pyarrow()
+        self.is_repeatable = True
+        if hasattr(source, 'getbuffer'):
+            self._source = pyarrow.py_buffer(source.getbuffer()) # no copy
+        else:
+            self._source = source # keep a reference, so that a temporary file isn't deleted
+
+    def __iter__(self):
+        schema = self._get_schema()
+        headers = []
+        tags = []
+        for field in schema:
+            metadata = field.metadata or {}
+            headers.append(metadata.get(b'hxl:header', field.name.encode('utf-8')).decode('utf-8'))
+            tags.append(metadata.get(b'hxl:tag', b'').decode('utf-8'))
+        yield headers
+        if any(tags):
+            yield tags
+        for batch in self._gen_batches():
+            columns = [column.to_pylist() for column in batch.columns]
+            for values in zip(*columns):
+                yield ['' if value is None else str(value) for value in values]
+
+    @abc.abstractmethod
+    def _get_schema(self):
+        """@returns: the C{pyarrow.Schema} for the source"""
+
+    @abc.abstractmethod
+    def _gen_batches(self):
+        """Generate C{pyarrow.RecordBatch} objects from the source (restarting each time)."""
+
+    def _open(self):
+        """@returns: the source, ready to read from the start"""
+        if isinstance(self._source, pyarrow.Buffer):
+            return pyarrow.BufferReader(self._source)
+        elif isinstance(self._source, six.string_types):
+            return pyarrow.memory_map(self._source)
+        else:
+            self._source.seek(0)
+            return self._source
+
+
+class ParquetInput(AbstractArrowInput):
+    """Iterable: Read raw input from a Parquet file, one row group at a time.
+    Requires the optional C{pyarrow} package.
+    """
+
+    FORMAT = 'parquet'
+
+    def _get_schema(self):
+        return pyarrow.parquet.ParquetFile(self._open()).schema_arrow
+
+    def _gen_batches(self):
+        return pyarrow.parquet.ParquetFile(self._open()).iter_batches(batch_size=ARROW_BATCH_SIZE)
+
+
+class ArrowInput(AbstractArrowInput):
+    """Iterable: Read raw input from an Arrow IPC (Feather v2) file, one record batch at a time.
+    Requires the optional C{pyarrow} package.
+    """
+
+    FORMAT = 'arrow'
+
+    def _get_schema(self):
+        return pyarrow.ipc.open_file(self._open()).schema
+
+    def _gen_batches(self):
+        reader = pyarrow.ipc.open_file(self._open())
+        for i in range(reader.num_record_batches):
+            yield reader.get_batch(i)
+
+
+class SQLiteInput(AbstractInput):
+    """Iterable: Read raw input from a table created by L{write_sqlite}.
+
+    The input is a SQL query rather than a stream, and
+    L{hxl.filters.from_recipe} can push some filter stages down into it
+    (see L{derive}), so that SQLite does the selecting, sorting and
+    grouping. HXL-specific logic that SQL can't express exactly (row
+    queries, sort keys, and aggregators) runs in Python functions
+    registered with SQLite, so the results are identical to the Python
+    filters.
+
+    Every query returns a C{_row} column giving the output order,
+    followed by one column for each HXL column. Trailing NULLs are
+    removed from each row, so short rows come back as they went in.
+    """
+
+    FORMAT = 'sqlite'
+
+    def __init__(self, filename, table=SQLITE_DEFAULT_TABLE):
+        """Constructor
+        @param filename: the SQLite database file
+        @param table: the name of the table created by L{write_sqlite}
+        @exception HXLIOException: if the table doesn't exist
+        """
+        super().__init__()
+        self.is_repeatable = True
+        self.filename = filename
+        self.table = table
+        connection = sqlite3.connect(filename)
+        try:
+            rows = connection.execute(
+                'SELECT header, tag FROM hxl_columns WHERE table_name=? ORDER BY column_number', (table,)
+            ).fetchall()
+            # value columns (may be more than the HXL columns, for extra untagged cells)
+            self.width = len(connection.execute('PRAGMA table_info({})'.format(self.quote(table))).fetchall()) - 1
+        except sqlite3.Error as e:
+            raise HXLIOException("Cannot read HXL metadata from SQLite database {} ({})".format(filename, str(e)))
+        finally:
+            connection.close()
+        if not rows:
+            raise HXLIOException("No HXL table {} in SQLite database {}".format(table, filename))
+        self.headers = [row[0] for row in rows]
+        self.tags = [row[1] for row in rows]
+        self.sql = 'SELECT _row{} FROM {}'.format(
+            ''.join([', c{}'.format(i) for i in range(self.width)]),
+            self.quote(table)
+        )
+        self._functions = []
+        self._aggregates = []
+
+    def __iter__(self):
+        yield self.headers
+        yield self.tags
+        connection = sqlite3.connect(self.filename)
+        try:
+            for name, function in self._functions:
+                connection.create_function(name, -1, function)
+            for name, aggregate in self._aggregates:
+                connection.create_aggregate(name, -1, aggregate)
+            for row in connection.execute('SELECT * FROM ({}) ORDER BY _row'.format(self.sql)):
+                yield self.make_values(row[1:])
+        finally:
+            connection.close()
+
+    def derive(self, sql, columns, functions={}, aggregates={}, width=None):
+        """Make a new input that runs another query over the results of this one.
+        @param sql: a query that returns C{_row} and the new values as C{c0}, C{c1}, etc.; C{{source}} stands for this input's query, and C{{name}} for a unique name for each function or aggregate
+        @param columns: the L{hxl.model.Column} objects for the new query's values
+        @param functions: a dict of placeholder names and Python functions to register
+        @param aggregates: a dict of placeholder names and Python aggregate classes to register
+        @param width: the number of value columns, if not the same as the number of HXL columns
+        @returns: a new L{SQLiteInput}
+        """
+        names = {}
+        result = copy.copy(self)
+        result._functions = list(self._functions)
+        result._aggregates = list(self._aggregates)
+        for placeholder, function in functions.items():
+            names[placeholder] = 'hxl_fn{}'.format(len(result._functions) + len(result._aggregates))
+            result._functions.append((names[placeholder], function,))
+        for placeholder, aggregate in aggregates.items():
+            names[placeholder] = 'hxl_fn{}'.format(len(result._functions) + len(result._aggregates))
+            result._aggregates.append((names[placeholder], aggregate,))
+        result.sql = sql.format(source='({})'.format(self.sql), **names)
+        result.headers = [column.header or '' for column in columns]
+        result.tags = [column.display_tag or '' for column in columns]
+        result.width = len(columns) if width is None else width
+        return result
+
+    @property
+    def value_columns(self):
+        """@returns: the SQL column names for the values, as a comma-separated string"""
+        return ', '.join(['c{}'.format(i) for i in range(self.width)])
+
+    @staticmethod
+    def make_values(row):
+        """Convert SQL results to raw HXL values, removing trailing NULLs.
+        @param row: a sequence of SQL values (without C{_row})
+        @returns: a list of values
+        """
+        values = list(row)
+        while values and values[-1] is None:
+            values.pop()
+        return ['' if value is None else value for value in values]
+
+    @staticmethod
+    def quote(name):
+        """Quote a SQL identifier."""
+        return '"{}"'.format(name.replace('"', '""'))
+
+    @staticmethod
+    def from_url(url, allow_local=False):
+        """Open a C{sqlite:///I{filename}?table=I{table}} URL.
+        As in SQLAlchemy, the filename is relative unless it starts with another "/".
+        @param url: the URL to open
+        @param allow_local: must be True, since the database is a local file
+        @returns: a new L{SQLiteInput}
+        """
+        if not allow_local:
+            logger.critical('Tried to open local SQLite database %s with allow_local set to False', url)
+            raise HXLIOException("Only http(s) and (s)ftp URLs allowed: {}".format(url), url=url)
+        result = re.match(SQLITE_URL, url)
+        params = urllib.parse.parse_qs(result.group(2) or '')
+        table = params.get('table', [SQLITE_DEFAULT_TABLE])[0]
+        return SQLiteInput(urllib.parse.unquote(result.group(1)), table)
 
 
 class ArrayInput(AbstractInput):
     """Iterable: read raw input from an array."""
 
+    FORMAT = 'array'
+
     def __init__(self, data):
         super().__init__()
         self.data = data
@@ -949,6 +3198,222 @@ class ArrayInput(AbstractInput):
         return iter(self.data)
 
 
+class SharedInput(AbstractInput):
+    """Iterable: a replayable view of an input shared through a L{SourceRegistry}.
+
+    Raw rows are read from the underlying input only once, the first
+    time any view asks for them, and kept for the other views (and
+    for later passes through the same view).
+    """
+
+    class Rows:
+        """The underlying input and the raw rows read from it so far (shared by all views).
+        The input isn't opened until it's needed, and is closed as soon as it has been
+        read to the end.
+        """
+
+        def __init__(self, open):
+            """
+            @param open: a function that opens the underlying input (a child class of L{AbstractInput})
+            """
+            self.input = None
+            self.rows = []
+            self._open = open
+            self._iter = None
+            self._is_finished = False
+            self._lock = threading.Lock()
+
+        def open(self):
+            """@returns: the underlying input, opening it first if necessary"""
+            with self._lock:
+                if self.input is None:
+                    self._start()
+                return self.input
+
+        def get(self, index):
+            """@returns: the raw row at index, or None past the end of the input"""
+            if index >= len(self.rows) and not self._is_finished:
+                with self._lock:
+                    if self._iter is None and index >= len(self.rows) and not self._is_finished:
+                        self._start()
+                    while index >= len(self.rows) and not self._is_finished:
+                        try:
+                            self.rows.append(next(self._iter))
+                        except StopIteration:
+                            self._is_finished = True
+                            self._close()
+            return self.rows[index] if index < len(self.rows) else None
+
+        def close(self):
+            """Close the underlying input, if it's open.
+            The rows already read stay available; if a view needs more, the input is
+            opened again, skipping the rows already read.
+            """
+            with self._lock:
+                self._close()
+
+        def _start(self):
+            if self.input is not None:
+                logger.debug('Reopening shared source after %d rows', len(self.rows))
+            self.input = self._open()
+            self._iter = itertools.islice(iter(self.input), len(self.rows), None)
+
+        def _close(self):
+            if self._iter is not None:
+                self._iter = None
+                self.input.__exit__(None, None, None)
+
+    def __init__(self, rows):
+        """Constructor
+        @param rows: the shared L{SharedInput.Rows} object
+        """
+        super().__init__()
+        self.shared = rows
+        self.is_repeatable = True
+
+    def __exit__(self, value, type, traceback):
+        self.shared.close()
+
+    @property
+    def stats(self):
+        """Counters for reading the shared input (see L{IOStats})"""
+        return self.shared.open().stats
+
+    @stats.setter
+    def stats(self, stats):
+        pass # always the shared input's counters
+
+    @property
+    def FORMAT(self):
+        return self.shared.open().FORMAT
+
+    def __iter__(self):
+        index = 0
+        while True:
+            row = self.shared.get(index)
+            if row is None:
+                return
+            yield list(row) # a copy, in case a filter changes it
+            index += 1
+
+
+class SourceRegistry(object):
+    """Open each source only once, within a scope.
+
+    A recipe can refer to the same URL several times (e.g. as a merge
+    source, a replacement map, and an append source, or in several
+    C{#valid_value+url} columns of a schema). Inside a registry's
+    C{with} block, L{data} opens each distinct URL or filename only
+    once, and hands out L{HXLReader}s over replayable
+    L{SharedInput} views of it. Sources are the same if they have the
+    same resolved URL (see L{munge_url}) or absolute path, and the same
+    options (apart from C{timeout}, C{range_workers}, and C{progress},
+    which don't change the content).
+
+    Registry scopes can nest: L{source_registry} joins the active
+    registry if there is one. A source isn't opened until a view
+    needs it, and is closed once it has been read to the end, or at
+    the end of the scope. Views stay usable after the scope ends (one
+    that needs rows that weren't read yet opens the source again), but
+    they keep the rows they share in memory, so use a registry only
+    for sources that will be read more than once.
+
+    Usage::
+
+      with hxl.io.SourceRegistry():
+          source = hxl.data(url)
+          merged = hxl.data(url2).merge_data(url, keys='#adm1+code', tags='#adm1+name')
+    """
+
+    IGNORED_OPTIONS = ['timeout', 'range_workers', 'progress']
+    """Options for L{data} that don't affect the content of a source"""
+
+    _active = contextvars.ContextVar('hxl_source_registry', default=None)
+
+    def __init__(self, shared=None):
+        """
+        @param shared: if not None, share only these sources (URLs or filenames), and open any others as usual
+        """
+        super().__init__()
+        self.sources = {}
+        """Shared rows for each source (L{SharedInput.Rows}), by key"""
+        self.shared = None if shared is None else set([self.resolve(source) for source in shared])
+        """Resolved locations of the sources to share (see L{resolve}), or None to share all"""
+        self._lock = threading.Lock()
+        self._tokens = []
+
+    @classmethod
+    def current(cls):
+        """@returns: the active registry, or None if not inside a registry scope"""
+        return cls._active.get()
+
+    def __enter__(self):
+        self._tokens.append(self._active.set(self))
+        return self
+
+    def __exit__(self, value, type, traceback):
+        self._active.reset(self._tokens.pop())
+        if not self._tokens:
+            # end of the outermost scope for this registry
+            for rows in self.sources.values():
+                rows.close()
+            self.sources.clear()
+
+    def data(self, data, **kwargs):
+        """Open a URL or filename, or reuse it if it's already open in this registry.
+        @param data: the URL or filename
+        @param kwargs: the other options for L{hxl.io.data}
+        @returns: a L{HXLReader} over a new view of the source
+        """
+        key = self.make_key(data, kwargs)
+        if self.shared is not None and key[0] not in self.shared:
+            # read only once, so there's no point keeping its rows
+            return HXLReader(make_input(data, **kwargs))
+        with self._lock:
+            rows = self.sources.get(key)
+            if rows is None:
+                logger.debug('Opening shared source %s', data)
+                rows = SharedInput.Rows(lambda: make_input(data, **kwargs))
+                self.sources[key] = rows
+            else:
+                logger.debug('Reusing shared source %s', data)
+        return HXLReader(SharedInput(rows))
+
+    @staticmethod
+    def resolve(data, options={}):
+        """Resolve a source's location, so that different ways of referring to it match.
+        @param data: the URL or filename
+        @param options: a dict of options for L{hxl.io.data}
+        @returns: the resolved URL (see L{munge_url}) or absolute path
+        """
+        if re.match(r'^(?:https?|s?ftp)://', data):
+            try:
+                return munge_url(data, options.get('verify_ssl', True), options.get('http_headers'))
+            except Exception as e:
+                logger.warning('Cannot resolve URL %s for sharing (%s)', data, str(e))
+                return data
+        elif not re.match(SQLITE_URL, data):
+            return os.path.abspath(data)
+        else:
+            return data
+
+    @classmethod
+    def make_key(cls, data, options):
+        """Make a key for matching duplicate sources.
+        @param data: the URL or filename
+        @param options: a dict of options for L{hxl.io.data}
+        @returns: a hashable key, starting with the resolved location (see L{resolve})
+        """
+        key = [cls.resolve(data, options)]
+        for name in sorted(options):
+            if name not in cls.IGNORED_OPTIONS:
+                value = options[name]
+                if isinstance(value, dict):
+                    value = tuple(sorted(value.items()))
+                key.append((name, value,))
+        return tuple(key)
+
+
 class HXLReader(hxl.model.Dataset):
     """Read HXL data from a raw input source
     This class is an iterable.
@@ -960,11 +3425,11 @@ class HXLReader(hxl.model.Dataset):
         @param input: a child class of L{hxl.io.AbstractInput}
         """
         self._input = input
-        # TODO - for repeatable raw input, start a new iterator each time
-        # TODO - need to figure out how to handle columns in a repeatable situation
         self._iter = iter(self._input)
         self._columns = None
-        self._source_row_number = -1 # TODO this belongs in the iterator
+        self._source_row_number = -1
+        self._header_row_count = None # raw rows up to and including the hashtag row
+        self._is_iter_claimed = False
         
     def __enter__(self):
         """Context-start support."""
@@ -980,11 +3445,23 @@ class HXLReader(hxl.model.Dataset):
     def __iter__(self):
         return HXLReader.HXLIter(self)
 
+    @property
+    def input(self):
+        """The low-level input source (a child class of L{AbstractInput})"""
+        return self._input
+
+    @property
+    def stats(self):
+        """Counters for reading the input (see L{IOStats})"""
+        return self._input.stats
+
     @property
     def is_cached(self):
-        """If the low-level input is repeatable, then the data is cached."""
-        #return self._input.is_repeatable
-        return False # FIXME until we know that HXLReader is repeatable
+        """If the low-level input is repeatable, then the data is cached.
+        Each iteration after the first starts a new pass through the raw input,
+        so multi-pass filters can read the data again instead of caching it in memory.
+        """
+        return self._input.is_repeatable
 
     @property
     def columns(self):
@@ -992,8 +3469,24 @@ class HXLReader(hxl.model.Dataset):
         """
         if self._columns is None:
             self._columns = self._find_tags()
+            self._header_row_count = self._source_row_number + 1
         return self._columns
 
+    def _start_iteration(self):
+        """Get a raw iterator positioned after the hashtag row.
+        The first iteration (or every iteration, for non-repeatable input)
+        continues from the rows already read to find the hashtags.
+        @returns: a raw-row iterator, or None to share the main one
+        """
+        if self._is_iter_claimed and self._input.is_repeatable:
+            raw_iter = iter(self._input)
+            for i in range(self._header_row_count):
+                self._next_raw(raw_iter)
+            return raw_iter
+        else:
+            self._is_iter_claimed = True
+            return None
+
     def _find_tags(self):
         """
         Go fishing for the HXL hashtag row in the first 25 rows.
@@ -1053,7 +3546,19 @@ class HXLReader(hxl.model.Dataset):
     def _get_row(self):
         """Parse a row of raw CSV data.  Returns an array of strings."""
         self._source_row_number += 1
-        return next(self._iter)
+        return self._next_raw(self._iter)
+
+    def _next_raw(self, raw_iter):
+        """Get the next raw row from an input iterator, counting the time spent."""
+        stats = self._input.stats
+        start = time.perf_counter()
+        try:
+            return next(raw_iter)
+        except StopIteration:
+            stats.finish()
+            raise
+        finally:
+            stats.read_time += time.perf_counter() - start
 
     class HXLIter:
         """Internal iterator class"""
@@ -1061,6 +3566,9 @@ class HXLReader(hxl.model.Dataset):
         def __init__(self, outer):
             self.outer = outer
             self.row_number = -1
+            self._is_started = False
+            self._raw_iter = None # if None, use the outer object's shared iterator
+            self._source_row_number = None
 
         def __next__(self):
             """ Iterable function to return the next row of HXL values.
@@ -1068,9 +3576,20 @@ class HXLReader(hxl.model.Dataset):
             @exception StopIterationException: at the end of the dataset
             """
             columns = self.outer.columns
-            values = self.outer._get_row()
+            if not self._is_started:
+                self._is_started = True
+                self._raw_iter = self.outer._start_iteration()
+                self._source_row_number = self.outer._header_row_count - 1
+            if self._raw_iter is None:
+                values = self.outer._get_row()
+                source_row_number = self.outer._source_row_number
+            else:
+                values = self.outer._next_raw(self._raw_iter)
+                self._source_row_number += 1
+                source_row_number = self._source_row_number
+            self.outer._input.stats.record_row()
             self.row_number += 1
-            return hxl.model.Row(columns=columns, values=values, row_number=self.row_number, source_row_number=self.outer._source_row_number)
+            return hxl.model.Row(columns=columns, values=values, row_number=self.row_number, source_row_number=source_row_number)
 
 
 def from_spec(spec):
@@ -1088,6 +3607,10 @@ def from_spec(spec):
     verify_ssl = spec.get('verify_ssl', True)
     http_headers = spec.get('http_headers', None)
     encoding = spec.get('encoding', None)
+    incremental_json = spec.get('incremental_json', False)
+    json_lookahead = spec.get('json_lookahead', None)
+    zip_members = spec.get('zip_members', None)
+    range_workers = spec.get('range_workers', None)
 
     # recipe
     tagger_spec = spec.get('tagger', None)
@@ -1104,7 +3627,11 @@ def from_spec(spec):
         timeout=timeout,
         verify_ssl=verify_ssl,
         http_headers=http_headers,
-        encoding=encoding
+        encoding=encoding,
+        incremental_json=incremental_json,
+        json_lookahead=json_lookahead,
+        zip_members=zip_members,
+        range_workers=range_workers
     )
 
     # autotag if requested
@@ -25,6 +25,9 @@ import hxl
 
 logger = logging.getLogger(__name__)
 
+BATCH_SIZE = 1000
+"""Default number of rows in a batch (see L{Dataset.batches})"""
+
 
 class TagPattern(object):
     """Pattern for matching a HXL hashtag and attributes
@@ -263,6 +266,27 @@ class Dataset(object):
         """
         raise RuntimeException("child class must implement __iter__() method")
 
+    def batches(self, size=None):
+        """Iterate over the rows in lists, rather than one at a time.
+        Streaming filters pass batches from one stage to the next
+        (see L{hxl.filters.AbstractStreamingFilter.filter_batch}), which
+        saves a lot of per-row overhead in long filter chains.
+        By default, this method just groups the rows from L{__iter__};
+        subclasses may override.
+        @param size: the maximum number of rows in a batch (default: L{BATCH_SIZE})
+        @returns: an iterator that returns non-empty lists of L{hxl.model.Row} objects
+        """
+        if not size:
+            size = BATCH_SIZE
+        batch = []
+        for row in self:
+            batch.append(row)
+            if len(batch) >= size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
     @property
     def is_cached(self):
         """Test whether the source data is cached (replayable).
@@ -551,16 +575,26 @@ class Dataset(object):
         import hxl.filters
         return hxl.filters.RowFilter(self, queries=queries, reverse=True, mask=mask)
 
-    def sort(self, keys=None, reverse=False):
-        """Sort the dataset (caching)."""
+    def sort(self, keys=None, reverse=False, memory_limit=None, limit=None):
+        """Sort the dataset (caching).
+        @param keys: tag patterns for the sort keys (default: all columns, left to right)
+        @param reverse: if True, sort in descending order
+        @param memory_limit: if set, the approximate number of bytes to sort in memory before spilling to temporary files
+        @param limit: if set, return only this many rows from the start of the sorted data (e.g. the top 50)
+        """
         import hxl.filters
-        return hxl.filters.SortFilter(self, tags=keys, reverse=reverse)
-
-    def count(self, patterns=[], aggregators=None, queries=[]):
-        """Count values in the dataset (caching)."""
+        return hxl.filters.SortFilter(self, tags=keys, reverse=reverse, memory_limit=memory_limit, limit=limit)
+
+    def count(self, patterns=[], aggregators=None, queries=[], memory_limit=None):
+        """Count values in the dataset (caching).
+        @param patterns: tag patterns for the columns to group by
+        @param aggregators: aggregator specs for the output values (default: a row count)
+        @param queries: row queries for the rows to count
+        @param memory_limit: if set, the approximate number of bytes of groups to keep in memory before partitioning them to temporary files
+        """
         import hxl.filters
         return hxl.filters.CountFilter(
-            self, patterns=patterns, aggregators=aggregators, queries=queries
+            self, patterns=patterns, aggregators=aggregators, queries=queries, memory_limit=memory_limit
         )
 
     def row_counter(self, queries=[]):
@@ -657,6 +691,30 @@ class Dataset(object):
         import hxl.filters
         return hxl.filters.FillDataFilter(self, patterns=patterns, queries=queries)
 
+    def parallel(self, workers=None, batch_size=None):
+        """Start a segment of filters that runs in a pool of worker processes.
+        Only stateless, row-by-row filters (such as clean_data, replace_data,
+        with_rows or add_columns) can join the segment; the first other filter
+        in the chain runs normally on the segment's output, which keeps the
+        original row order.
+        @param workers: the number of worker processes (default: one per CPU)
+        @param batch_size: the number of rows to send to a worker at once (default: L{BATCH_SIZE})
+        @returns: filtered dataset
+        @see hxl.filters.ParallelFilter
+        """
+        import hxl.filters
+        return hxl.filters.ParallelFilter(self, workers=workers, batch_size=batch_size)
+
+    def prefetch(self, batches=None, batch_size=None):
+        """Read ahead from this dataset in a background thread.
+        @param batches: the maximum number of batches to read ahead (default: L{hxl.filters.PrefetchFilter.DEFAULT_BATCHES})
+        @param batch_size: the number of rows in each batch (default: L{BATCH_SIZE})
+        @returns: filtered dataset
+        @see hxl.filters.PrefetchFilter
+        """
+        import hxl.filters
+        return hxl.filters.PrefetchFilter(self, batches=batches, batch_size=batch_size)
+
     #
     # Generators
     #
@@ -708,6 +766,38 @@ class Dataset(object):
                     yield ",\n" + json.dumps(raw)
         yield "\n]\n"
 
+    #
+    # Conversions
+    #
+
+    def to_sqlite(self, filename, table=None):
+        """Store the dataset in a SQLite database table.
+        Read it back with C{hxl.data("sqlite:///I{filename}?table=I{table}", allow_local=True)}.
+        @param filename: the SQLite database file
+        @param table: the name of the table to create or replace (default: L{hxl.io.SQLITE_DEFAULT_TABLE})
+        @see: L{hxl.io.write_sqlite}
+        """
+        import hxl.io
+        hxl.io.write_sqlite(filename, self, table=table or hxl.io.SQLITE_DEFAULT_TABLE)
+
+    def to_arrow(self, batch_size=None):
+        """Convert the dataset to an Arrow record-batch stream (requires pyarrow).
+        @param batch_size: the number of rows in each batch (default: L{hxl.io.ARROW_BATCH_SIZE})
+        @returns: a C{pyarrow.RecordBatchReader}
+        @see: L{hxl.io.to_arrow}
+        """
+        import hxl.io
+        return hxl.io.to_arrow(self, batch_size=batch_size or hxl.io.ARROW_BATCH_SIZE)
+
+    def write_parquet(self, output, batch_size=None):
+        """Write the dataset to Parquet, one record batch at a time (requires pyarrow).
+        @param output: a filename or binary output stream
+        @param batch_size: the number of rows in each batch (default: L{hxl.io.ARROW_BATCH_SIZE})
+        @see: L{hxl.io.write_parquet}
+        """
+        import hxl.io
+        hxl.io.write_parquet(output, self, batch_size=batch_size or hxl.io.ARROW_BATCH_SIZE)
+
 
 class Column(object):
     """
@@ -862,7 +952,7 @@ class Row(object):
         @param source_row_number: (optional) The zero-based source row number in the input dataset, if available (default: None)
         """
         self.columns = columns
-        self.values = copy.copy(values)
+        self.values = list(values)
         self.row_number = row_number
         self.source_row_number = source_row_number
 
@@ -1030,6 +1120,7 @@ class RowQuery(object):
         self.date_value = None
         self.number_value = None
         self._saved_indices = None
+        self._saved_columns = None
 
     def calc_aggregate(self, dataset):
         """Calculate the aggregate value that we need for the row query
@@ -1111,12 +1202,13 @@ class RowQuery(object):
         return self.op(hxl.datatypes.normalise_string(value), self.string_value)
 
     def _get_saved_indices(self, columns):
-        """Cache the column tests, so that we run them only once."""
-        # FIXME - assuming that the columns never change
-        self._saved_indices = []
-        for i in range(len(columns)):
-            if self.pattern.match(columns[i]):
-                self._saved_indices.append(i)
+        """Cache the column tests, so that we run them only once for each list of columns."""
+        if self._saved_indices is None or self._saved_columns is not columns:
+            self._saved_columns = columns
+            self._saved_indices = []
+            for i in range(len(columns)):
+                if self.pattern.match(columns[i]):
+                    self._saved_indices.append(i)
         return self._saved_indices
 
     @staticmethod
@@ -138,9 +138,9 @@ def hxladd_main(args, stdin=STDIN, stdout=sys.stdout, stderr=sys.stderr):
 
     do_common_args(args)
 
-    with make_source(args, stdin) as source, make_output(args, stdout) as output:
+    with make_source(args, stdin, stderr) as source, make_output(args, stdout) as output:
         filter = hxl.filters.AddColumnsFilter(source, specs=args.spec, before=args.before)
-        hxl.io.write_hxl(output.output, filter, show_tags=not args.strip_tags)
+        write_output(args, output, filter, show_tags=not args.strip_tags)
 
     return EXIT_OK
 
@@ -192,14 +192,14 @@ def hxlappend_main(args, stdin=STDIN, stdout=sys.stdout, stderr=sys.stderr):
         for append_source in hxl.filters.AppendFilter.parse_external_source_list(hxl.data(list_source, True)):
             append_sources.append(hxl.data(append_source, True))
 
-    with make_source(args, stdin) as source, make_output(args, stdout) as output:
+    with make_source(args, stdin, stderr) as source, make_output(args, stdout) as output:
         filter = hxl.filters.AppendFilter(
             source,
             append_sources=append_sources,
             add_columns=(not args.exclude_extra_columns),
             queries=args.query
         )
-        hxl.io.write_hxl(output.output, filter, show_headers=not args.remove_headers, show_tags=not args.strip_tags)
+        write_output(args, output, filter, show_headers=not args.remove_headers, show_tags=not args.strip_tags)
 
     return EXIT_OK
 
@@ -281,14 +281,14 @@ def hxlclean_main(args, stdin=STDIN, stdout=sys.stdout, stderr=sys.stderr):
     
     do_common_args(args)
 
-    with make_source(args, stdin) as source, make_output(args, stdout) as output:
+    with make_source(args, stdin, stderr) as source, make_output(args, stdout) as output:
 
         filter = hxl.filters.CleanDataFilter(
             source, whitespace=args.whitespace, upper=args.upper, lower=args.lower,
             date=args.date, date_format=args.date_format, number=args.number, number_format=args.number_format,
             latlon=args.latlon, purge=args.purge, queries=args.query
         )
-        hxl.io.write_hxl(output.output, filter, show_headers=not args.remove_headers, show_tags=not args.strip_tags)
+        write_output(args, output, filter, show_headers=not args.remove_headers, show_tags=not args.strip_tags)
 
     return EXIT_OK
 
@@ -321,15 +321,28 @@ def hxlcount_main(args, stdin=STDIN, stdout=sys.stdout, stderr=sys.stderr):
         type=hxl.filters.Aggregator.parse,
         default=[]
         )
+    parser.add_argument(
+        '-m',
+        '--memory-limit',
+        help='Keep at most this many megabytes of groups in memory, using temporary files for the rest.',
+        metavar='MB',
+        type=float
+        )
     add_queries_arg(parser, 'Count only rows that match at least one query.')
 
     args = parser.parse_args(args)
 
     do_common_args(args)
 
-    with make_source(args, stdin) as source, make_output(args, stdout) as output:
-        filter = hxl.filters.CountFilter(source, patterns=args.tags, aggregators=args.aggregator, queries=args.query)
-        hxl.io.write_hxl(output.output, filter, show_tags=not args.strip_tags)
+    memory_limit = None
+    if args.memory_limit is not None:
+        memory_limit = int(args.memory_limit * 1024 * 1024)
+
+    with make_source(args, stdin, stderr) as source, make_output(args, stdout) as output:
+        filter = hxl.filters.CountFilter(
+            source, patterns=args.tags, aggregators=args.aggregator, queries=args.query, memory_limit=memory_limit
+        )
+        write_output(args, output, filter, show_tags=not args.strip_tags)
 
     return EXIT_OK
 
@@ -354,9 +367,9 @@ def hxlcut_main(args, stdin=STDIN, stdout=sys.stdout, stderr=sys.stderr):
 
     do_common_args(args)
 
-    with make_source(args, stdin) as source, make_output(args, stdout) as output:
+    with make_source(args, stdin, stderr) as source, make_output(args, stdout) as output:
         filter = hxl.filters.ColumnFilter(source, args.include, args.exclude)
-        hxl.io.write_hxl(output.output, filter, show_tags=not args.strip_tags)
+        write_output(args, output, filter, show_tags=not args.strip_tags)
 
     return EXIT_OK
 
@@ -376,9 +389,9 @@ def hxldedup_main(args, stdin=STDIN, stdout=sys.stdout, stderr=sys.stderr):
 
     do_common_args(args)
 
-    with make_source(args, stdin) as source, make_output(args, stdout) as output:
+    with make_source(args, stdin, stderr) as source, make_output(args, stdout) as output:
         filter = hxl.filters.DeduplicationFilter(source, args.tags, args.query)
-        hxl.io.write_hxl(output.output, filter, show_tags=not args.strip_tags)
+        write_output(args, output, filter, show_tags=not args.strip_tags)
 
     return EXIT_OK
 
@@ -401,7 +414,7 @@ def hxlhash_main(args, stdin=STDIN, stdout=sys.stdout, stderr=sys.stderr):
 
     do_common_args(args)
 
-    with make_source(args, stdin) as source:
+    with make_source(args, stdin, stderr) as source:
         if args.headers_only:
             print(source.columns_hash)
         else:
@@ -465,13 +478,13 @@ def hxlmerge_main(args, stdin=STDIN, stdout=sys.stdout, stderr=sys.stderr):
 
     do_common_args(args)
 
-    with make_source(args, stdin) as source, make_output(args, stdout) as output, hxl.io.data(args.merge, True) if args.merge else None as merge_source:
+    with make_source(args, stdin, stderr) as source, make_output(args, stdout) as output, hxl.io.data(args.merge, True) if args.merge else None as merge_source:
         filter = hxl.filters.MergeDataFilter(
             source, merge_source=merge_source,
             keys=args.keys, tags=args.tags, replace=args.replace, overwrite=args.overwrite, 
             queries=args.query
         )
-        hxl.io.write_hxl(output.output, filter, show_tags=not args.strip_tags)
+        write_output(args, output, filter, show_tags=not args.strip_tags)
 
     return EXIT_OK
 
@@ -499,9 +512,9 @@ def hxlrename_main(args, stdin=STDIN, stdout=sys.stdout, stderr=sys.stderr):
 
     do_common_args(args)
 
-    with make_source(args, stdin) as source, make_output(args, stdout) as output:
+    with make_source(args, stdin, stderr) as source, make_output(args, stdout) as output:
         filter = hxl.filters.RenameFilter(source, args.rename)
-        hxl.io.write_hxl(output.output, filter, show_tags=not args.strip_tags)
+        write_output(args, output, filter, show_tags=not args.strip_tags)
 
     return EXIT_OK
 
@@ -561,7 +574,7 @@ def hxlreplace_main(args, stdin=STDIN, stdout=sys.stdout, stderr=sys.stderr):
 
     do_common_args(args)
 
-    with make_source(args, stdin) as source, make_output(args, stdout) as output:
+    with make_source(args, stdin, stderr) as source, make_output(args, stdout) as output:
         if args.map:
             replacements = hxl.filters.ReplaceDataFilter.Replacement.parse_map(hxl.io.data(args.map, True))
         else:
@@ -570,7 +583,7 @@ def hxlreplace_main(args, stdin=STDIN, stdout=sys.stdout, stderr=sys.stderr):
             for tag in args.tags:
                 replacements.append(hxl.filters.ReplaceDataFilter.Replacement(args.pattern, args.substitution, tag, args.regex))
         filter = hxl.filters.ReplaceDataFilter(source, replacements, queries=args.query)
-        hxl.io.write_hxl(output.output, filter, show_tags=not args.strip_tags)
+        write_output(args, output, filter, show_tags=not args.strip_tags)
 
     return EXIT_OK
 
@@ -599,9 +612,9 @@ def hxlfill_main(args, stdin=STDIN, stdout=sys.stdout, stderr=sys.stderr):
 
     do_common_args(args)
 
-    with make_source(args, stdin) as source, make_output(args, stdout) as output:
+    with make_source(args, stdin, stderr) as source, make_output(args, stdout) as output:
         filter = hxl.filters.FillDataFilter(source, pattern=args.tag, queries=args.query)
-        hxl.io.write_hxl(output.output, filter, show_tags=not args.strip_tags)
+        write_output(args, output, filter, show_tags=not args.strip_tags)
 
     return EXIT_OK
 
@@ -637,9 +650,9 @@ def hxlexplode_main(args, stdin=STDIN, stdout=sys.stdout, stderr=sys.stderr):
 
     do_common_args(args)
 
-    with make_source(args, stdin) as source, make_output(args, stdout) as output:
+    with make_source(args, stdin, stderr) as source, make_output(args, stdout) as output:
         filter = hxl.filters.ExplodeFilter(source, header_attribute=args.header_att, value_attribute=args.value_att)
-        hxl.io.write_hxl(output.output, filter, show_tags=not args.strip_tags)
+        write_output(args, output, filter, show_tags=not args.strip_tags)
 
     return EXIT_OK
 
@@ -677,9 +690,9 @@ def hxlimplode_main(args, stdin=STDIN, stdout=sys.stdout, stderr=sys.stderr):
 
     do_common_args(args)
 
-    with make_source(args, stdin) as source, make_output(args, stdout) as output:
+    with make_source(args, stdin, stderr) as source, make_output(args, stdout) as output:
         filter = hxl.filters.ImplodeFilter(source, label_pattern=args.label, value_pattern=args.value)
-        hxl.io.write_hxl(output.output, filter, show_tags=not args.strip_tags)
+        write_output(args, output, filter, show_tags=not args.strip_tags)
 
     return EXIT_OK
 
@@ -715,9 +728,9 @@ def hxlselect_main(args, stdin=STDIN, stdout=sys.stdout, stderr=sys.stderr):
 
     do_common_args(args)
 
-    with make_source(args, stdin) as source, make_output(args, stdout) as output:
+    with make_source(args, stdin, stderr) as source, make_output(args, stdout) as output:
         filter = hxl.filters.RowFilter(source, queries=args.query, reverse=args.reverse)
-        hxl.io.write_hxl(output.output, filter, show_tags=not args.strip_tags)
+        write_output(args, output, filter, show_tags=not args.strip_tags)
 
     return EXIT_OK
 
@@ -747,13 +760,31 @@ def hxlsort_main(args, stdin=STDIN, stdout=sys.stdout, stderr=sys.stderr):
         const=True,
         default=False
         )
+    parser.add_argument(
+        '-m',
+        '--memory-limit',
+        help='Sort at most this many megabytes of data in memory, using temporary files for the rest.',
+        metavar='MB',
+        type=float
+        )
+    parser.add_argument(
+        '-n',
+        '--limit',
+        help='Output only the first N rows of the sorted data (e.g. the top 50).',
+        metavar='N',
+        type=int
+        )
     args = parser.parse_args(args)
 
     do_common_args(args)
 
-    with make_source(args, stdin) as source, make_output(args, stdout) as output:
-        filter = hxl.filters.SortFilter(source, args.tags, args.reverse)
-        hxl.io.write_hxl(output.output, filter, show_tags=not args.strip_tags)
+    memory_limit = None
+    if args.memory_limit is not None:
+        memory_limit = int(args.memory_limit * 1024 * 1024)
+
+    with make_source(args, stdin, stderr) as source, make_output(args, stdout) as output:
+        filter = hxl.filters.SortFilter(source, args.tags, args.reverse, memory_limit=memory_limit, limit=args.limit)
+        write_output(args, output, filter, show_tags=not args.strip_tags)
 
     return EXIT_OK
 
@@ -794,9 +825,9 @@ def hxltag_main(args, stdin=STDIN, stdout=sys.stdout, stderr=sys.stderr):
     )
     args = parser.parse_args(args)
 
-    with hxl.io.make_input(args.infile or stdin, allow_local=True) as input, make_output(args, stdout) as output:
+    with hxl.io.make_input(args.infile or stdin, allow_local=True, progress=make_progress(args, stderr)) as input, make_output(args, stdout) as output:
         tagger = hxl.converters.Tagger(input, args.map, default_tag=args.default_tag, match_all=args.match_all)
-        hxl.io.write_hxl(output.output, hxl.io.data(tagger), show_tags=not args.strip_tags)
+        write_output(args, output, hxl.io.data(tagger), show_tags=not args.strip_tags)
 
     return EXIT_OK
 
@@ -836,7 +867,7 @@ def hxlvalidate_main(args, stdin=STDIN, stdout=sys.stdout, stderr=sys.stderr):
     )
     args = parser.parse_args(args)
 
-    with hxl.io.make_input(args.infile or stdin, True) as input, make_output(args, stdout) as output:
+    with hxl.io.make_input(args.infile or stdin, True, progress=make_progress(args, stderr)) as input, make_output(args, stdout) as output:
 
         class Counter:
             infos = 0
@@ -961,6 +992,20 @@ def make_args(description, hxl_output=True):
             const=True,
             default=False
         )
+        parser.add_argument(
+            '--output-format',
+            help='Format for the output (default: csv)',
+            metavar='csv|json|xlsx',
+            choices=['csv', 'json', 'xlsx'],
+            default='csv'
+        )
+    parser.add_argument(
+        '--progress',
+        help='Show reading progress and throughput on standard error',
+        action='store_const',
+        const=True,
+        default=False
+    )
     parser.add_argument(
         '--log',
         help='Set minimum logging level',
@@ -986,8 +1031,12 @@ def do_common_args(args):
     logging.basicConfig(format='%(levelname)s (%(name)s): %(message)s', level=args.log.upper())
 
 
-def make_source(args, stdin=STDIN):
-    """Create a HXL input source."""
+def make_source(args, stdin=STDIN, stderr=None):
+    """Create a HXL input source.
+    @param args: the parsed command-line arguments
+    @param stdin: the stream to read if there's no input file
+    @param stderr: the stream for --progress messages (default: sys.stderr)
+    """
 
     # sheet index
     sheet_index = args.sheet
@@ -1010,20 +1059,44 @@ def make_source(args, stdin=STDIN):
         http_headers[parts[0].strip()] = parts[2].strip()
 
     # construct the input object
-    input = hxl.io.make_input(args.infile or stdin, sheet_index=sheet_index, selector=selector, allow_local=True, http_headers=http_headers)
+    input = hxl.io.make_input(args.infile or stdin, sheet_index=sheet_index, selector=selector, allow_local=True, http_headers=http_headers, progress=make_progress(args, stderr))
     return hxl.io.data(input)
 
+def make_progress(args, stderr=None):
+    """Create a progress callback for L{hxl.io.make_input}, if the --progress option is set.
+    @param args: the parsed command-line arguments
+    @param stderr: the stream for progress messages (default: sys.stderr)
+    @returns: a callback function, or None
+    """
+    if not getattr(args, 'progress', False):
+        return None
+    def progress(stats):
+        print(str(stats), file=(stderr or sys.stderr))
+    return progress
+
 def make_output(args, stdout=sys.stdout):
-    """Create an output stream."""
+    """Create an output stream (binary for XLSX output)."""
+    is_binary = (getattr(args, 'output_format', 'csv') == 'xlsx')
     if args.outfile:
-        return FileOutput(args.outfile)
+        return FileOutput(args.outfile, is_binary)
+    elif is_binary:
+        return StreamOutput(getattr(stdout, 'buffer', stdout))
     else:
         return StreamOutput(stdout)
 
+def write_output(args, output, source, show_headers=True, show_tags=True):
+    """Write HXL data in the format selected by --output-format."""
+    if args.output_format == 'xlsx':
+        hxl.io.write_xlsx(output.output, source, show_headers=show_headers, show_tags=show_tags)
+    elif args.output_format == 'json':
+        hxl.io.write_json(output.output, source, show_headers=show_headers, show_tags=show_tags)
+    else:
+        hxl.io.write_hxl(output.output, source, show_headers=show_headers, show_tags=show_tags)
+
 class FileOutput(object):
 
-    def __init__(self, filename):
-        self.output = open(filename, 'w')
+    def __init__(self, filename, is_binary=False):
+        self.output = open(filename, 'wb' if is_binary else 'w')
 
     def __enter__(self):
         return self
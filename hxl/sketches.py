@@ -0,0 +1,217 @@
+"""
+Mergeable sketches for approximate aggregation
+
+A sketch summarises a stream of values in a small, bounded amount of
+memory, so that it's possible to estimate quantiles (such as the
+median) or the number of distinct values for each group in a count
+without keeping every value. Two sketches of the same kind can be
+merged, as if all of the values had gone into one.
+
+License: Public Domain
+Documentation: https://github.com/HXLStandard/libhxl-python/wiki
+"""
+
+import bisect, hashlib, itertools, math
+
+
+class QuantileSketch(object):
+    """Approximate quantiles of a stream of numbers (a KLL sketch).
+
+    The sketch keeps levels of samples; an item at level I{h} stands
+    for 2**I{h} of the original values. When the sketch is full, the
+    lowest full level sorts its items, keeps every second one
+    (alternating between odd and even positions), and moves them to
+    the next level up. The results are exact until the sketch first
+    fills up (about I{k} values), and the memory stays at roughly 3I{k}
+    numbers, however many values are added.
+
+    Usage:
+
+      sketch = QuantileSketch()
+      for value in values:
+          sketch.add(value)
+      median = sketch.quantile(0.5)
+    """
+
+    DEFAULT_K = 200
+    """Default size of the largest level (bigger is more accurate)"""
+
+    SHRINK = 2.0 / 3.0
+    """Each level below the top can hold this fraction of the one above"""
+
+    def __init__(self, k=None):
+        """
+        @param k: the size of the largest level (default: L{DEFAULT_K})
+        """
+        self.k = k or self.DEFAULT_K
+        self.levels = [[]]
+        self.count = 0
+        self._size = 0
+        self._max_size = self._capacity(0)
+        self._odd = False
+
+    def add(self, value):
+        """Add a number to the sketch.
+        @param value: an int or float
+        """
+        self.levels[0].append(value)
+        self.count += 1
+        self._size += 1
+        if self._size >= self._max_size:
+            self._compress()
+
+    def merge(self, other):
+        """Add all of the values from another quantile sketch to this one.
+        @param other: another L{QuantileSketch}
+        """
+        while len(self.levels) < len(other.levels):
+            self._add_level()
+        for level, items in zip(self.levels, other.levels):
+            level.extend(items)
+        self.count += other.count
+        self._size += other._size
+        self._compress()
+
+    def quantile(self, q):
+        """Estimate a quantile, interpolating linearly between neighbouring values.
+        When the sketch is still exact, this is the same as the usual
+        "linear" percentile definition (e.g. the median of 1, 2, 3, 4 is 2.5).
+        @param q: the quantile, from 0 to 1 (e.g. 0.5 for the median)
+        @returns: the estimated value, or None if the sketch is empty
+        """
+        if not self.count:
+            return None
+        items = sorted(
+            (value, 1 << height,) for height, level in enumerate(self.levels) for value in level
+        )
+        cumulative = list(itertools.accumulate(weight for value, weight in items))
+
+        def value_at(position):
+            # the value at a position in the (expanded) sorted list of all values
+            return items[min(bisect.bisect_right(cumulative, position), len(items) - 1)][0]
+
+        position = q * (self.count - 1)
+        lower = int(position)
+        fraction = position - lower
+        below = value_at(lower)
+        if fraction:
+            return below + (value_at(lower + 1) - below) * fraction
+        else:
+            return below
+
+    def _capacity(self, height):
+        """@returns: the maximum number of items at a level"""
+        depth = len(self.levels) - height - 1
+        return max(2, int(math.ceil(self.k * (self.SHRINK ** depth))))
+
+    def _add_level(self):
+        self.levels.append([])
+        self._max_size = sum([self._capacity(height) for height in range(len(self.levels))])
+
+    def _compress(self):
+        """Compact the lowest full level until the sketch is within its total capacity."""
+        while self._size >= self._max_size:
+            for height, level in enumerate(self.levels):
+                if len(level) >= self._capacity(height):
+                    break
+            if height + 1 == len(self.levels):
+                self._add_level()
+            items = sorted(self.levels[height])
+            # an odd item out stays at this level, so no weight is lost
+            self.levels[height] = [items.pop()] if len(items) % 2 else []
+            self._odd = not self._odd
+            promoted = items[int(self._odd)::2]
+            self.levels[height + 1].extend(promoted)
+            self._size -= len(items) - len(promoted)
+
+
+class DistinctSketch(object):
+    """Approximate count of distinct values (HyperLogLog).
+
+    The sketch keeps exact 64-bit hashes of the values until there
+    are more than L{SPARSE_LIMIT}, and then switches to 2**I{precision}
+    one-byte registers. With the default precision, the typical error
+    is under 2%, using 4 KB per sketch.
+
+    Usage:
+
+      sketch = DistinctSketch()
+      for value in values:
+          sketch.add(value)
+      n = sketch.estimate()
+    """
+
+    DEFAULT_PRECISION = 12
+    """Default number of bits for the register index"""
+
+    SPARSE_LIMIT = 256
+    """Maximum number of exact hashes to keep before switching to registers"""
+
+    def __init__(self, precision=None):
+        """
+        @param precision: the number of bits for the register index, from 4 to 16 (default: L{DEFAULT_PRECISION})
+        """
+        self.precision = precision or self.DEFAULT_PRECISION
+        if not 4 <= self.precision <= 16:
+            raise ValueError("Precision must be from 4 to 16: {}".format(self.precision))
+        self.hashes = set()
+        self.registers = None
+
+    @staticmethod
+    def hash(value):
+        """@returns: a stable 64-bit hash of a value's string form (the same in every process)"""
+        return int.from_bytes(hashlib.blake2b(str(value).encode('utf-8'), digest_size=8).digest(), 'big')
+
+    def add(self, value):
+        """Add a value to the sketch.
+        @param value: any value (compared by its string form)
+        """
+        self._add_hash(DistinctSketch.hash(value))
+
+    def merge(self, other):
+        """Add all of the values from another distinct-count sketch to this one.
+        @param other: another L{DistinctSketch} with the same precision
+        @exception ValueError: if the precisions are different
+        """
+        if other.precision != self.precision:
+            raise ValueError("Can't merge distinct-count sketches with different precisions")
+        if other.registers is None:
+            for hash in other.hashes:
+                self._add_hash(hash)
+        else:
+            if self.registers is None:
+                self._use_registers()
+            self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def estimate(self):
+        """@returns: the estimated number of distinct values (exact for small counts)"""
+        if self.registers is None:
+            return len(self.hashes)
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum([2.0 ** -register for register in self.registers])
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # linear counting is more accurate for small estimates
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def _add_hash(self, hash):
+        if self.registers is None:
+            self.hashes.add(hash)
+            if len(self.hashes) > self.SPARSE_LIMIT:
+                self._use_registers()
+        else:
+            bits = 64 - self.precision
+            index = hash >> bits
+            rank = bits - (hash & ((1 << bits) - 1)).bit_length() + 1
+            if rank > self.registers[index]:
+                self.registers[index] = rank
+
+    def _use_registers(self):
+        """Switch from exact hashes to registers."""
+        hashes = self.hashes
+        self.registers = bytearray(1 << self.precision)
+        self.hashes = None
+        for hash in hashes:
+            self._add_hash(hash)
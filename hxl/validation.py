@@ -1336,93 +1336,94 @@ class Schema(object):
                 raise hxl.HXLException('Unrecognised true/false value: {}'.format(s))
 
 
-        for row in source:
-            tags = row.get('#valid_tag')
-            if tags:
-                tag_patterns = hxl.model.TagPattern.parse_list(tags)
-                for tag_pattern in tag_patterns:
-                    rule = SchemaRule(tag_pattern)
-                    rule.severity = row.get('#valid_severity') or 'error'
-                    rule.description = row.get('#description')
-
-                    # for later use
-                    case_sensitive = to_boolean(row.get('#valid_value+case'))
-
-                    if to_boolean(row.get('#valid_required-min-max')):
-                        rule.tests.append(RequiredTest(min_occurs=1, max_occurs=None))
-
-                    min_occurs = to_int(row.get('#valid_required+min'))
-                    max_occurs = to_int(row.get('#valid_required+max'))
-                    if min_occurs is not None or max_occurs is not None:
-                        rule.tests.append(RequiredTest(min_occurs=min_occurs, max_occurs=max_occurs))
-
-                    datatype = row.get('#valid_datatype-consistent')
-                    if datatype is not None:
-                        rule.tests.append(DatatypeTest(datatype))
-
-                    min_value = row.get('#valid_value+min')
-                    max_value = row.get('#valid_value+max')
-                    if min_value is not None or max_value is not None:
-                        rule.tests.append(RangeTest(min_value=min_value, max_value=max_value))
-
-                    if to_boolean(row.get('#valid_value+whitespace')):
-                        rule.tests.append(WhitespaceTest())
-
-                    regex = row.get('#valid_value+regex')
-                    if regex is not None:
-                        rule.tests.append(RegexTest(regex, case_sensitive))
-
-                    if to_boolean(row.get('#valid_value+spelling')):
-                        rule.tests.append(SpellingTest(case_sensitive=case_sensitive))
-
-                    if to_boolean(row.get('#valid_unique-key')):
-                        rule.tests.append(UniqueValueTest())
-
-                    key = row.get('#valid_unique+key')
-                    if hxl.datatypes.is_truthy(key):
-                        # could be problematic if there's even a hashtag like #true or #yes
-                        rule.tests.append(UniqueRowTest())
-                    elif not hxl.datatypes.is_empty(key):
-                        rule.tests.append(UniqueRowTest(key))
-
-                    correlations = row.get('#valid_correlation')
-                    if not hxl.datatypes.is_empty(correlations):
-                        rule.tests.append(CorrelationTest(correlations))
-
-                    if to_boolean(row.get('#valid_datatype+consistent')):
-                        rule.tests.append(ConsistentDatatypesTest())
-
-                    if to_boolean(row.get('#valid_value+outliers')):
-                        rule.tests.append(NumericOutlierTest())
-
-                    l = row.get('#valid_value+list')
-                    if not hxl.datatypes.is_empty(l):
-                        allowed_values = re.split(r'\s*\|\s*', l)
-                        if len(allowed_values) > 0:
-                            rule.tests.append(EnumerationTest(allowed_values, case_sensitive))
-
-                    url = row.get('#valid_value+url')
-                    if not hxl.datatypes.is_empty(url):
-                        # default the target tag to the #valid_tag
-                        target_tag = row.get('#valid_value+target_tag', default=tag_pattern)
-                        try:
-                            # read the values from an external dataset
-                            source = hxl.data(url)
-                            allowed_values = source.get_value_set(row.get('#valid_value+target_tag'))
+        with hxl.io.source_registry(): # read each #valid_value+url only once
+            for row in source:
+                tags = row.get('#valid_tag')
+                if tags:
+                    tag_patterns = hxl.model.TagPattern.parse_list(tags)
+                    for tag_pattern in tag_patterns:
+                        rule = SchemaRule(tag_pattern)
+                        rule.severity = row.get('#valid_severity') or 'error'
+                        rule.description = row.get('#description')
+
+                        # for later use
+                        case_sensitive = to_boolean(row.get('#valid_value+case'))
+
+                        if to_boolean(row.get('#valid_required-min-max')):
+                            rule.tests.append(RequiredTest(min_occurs=1, max_occurs=None))
+
+                        min_occurs = to_int(row.get('#valid_required+min'))
+                        max_occurs = to_int(row.get('#valid_required+max'))
+                        if min_occurs is not None or max_occurs is not None:
+                            rule.tests.append(RequiredTest(min_occurs=min_occurs, max_occurs=max_occurs))
+
+                        datatype = row.get('#valid_datatype-consistent')
+                        if datatype is not None:
+                            rule.tests.append(DatatypeTest(datatype))
+
+                        min_value = row.get('#valid_value+min')
+                        max_value = row.get('#valid_value+max')
+                        if min_value is not None or max_value is not None:
+                            rule.tests.append(RangeTest(min_value=min_value, max_value=max_value))
+
+                        if to_boolean(row.get('#valid_value+whitespace')):
+                            rule.tests.append(WhitespaceTest())
+
+                        regex = row.get('#valid_value+regex')
+                        if regex is not None:
+                            rule.tests.append(RegexTest(regex, case_sensitive))
+
+                        if to_boolean(row.get('#valid_value+spelling')):
+                            rule.tests.append(SpellingTest(case_sensitive=case_sensitive))
+
+                        if to_boolean(row.get('#valid_unique-key')):
+                            rule.tests.append(UniqueValueTest())
+
+                        key = row.get('#valid_unique+key')
+                        if hxl.datatypes.is_truthy(key):
+                            # could be problematic if there's even a hashtag like #true or #yes
+                            rule.tests.append(UniqueRowTest())
+                        elif not hxl.datatypes.is_empty(key):
+                            rule.tests.append(UniqueRowTest(key))
+
+                        correlations = row.get('#valid_correlation')
+                        if not hxl.datatypes.is_empty(correlations):
+                            rule.tests.append(CorrelationTest(correlations))
+
+                        if to_boolean(row.get('#valid_datatype+consistent')):
+                            rule.tests.append(ConsistentDatatypesTest())
+
+                        if to_boolean(row.get('#valid_value+outliers')):
+                            rule.tests.append(NumericOutlierTest())
+
+                        l = row.get('#valid_value+list')
+                        if not hxl.datatypes.is_empty(l):
+                            allowed_values = re.split(r'\s*\|\s*', l)
                             if len(allowed_values) > 0:
                                 rule.tests.append(EnumerationTest(allowed_values, case_sensitive))
-                        except BaseException as error:
-                            # don't add the test to the rule
-                            # do add an error about loading the values
-                            rule.external_errors.append(HXLValidationException(
-                                'Error loading allowed values from {}: {}'.format(url, error.args[0]),
-                                scope='dataset',
-                                rule=rule,
-                                is_external=True
-                            ))
-
-
-                    schema.rules.append(rule)
+
+                        url = row.get('#valid_value+url')
+                        if not hxl.datatypes.is_empty(url):
+                            # default the target tag to the #valid_tag
+                            target_tag = row.get('#valid_value+target_tag', default=tag_pattern)
+                            try:
+                                # read the values from an external dataset
+                                source = hxl.data(url)
+                                allowed_values = source.get_value_set(row.get('#valid_value+target_tag'))
+                                if len(allowed_values) > 0:
+                                    rule.tests.append(EnumerationTest(allowed_values, case_sensitive))
+                            except BaseException as error:
+                                # don't add the test to the rule
+                                # do add an error about loading the values
+                                rule.external_errors.append(HXLValidationException(
+                                    'Error loading allowed values from {}: {}'.format(url, error.args[0]),
+                                    scope='dataset',
+                                    rule=rule,
+                                    is_external=True
+                                ))
+
+
+                        schema.rules.append(rule)
 
         return schema
 
@@ -19,6 +19,9 @@ setup(
     author_email='megginson@un.org',
     url='http://hxlproject.org',
     install_requires=['python-dateutil', 'xlrd', 'requests', 'unidecode', 'python-io-wrapper', 'jsonpath_ng', 'ply'],
+    extras_require={
+        'arrow': ['pyarrow'],
+    },
     packages=['hxl', 'hxl.formulas'],
     package_data={'hxl': ['*.json']},
     include_package_data=True,
@@ -3,7 +3,7 @@ import io, logging, os, re, socket, unittest.mock
 # Default to turning off all but critical logging messages
 logging.basicConfig(level=logging.CRITICAL)
 
-def mock_open_url(url, allow_local=False, timeout=None, verify_ssl=True, http_headers=None):
+def mock_open_url(url, allow_local=False, timeout=None, verify_ssl=True, http_headers=None, range_workers=None):
     """Open local files instead of URLs.
     If it's a local file path, leave it alone; otherwise,
     open as a file under ./files/
@@ -9,10 +9,10 @@ License: Public Domain
 
 import unittest
 
-import datetime, hxl
+import datetime, hxl, os, tempfile, threading
 
 # Mock URL access so that tests work offline
-from . import URL_MOCK_TARGET, URL_MOCK_OBJECT
+from . import mock_open_url, URL_MOCK_TARGET, URL_MOCK_OBJECT
 from unittest.mock import patch
 
 #
@@ -85,6 +85,65 @@ class TestRecipe(AbstractBaseFilterTest):
         ])
         self.assertEqual(filtered.values, [DATA[4], DATA[2]])
 
+    @patch(URL_MOCK_TARGET, side_effect=mock_open_url)
+    def test_shared_sources(self, open_url):
+        # the same external source twice in one recipe is downloaded only once
+        url = 'http://example.org/append-source-1.csv'
+        filtered = self.source.recipe([
+            {'filter': 'append', 'append_sources': url},
+            {'filter': 'append', 'append_sources': [url]},
+        ])
+        self.assertEqual(len(DATA) - 2 + 4, len(filtered.values))
+        self.assertEqual(1, open_url.call_count)
+
+    @patch(URL_MOCK_TARGET, side_effect=mock_open_url)
+    def test_unshared_sources(self, open_url):
+        # a source used only once is streamed, without keeping its rows
+        filtered = self.source.recipe([
+            {'filter': 'append', 'append_sources': 'http://example.org/append-source-1.csv'},
+        ])
+        self.assertEqual(len(DATA) - 2 + 2, len(filtered.values))
+        self.assertFalse(isinstance(filtered.append_sources[0].input, hxl.io.SharedInput))
+
+    def test_optimise(self):
+        recipe = [
+            {'filter': 'clean_data', 'upper': 'org'},
+            {'filter': 'with_rows', 'queries': 'adm1=coast'},
+            {'filter': 'replace_data', 'original': 'NGO', 'replacement': 'Agency'},
+            {'filter': 'without_rows', 'queries': 'org=ngo b'}, # reads a column that replace_data changes
+            {'filter': 'without_columns', 'blacklist': 'affected'},
+            {'filter': 'without_columns', 'blacklist': 'sector'},
+            {'filter': 'cache'},
+            {'filter': 'cache'},
+        ]
+        optimiser = hxl.filters.RecipeOptimiser(recipe)
+        self.assertEqual([
+            {'filter': 'with_rows', 'queries': 'adm1=coast'},
+            {'filter': 'clean_data', 'upper': 'org'},
+            {'filter': 'replace_data', 'original': 'NGO', 'replacement': 'Agency'},
+            {'filter': 'without_rows', 'queries': 'org=ngo b'},
+            {'filter': 'without_columns', 'blacklist': ['affected', 'sector']},
+            {'filter': 'cache'},
+        ], optimiser.optimise())
+        self.assertEqual('clean_data', recipe[0]['filter']) # original unchanged
+        self.assertTrue('moved with_rows before clean_data' in optimiser.explain())
+        # same results either way
+        self.assertEqual(
+            hxl.filters.from_recipe(self.source, recipe, optimise=False).values,
+            self.source.recipe(recipe).values
+        )
+
+    def test_optimise_rename(self):
+        # a column renamed by the first step would be renamed again by the second, so don't fuse
+        recipe = [
+            {'filter': 'rename_columns', 'specs': '#org:#org+name'},
+            {'filter': 'rename_columns', 'specs': '#org+name:#org+code'},
+        ]
+        self.assertEqual(recipe, hxl.filters.RecipeOptimiser(recipe).optimise())
+        self.assertEqual(['#org+code', '#sector+list', '#adm1', '#affected'], self.source.recipe(recipe).display_tags)
+        recipe[1]['specs'] = '#adm1:#adm1+name'
+        self.assertEqual(1, len(hxl.filters.RecipeOptimiser(recipe).optimise()))
+
     def test_json(self):
         # test using a literal JSON string for the recipe
         filtered = self.source.recipe('{"filter": "cache"}')
@@ -789,6 +848,71 @@ class TestCountFilter(AbstractBaseFilterTest):
         self.assertEqual(expected[0], filtered.headers)
         self.assertEqual(expected[1], filtered.display_tags)
         self.assertEqual(expected[2:], filtered.values)
+
+    def test_repeated_and_short_columns(self):
+        """Values come from the first non-empty matching column, as with Row.get"""
+        data = [
+            ['#org', '#affected', '#affected', '#sector'],
+            ['NGO A', '', '10', 'WASH'],
+            ['NGO A', '5', '20', ' Health  '],
+            [' NGO  A', '7'],
+            ['NGO B'],
+        ]
+        expected = [
+            ['NGO A', 3, 22, 7.333333333333333, '10', 'Health|WASH'],
+            ['NGO B', 1, '', '', '', ''],
+        ]
+        self.assertEqual(expected, hxl.data(data).count('org', [
+            'count()', 'sum(#affected)', 'average(#affected)', 'max(#affected)', 'concat(#sector)'
+        ]).values)
+
+    def test_memory_limit(self):
+        data = DATA[:2] + [
+            ['NGO {}'.format(i % 37), ['WASH', 'Health', 'Education'][i % 3], 'District {}'.format(i % 11), str(i % 50)]
+            for i in range(1000)
+        ]
+        source = hxl.data(data).cache()
+        aggregators = ['count()', 'sum(#affected)', 'average(#affected)', 'min(#affected)', 'concat(#sector)']
+        expected = source.count('org,adm1', aggregators).values
+        counter = source.count('org,adm1', aggregators, memory_limit=20000)
+        self.assertEqual(expected, counter.values)
+        self.assertEqual(expected, counter.values) # replayable
+        self.assertTrue(isinstance(counter.filter_rows(), hxl.filters.SpillFiles.MergedValues))
+
+    def test_sketch_aggregators(self):
+        expected = [
+            ['Organisation', 'median', 'P90', 'count_distinct'],
+            ['#org', '#meta+median', '#affected+p90', '#meta+count_distinct'],
+            ['NGO A', 175.0, 195.0, 2],
+            ['NGO B', 200.0, 280.0, 2],
+        ]
+        filtered = self.source.count('org', [
+            'median(#affected)', 'percentile(#affected, 90) as P90#affected+p90', 'count_distinct(#adm1)'
+        ])
+        self.assertEqual(expected[0], filtered.headers)
+        self.assertEqual(expected[1], filtered.display_tags)
+        self.assertEqual(expected[2:], filtered.values)
+        for spec in ('percentile(#affected)', 'percentile(#affected, 101)', 'median(#affected, 50)'):
+            with self.assertRaises(hxl.filters.HXLFilterException):
+                hxl.filters.Aggregator.parse(spec)
+
+    def test_merge_states(self):
+        for spec in ('count()', 'sum(#affected)', 'average(#affected)', 'min(#affected)', 'concat(#org)', 'median(#affected)', 'count_distinct(#adm1)'):
+            aggregator = hxl.filters.Aggregator.parse(spec)
+            read = aggregator.make_reader(self.source.columns)
+            update = aggregator.make_updater()
+            states = [aggregator.new_state() for i in range(3)]
+            for i, row in enumerate(self.source):
+                update(states[0], read(row.values))
+                update(states[1 + i % 2], read(row.values))
+            aggregator.merge_states(states[1], states[2])
+            self.assertEqual(aggregator.result(states[0]), aggregator.result(states[1]))
+
+    def test_evaluate_row(self):
+        aggregator = hxl.filters.Aggregator.parse('concat(#sector)')
+        for row in self.source:
+            aggregator.evaluate_row(row)
+        self.assertEqual('Education|Education, Protection|WASH', aggregator.value)
         
     def test_queries(self):
         expected = [
@@ -826,6 +950,19 @@ class TestDeduplicationFilter (AbstractBaseFilterTest):
     def test_queries(self):
         self.assertEqual(self.DATA_OUT_FILTERED[2:], self.source.dedup(queries='sector=Education').values)
 
+    def test_repeated_passes(self):
+        # a repeatable source is read again, so the rows seen must be forgotten each time
+        source = hxl.data([['#org', '#affected'], ['A', '1'], ['A', '1'], ['B', '5']])
+        self.assertTrue(source.dedup().is_cached)
+        self.assertEqual([['B', '5']], source.dedup().with_rows('#affected is max').values)
+        deduped = source.dedup()
+        self.assertEqual(deduped.values, deduped.values)
+        with tempfile.TemporaryDirectory() as dir:
+            filename = os.path.join(dir, 'data.csv')
+            with open(filename, 'w') as output:
+                output.write('#org,#date\nA,2020-01-01\nB,2020-01-02\nC,2020-01-03\n')
+            self.assertEqual(3, len(hxl.data(filename, True).dedup().clean_data(date='#date').values))
+
 
 class TestMergeDataFilter(AbstractBaseFilterTest):
 
@@ -1075,6 +1212,10 @@ class TestRowCountFilter(AbstractBaseFilterTest):
         for row in counter:
             pass
         self.assertEqual(2, counter.row_count)
+        # the count is for the latest pass
+        for row in counter:
+            pass
+        self.assertEqual(2, counter.row_count)
 
 class TestJSONPathFilter(unittest.TestCase):
 
@@ -1226,6 +1367,26 @@ class TestSortFilter(AbstractBaseFilterTest):
             return float(r[3])
         self.assertEqual(sorted(DATA[2:], key=key), self.source.sort('#affected').values)
 
+    def test_memory_limit(self):
+        data = DATA[:2] + [[org, sector, adm1, str(affected)] for org, sector, adm1, affected in zip(
+            ['NGO A', 'NGO B', 'NGO C'] * 100, ['WASH', 'Health'] * 150, ['Coast', 'Plains', 'Hills'] * 100, range(300, 0, -1)
+        )]
+        source = hxl.data(data).cache()
+        for keys, reverse in ((None, False), ('adm1', False), ('org,affected', True), ('sector', True)):
+            expected = source.sort(keys, reverse=reverse).values
+            sorter = source.sort(keys, reverse=reverse, memory_limit=10000)
+            self.assertEqual(expected, sorter.values)
+            self.assertEqual(expected, sorter.values) # replayable
+        # fits in memory
+        self.assertEqual(sorted(DATA[2:]), self.source.sort(memory_limit=1000000).values)
+
+    def test_limit(self):
+        source = hxl.data(DATA * 3).cache()
+        for keys, reverse in ((None, False), ('adm1', False), ('affected', True), ('org', True)):
+            expected = source.sort(keys, reverse=reverse).values
+            for limit in (0, 1, 4, 100):
+                self.assertEqual(expected[:limit], source.sort(keys, reverse=reverse, limit=limit).values)
+
     def test_minmax_years(self):
         DATA = [
             ['#date+year', '#affected', '#adm1'],
@@ -1410,3 +1571,180 @@ class TestChaining(AbstractBaseFilterTest):
         )
 
 
+class TestBatches(AbstractBaseFilterTest):
+    """Native filter_batch implementations must match filter_row."""
+
+    RAGGED_DATA = DATA + [
+        ['  NGO C ', 'Health'], # short row
+        ['NGO D', 'WASH', 'Coast', '50', 'extra'], # long row
+    ]
+
+    def assertSameAsRows(self, filter):
+        filter.columns # set up the filter
+        rows = list(filter.source)
+        expected = [values for values in [filter.filter_row(row) for row in rows] if values is not None]
+        self.assertEqual(expected, filter.filter_batch(rows))
+        self.assertEqual(expected, filter.values)
+
+    def test_batches(self):
+        source = hxl.data(self.RAGGED_DATA)
+        self.assertEqual([2, 2, 2], [len(batch) for batch in source.batches(2)])
+        # row numbers continue across batches
+        batches = list(hxl.data(self.RAGGED_DATA).without_rows('adm1=plains').batches(2))
+        self.assertEqual([[0], [1], [2, 3]], [[row.row_number for row in batch] for batch in batches])
+
+    def test_row_filter(self):
+        source = hxl.data(self.RAGGED_DATA).cache()
+        self.assertSameAsRows(source.with_rows('adm1=coast'))
+        self.assertSameAsRows(source.without_rows('org=ngo b', mask='affected>100'))
+
+    def test_column_filter(self):
+        source = hxl.data(self.RAGGED_DATA).cache()
+        self.assertSameAsRows(source.with_columns('org,adm1'))
+        self.assertSameAsRows(source.without_columns('sector'))
+
+    def test_replace_filter(self):
+        source = hxl.data(self.RAGGED_DATA[:-1]).cache() # a long row is an error for filter_row
+        self.assertSameAsRows(source.replace_data('NGO', 'Org', 'org', use_regex=True))
+        self.assertSameAsRows(source.replace_data('coast', 'Shore', queries='org=ngo a'))
+
+    def test_clean_filter(self):
+        source = hxl.data(self.RAGGED_DATA).cache()
+        self.assertSameAsRows(source.clean_data(whitespace='org', upper='adm1'))
+        self.assertSameAsRows(source.clean_data(number='affected', number_format='0.1f', queries='sector=wash'))
+
+
+class TestParallel(AbstractBaseFilterTest):
+    """Parallel segments must give the same results, in the same order, as running in sequence."""
+
+    def test_segment(self):
+        source = hxl.data(DATA * 20).cache()
+        expected = source.clean_data(upper='org').replace_data('ngo', 'Org', 'org', use_regex=True).with_rows('affected>100').sort('adm1')
+        result = source.parallel(workers=2, batch_size=7).clean_data(upper='org').replace_data('ngo', 'Org', 'org', use_regex=True).with_rows('affected>100').sort('adm1')
+        self.assertEqual(expected.headers, result.headers)
+        self.assertEqual(expected.values, result.values)
+
+    def test_early_exit(self):
+        for row in hxl.data(DATA * 20).parallel(workers=2, batch_size=3).without_columns('sector'):
+            break
+        self.assertEqual(['NGO A', 'Coast', '200'], row.values)
+
+    def test_stateful(self):
+        segment = hxl.data(DATA).parallel(workers=2)
+        with self.assertRaises(hxl.filters.HXLFilterException):
+            segment.dedup()
+        with self.assertRaises(hxl.filters.HXLFilterException):
+            segment.fill_data()
+        with self.assertRaises(hxl.filters.HXLFilterException):
+            segment.with_rows('affected is max').columns
+        with self.assertRaises(hxl.filters.HXLFilterException):
+            segment.without_rows('org=ngo a', mask='affected is max').columns
+        with self.assertRaises(hxl.filters.HXLFilterException):
+            segment.clean_data(upper='org', queries='affected is max').columns
+        with self.assertRaises(hxl.filters.HXLFilterException):
+            segment.replace_data('NGO', 'Org', queries='affected is min').columns
+        with self.assertRaises(hxl.filters.HXLFilterException):
+            segment.clean_data(date='date').columns
+        # ending the segment first is fine
+        self.assertEqual(4, len(segment.cache().dedup().values))
+
+
+class TestPrefetch(AbstractBaseFilterTest):
+    """Prefetching must not change the rows, and must clean up its thread."""
+
+    class FailingSource(hxl.model.Dataset):
+        """Source that fails after a few rows."""
+
+        columns = hxl.data(DATA).columns
+
+        def __iter__(self):
+            for values in DATA[2:4]:
+                yield hxl.model.Row(self.columns, values)
+            raise IOError("lost connection")
+
+    def prefetch_threads(self):
+        return [thread for thread in threading.enumerate() if thread.name == 'hxl-prefetch']
+
+    def test_rows(self):
+        source = hxl.data(DATA * 10).prefetch(batches=2, batch_size=3)
+        self.assertEqual(hxl.data(DATA * 10).values, source.values)
+        self.assertEqual([row.row_number for row in hxl.data(DATA * 10)], [row.row_number for row in source])
+        self.assertEqual(DATA[2:], hxl.data(DATA, prefetch=2).values)
+
+    def test_exception(self):
+        with self.assertRaises(IOError):
+            self.FailingSource().prefetch(batch_size=1).values
+        self.assertEqual([], self.prefetch_threads())
+
+    def test_early_exit(self):
+        for row in hxl.data(DATA * 100).prefetch(batches=1, batch_size=1):
+            break
+        self.assertEqual(DATA[2], row.values)
+        self.assertEqual([], self.prefetch_threads())
+
+    def test_reader_properties(self):
+        # hxl.data(..., prefetch=N) still looks like the reader it wraps
+        with tempfile.TemporaryDirectory() as dir:
+            filename = os.path.join(dir, 'data.csv')
+            with open(filename, 'w') as output:
+                hxl.io.write_hxl(output, hxl.data(DATA))
+            with hxl.data(filename, True, prefetch=2) as source:
+                self.assertTrue(source.is_cached)
+                self.assertEqual('csv', source.input.FORMAT)
+                self.assertEqual(DATA[2:], source.values)
+                self.assertEqual(len(DATA[2:]), source.stats.rows)
+                # a multi-pass filter reads the file again instead of caching a copy
+                self.assertTrue(source.clean_data(date='#date').is_cached)
+        self.assertIsNone(hxl.data(DATA).cache().prefetch().stats)
+
+
+
+
+class TestSQLitePushDown(unittest.TestCase):
+    """Recipe stages over a SQLite-backed dataset should run in SQL with the same results."""
+
+    RECIPES = [
+        [{'filter': 'with_rows', 'queries': 'org=ngo b'}],
+        [{'filter': 'without_rows', 'queries': 'affected>150', 'mask': 'adm1=coast'}],
+        [{'filter': 'with_rows', 'queries': 'affected is max'}],
+        [{'filter': 'with_columns', 'whitelist': 'org,affected'}],
+        [{'filter': 'sort', 'keys': 'affected', 'reverse': True}],
+        [{'filter': 'sort'}],
+        [{'filter': 'sort', 'keys': 'adm1', 'reverse': True, 'limit': 3}],
+        [{'filter': 'count', 'patterns': 'adm1', 'aggregators': ['median(#affected)', 'count_distinct(#org) as Orgs#org+count']}],
+        [{'filter': 'count', 'patterns': 'org'}],
+        [{'filter': 'count', 'patterns': 'org,adm1', 'aggregators': ['sum(#affected) as Total#affected', 'concat(#sector) as Sectors#sector'], 'queries': 'adm1!=plains'}],
+        [{'filter': 'with_rows', 'queries': 'sector~education'}, {'filter': 'count', 'patterns': 'adm1'}, {'filter': 'sort', 'keys': 'meta+count', 'reverse': True}, {'filter': 'with_columns', 'whitelist': 'adm1'}],
+    ]
+
+    def setUp(self):
+        super().setUp()
+        self.dir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.dir.name, 'data.db')
+        hxl.data(DATA).to_sqlite(self.filename, table='activities')
+        self.url = 'sqlite:///' + self.filename + '?table=activities'
+
+    def tearDown(self):
+        self.dir.cleanup()
+        super().tearDown()
+
+    def test_push_down(self):
+        for recipe in self.RECIPES:
+            pushed = hxl.filters.from_recipe(hxl.data(self.url, True), recipe)
+            self.assertTrue(isinstance(pushed, hxl.io.HXLReader))
+            self.assertTrue(isinstance(pushed.input, hxl.io.SQLiteInput))
+            expected = hxl.filters.from_recipe(hxl.data(DATA), recipe)
+            self.assertEqual(expected.display_tags, pushed.display_tags)
+            self.assertEqual(expected.values, pushed.values)
+
+    def test_fall_back(self):
+        # a filter that can't be pushed down runs in Python, and so does everything after it
+        recipe = [
+            {'filter': 'with_rows', 'queries': 'org=ngo a'},
+            {'filter': 'add_columns', 'specs': 'Country#country=Kenya'},
+            {'filter': 'count', 'patterns': 'country'},
+        ]
+        filtered = hxl.filters.from_recipe(hxl.data(self.url, True), recipe)
+        self.assertTrue(isinstance(filtered, hxl.filters.CountFilter))
+        self.assertTrue(isinstance(filtered.source.source, hxl.io.HXLReader))
+        self.assertEqual([['Kenya', 2]], filtered.values)
@@ -8,10 +8,19 @@ License: Public Domain
 """
 
 import unittest
+import unittest.mock
+import asyncio
+import functools
+import http.server
 import os
+import re
+import socket
 import sys
 import io
 import json
+import tempfile
+import threading
+import time
 from urllib.error import HTTPError
 from io import StringIO
 
@@ -35,12 +44,17 @@ FILE_SSV = _resolve_file('./files/test_io/input-valid.ssv')
 FILE_ZIP_CSV = _resolve_file('./files/test_io/input-valid-csv.zip')
 FILE_ZIP_CSV_UNTAGGED = _resolve_file('./files/test_io/input-untagged-csv.zip')
 FILE_ZIP_INVALID = _resolve_file('./files/test_io/input-zip-invalid.zip')
+FILE_ZIP_MULTIPLE_CSV = _resolve_file('./files/test_io/input-multiple-csv.zip')
+FILE_CSV_GZIP = _resolve_file('./files/test_io/input-valid.csv.gz')
+FILE_CSV_BZIP2 = _resolve_file('./files/test_io/input-valid.csv.bz2')
+FILE_JSON_XZ = _resolve_file('./files/test_io/input-valid.json.xz')
 FILE_CSV_LATIN1 = _resolve_file('./files/test_io/input-valid-latin1.csv')
 FILE_CSV_OUT = _resolve_file('./files/test_io/output-valid.csv')
 FILE_XLSX = _resolve_file('./files/test_io/input-valid.xlsx')
 FILE_XLS = _resolve_file('./files/test_io/input-valid.xls')
 FILE_XLSX_BROKEN = _resolve_file('./files/test_io/input-broken.xlsx')
 FILE_XLSX_NOEXT = _resolve_file('./files/test_io/input-valid-xlsx.NOEXT')
+FILE_XLSX_SHEETS = _resolve_file('./files/test_io/input-multiple-sheets.xlsx')
 FILE_JSON = _resolve_file('./files/test_io/input-valid.json')
 FILE_JSON_TXT = _resolve_file('./files/test_io/input-valid-json.txt')
 FILE_JSON_UNTAGGED = _resolve_file('./files/test_io/input-untagged.json')
@@ -50,6 +64,8 @@ FILE_JSON_OBJECTS_UNTAGGED = _resolve_file('./files/test_io/input-untagged-objec
 FILE_JSON_OBJECTS_OUT = _resolve_file('./files/test_io/output-valid-objects.json')
 FILE_JSON_NESTED = _resolve_file('./files/test_io/input-valid-nested.json')
 FILE_JSON_SELECTOR = _resolve_file('./files/test_io/input-valid-json-selector.json')
+FILE_NDJSON_OBJECTS = _resolve_file('./files/test_io/input-valid-objects.ndjson')
+FILE_NDJSON_TXT = _resolve_file('./files/test_io/input-valid-ndjson.txt')
 FILE_MULTILINE = _resolve_file('./files/test_io/input-multiline.csv')
 FILE_FUZZY = _resolve_file('./files/test_io/input-fuzzy.csv')
 FILE_INVALID = _resolve_file('./files/test_io/input-invalid.csv')
@@ -72,24 +88,151 @@ class TestInput(unittest.TestCase):
 
     def test_csv_comma_separated(self):
         with make_input(FILE_CSV, True) as input:
-            self.assertFalse(input.is_repeatable)
+            self.assertTrue(input.is_repeatable)
             self.assertTrue('#sector' in hxl.data(input).tags)
 
     def test_csv_tab_separated(self):
         with make_input(FILE_TSV, True) as input:
-            self.assertFalse(input.is_repeatable)
+            self.assertTrue(input.is_repeatable)
             self.assertTrue('#sector' in hxl.data(input).tags)
 
     def test_csv_semicolon_separated(self):
         with make_input(FILE_SSV, True) as input:
-            self.assertFalse(input.is_repeatable)
+            self.assertTrue(input.is_repeatable)
             self.assertTrue('#sector' in hxl.data(input).tags)
 
+    def test_csv_stream_not_repeatable(self):
+        with open(FILE_CSV, 'rb') as f:
+            data = f.read()
+        with make_input(io.BytesIO(data)) as input:
+            self.assertFalse(input.is_repeatable)
+        # like standard input: a file descriptor named "<stdin>"
+        r, w = os.pipe()
+        os.write(w, data)
+        os.close(w)
+        raw = io.FileIO(r, 'rb')
+        raw.name = '<stdin>'
+        with make_input(io.BufferedReader(raw)) as input:
+            self.assertFalse(input.is_repeatable)
+            self.assertEqual(4, len(hxl.data(input).values))
+
     def test_csv_zipped(self):
         with make_input(FILE_ZIP_CSV, True) as input:
             self.assertFalse(input.is_repeatable)
             self.assertTrue('#sector' in hxl.data(input).tags)
 
+    def test_csv_zipped_multiple(self):
+        # default is still the first CSV member only
+        with make_input(FILE_ZIP_MULTIPLE_CSV, True) as input:
+            self.assertEqual([['Org A', 'WASH']], hxl.data(input).values)
+        # append all matching members, lining up the columns
+        source = hxl.data(FILE_ZIP_MULTIPLE_CSV, True, zip_members='*.csv')
+        self.assertEqual(['#org', '#sector', '#adm1'], source.display_tags)
+        self.assertEqual([
+            ['Org A', 'WASH', ''],
+            ['Org B', 'Health', 'Coast'],
+            ['Org C', '', 'Plains'],
+        ], source.values)
+
+    def test_compressed(self):
+        for filename in (FILE_CSV_GZIP, FILE_CSV_BZIP2,):
+            with make_input(filename, True) as input:
+                self.assertTrue(isinstance(input, CSVInput))
+                self.assertTrue('#sector' in hxl.data(input).tags)
+        with make_input(FILE_JSON_XZ, True) as input:
+            self.assertTrue(isinstance(input, hxl.io.JSONInput))
+            self.assertTrue('#sector' in hxl.data(input).tags)
+        # detect by signature, without a file extension
+        with open(FILE_CSV_GZIP, 'rb') as f:
+            self.assertTrue('#sector' in hxl.data(io.BytesIO(f.read())).tags)
+        # the signature wins over the MIME type and extension
+        with open(FILE_CSV_GZIP, 'rb') as f:
+            gzipped = f.read()
+        with open(FILE_CSV, 'rb') as f:
+            plain = f.read()
+        def fake_open(content, mime_type, file_ext):
+            return lambda *args, **kwargs: (io.BytesIO(content), mime_type, file_ext, None,)
+        with unittest.mock.patch('hxl.io.open_url_or_file', fake_open(gzipped, 'application/x-bzip2', 'bz2')):
+            source = hxl.data('http://example.org/data.csv.bz2')
+            self.assertTrue('#sector' in source.tags)
+            self.assertEqual('gzip', source.stats.compression)
+        # e.g. the HTTP client already decoded Content-Encoding: gzip
+        with unittest.mock.patch('hxl.io.open_url_or_file', fake_open(plain, 'application/gzip', 'gz')):
+            source = hxl.data('http://example.org/data.csv.gz')
+            self.assertTrue('#sector' in source.tags)
+            self.assertIsNone(source.stats.compression)
+        # "BZh" without a block size isn't bzip2
+        with make_input(io.BytesIO(b'BZhello,World\n#org,#sector\n')) as input:
+            self.assertIsNone(input.stats.compression)
+            self.assertEqual(['BZhello', 'World'], next(iter(input)))
+
+    def test_stats(self):
+        reports = []
+        source = hxl.data(FILE_CSV, True, progress=reports.append)
+        self.assertEqual(4, len(source.values))
+        stats = source.stats
+        self.assertEqual('csv', stats.format)
+        self.assertEqual('utf-8', stats.encoding)
+        self.assertIsNone(stats.compression)
+        self.assertEqual(os.path.getsize(FILE_CSV), stats.bytes_read)
+        self.assertEqual(os.path.getsize(FILE_CSV), stats.total_bytes)
+        self.assertEqual(4, stats.rows)
+        self.assertEqual(1.0, stats.fraction)
+        self.assertEqual(0.0, stats.eta)
+        self.assertEqual([stats], reports) # final report only (a small file is quicker than PROGRESS_INTERVAL)
+        # a second pass doesn't count again
+        self.assertEqual(4, len(source.values))
+        self.assertEqual(4, stats.rows)
+
+    def test_stats_compressed(self):
+        with open(FILE_CSV_GZIP, 'rb') as f:
+            source = hxl.data(io.BytesIO(f.read()))
+            self.assertEqual(4, len(source.values))
+            self.assertEqual('gzip', source.stats.compression)
+            self.assertEqual(os.path.getsize(FILE_CSV_GZIP), source.stats.bytes_read)
+            self.assertIsNone(source.stats.total_bytes)
+        source = hxl.data(FILE_XLSX, True)
+        self.assertEqual('xlsx', source.stats.format)
+        self.assertIsNone(source.stats.encoding)
+
+    def test_source_registry(self):
+        with hxl.io.SourceRegistry():
+            source1 = hxl.data(FILE_CSV, True)
+            source2 = hxl.data(os.path.relpath(FILE_CSV), True, timeout=30)
+            source3 = hxl.data(FILE_CSV, True, encoding='latin1')
+            with hxl.io.source_registry():
+                source4 = hxl.data(FILE_CSV, True)
+            # closed once read to the end
+            self.assertEqual(4, len(source3.values))
+            self.assertTrue(source3.input.shared.input._input.closed)
+        self.assertIs(source1.input.shared, source2.input.shared)
+        self.assertIsNot(source1.input.shared, source3.input.shared)
+        self.assertIs(source1.input.shared, source4.input.shared)
+        # not opened until needed
+        self.assertIsNone(source1.input.shared.input)
+        self.assertEqual('csv', source1.stats.format)
+        self.assertEqual(4, len(source1.values))
+        self.assertTrue(source1.input.shared.input._input.closed)
+        self.assertEqual(source1.values, source2.values)
+        self.assertEqual(source1.values, source1.values) # replayable
+        self.assertIsNone(hxl.io.SourceRegistry.current())
+        self.assertFalse(isinstance(hxl.data(FILE_CSV, True).input, hxl.io.SharedInput))
+        # share only the sources listed, matching relative and absolute paths
+        with hxl.io.SourceRegistry(shared=[os.path.relpath(FILE_CSV)]):
+            self.assertTrue(isinstance(hxl.data(FILE_CSV, True).input, hxl.io.SharedInput))
+            self.assertFalse(isinstance(hxl.data(FILE_TSV, True).input, hxl.io.SharedInput))
+        # closed when a view exits or at the end of the scope, resuming after the rows already read
+        with hxl.io.SourceRegistry():
+            source5 = hxl.data(FILE_CSV, True)
+            with hxl.data(FILE_CSV, True) as source6:
+                self.assertEqual(source1.values[0], next(iter(source6)).values)
+            self.assertTrue(source6.input.shared.input._input.closed)
+            self.assertEqual(source1.values, source5.values)
+            source7 = hxl.data(FILE_CSV, True, encoding='utf-8')
+            self.assertEqual(source1.values[0], next(iter(source7)).values)
+        self.assertTrue(source7.input.shared.input._input.closed)
+        self.assertEqual(source1.values, source7.values)
+
     def test_zip_invalid(self):
         """Expect a HXLIOException, not a meaningless TypeError"""
         with self.assertRaises(hxl.io.HXLIOException):
@@ -101,12 +244,12 @@ class TestInput(unittest.TestCase):
 
     def test_json_lists(self):
         with make_input(FILE_JSON, True) as input:
-            self.assertFalse(input.is_repeatable)
+            self.assertTrue(input.is_repeatable)
             self.assertTrue('#sector' in hxl.data(input).tags)
 
     def test_json_objects(self):
         with make_input(FILE_JSON_OBJECTS, True) as input:
-            self.assertFalse(input.is_repeatable)
+            self.assertTrue(input.is_repeatable)
             self.assertTrue('#sector' in hxl.data(input).tags)
 
     def test_json_selector(self):
@@ -122,12 +265,99 @@ class TestInput(unittest.TestCase):
         # test JSONPath support
         with make_input(FILE_JSON_SELECTOR, True, selector="$.sel1") as input:
             self.assertEqual(SEL1_DATA, hxl.data(input).values)
+
+        # incremental parsing with a legacy selector
+        with make_input(FILE_JSON_SELECTOR, True, selector="sel2", incremental_json=True) as input:
+            self.assertEqual(SEL2_DATA, hxl.data(input).values)
+
+    def test_json_incremental(self):
+        for filename in (FILE_JSON, FILE_JSON_OBJECTS, FILE_JSON_NESTED,):
+            with make_input(filename, True) as input:
+                expected = list(input)
+            with make_input(filename, True, incremental_json=True) as input:
+                self.assertEqual(expected, list(input))
+
+    def test_json_incremental_lookahead(self):
+        DATA = '[{"#org": "Org A"}, {"#org": "Org B", "#sector": "WASH"}]'.encode('utf-8')
+        # the lookahead window decides the headers, even when the stream can be rewound
+        with make_input(io.BufferedReader(io.BytesIO(DATA)), incremental_json=True, json_lookahead=1) as input:
+            self.assertEqual([['#org'], ['Org A'], ['Org B']], list(input))
+        with make_input(io.BufferedReader(io.BytesIO(DATA)), incremental_json=True, json_lookahead=2) as input:
+            self.assertEqual([['#org', '#sector'], ['Org A', ''], ['Org B', 'WASH']], list(input))
+        with unittest.mock.patch.object(hxl.io.JSONInput, 'LOOKAHEAD', 1):
+            with make_input(io.BufferedReader(io.BytesIO(DATA)), incremental_json=True) as input:
+                self.assertEqual([['#org'], ['Org A'], ['Org B']], list(input))
+        # scanning the whole document first is opt-in
+        with make_input(io.BufferedReader(io.BytesIO(DATA)), incremental_json=True, json_lookahead=hxl.io.JSONInput.SCAN_ALL) as input:
+            self.assertEqual([['#org', '#sector'], ['Org A', ''], ['Org B', 'WASH']], list(input))
+
+    def test_json_incremental_large_value(self):
+        DATA = json.dumps([{'#org': 'Org A', '#description': 'x' * 5000}, {'#org': 'Org B'}]).encode('utf-8')
+        with unittest.mock.patch.object(hxl.io.JSONInput._StreamReader, 'CHUNK_SIZE', 16):
+            with make_input(io.BytesIO(DATA), incremental_json=True) as input:
+                self.assertEqual([['#org', '#description'], ['Org A', 'x' * 5000], ['Org B', '']], list(input))
             
 
+    def test_ndjson(self):
+        # detect by file extension
+        with make_input(FILE_NDJSON_OBJECTS, True) as input:
+            self.assertTrue(isinstance(input, hxl.io.NDJSONInput))
+            with make_input(FILE_JSON_OBJECTS, True) as expected:
+                self.assertEqual(list(expected), list(input))
+        # detect by signature
+        with make_input(FILE_NDJSON_TXT, True) as input:
+            self.assertTrue(isinstance(input, hxl.io.NDJSONInput))
+            with make_input(FILE_JSON, True) as expected:
+                self.assertEqual(list(expected), list(input))
+        # a one-line JSON document is not JSON Lines
+        with make_input(io.BytesIO(b'[["#org"], ["Org A"]]\n')) as input:
+            self.assertTrue(isinstance(input, hxl.io.JSONInput))
+        # a one-line file needs the (six-character) extension, since the signature check can't tell
+        with tempfile.TemporaryDirectory() as dir:
+            filename = os.path.join(dir, 'one.ndjson')
+            with open(filename, 'w') as output:
+                output.write('{"#org": "Org A"}\n')
+            with make_input(filename, True) as input:
+                self.assertTrue(isinstance(input, hxl.io.NDJSONInput))
+                self.assertEqual([['#org'], ['Org A']], list(input))
+
+    def test_ndjson_malformed(self):
+        with self.assertRaises(HXLParseException):
+            list(make_input(io.BytesIO(b'["#org"]\n["Org A"]\n{"#org": "Org B"}\n')))
+
     def test_xlsx(self):
         with make_input(FILE_XLSX, True) as input:
             self.assertTrue(input.is_repeatable)
 
+    def test_workbook_no_tempfile(self):
+        # local workbooks are opened directly by filename
+        with make_input(FILE_XLS, True) as input:
+            self.assertEqual(FILE_XLS, input.tmpfile)
+        with make_input(FILE_XLSX, True) as input:
+            self.assertEqual(FILE_XLSX, input.tmpfile)
+        # small streamed workbooks stay in memory
+        with open(FILE_XLSX, 'rb') as f:
+            with make_input(io.BytesIO(f.read())) as input:
+                self.assertTrue(isinstance(input.tmpfile, io.BytesIO))
+                self.assertTrue('#sector' in hxl.data(input).tags)
+
+    def test_xlsx_sheet_scan(self):
+        # first sheet has no hashtags, so use the second
+        with make_input(FILE_XLSX_SHEETS, True) as input:
+            self.assertEqual(['#org', '#date', '#affected', '#status'], next(iter(input)))
+        with make_input(FILE_XLSX_SHEETS, True, sheet_index=0) as input:
+            self.assertEqual([['No HXL data on this sheet']], list(input))
+
+    def test_xlsx_cell_types(self):
+        with make_input(FILE_XLSX_SHEETS, True) as input:
+            self.assertEqual([
+                ['#org', '#date', '#affected', '#status'],
+                ['Org A', '2018-01-01', 100, 1],
+                ['', '', '', ''], # missing row
+                ['Org B', '2018-02-01', 2.5, ''],
+                ['', '', '102.5', ''], # formula with cached string result
+            ], list(input))
+
     def test_ckan_resource(self):
         source = hxl.data('https://data.humdata.org/dataset/hxl-master-vocabulary-list/resource/d22dd1b6-2ff0-47ab-85c6-08aeb911a832')
         self.assertTrue('#vocab' in source.tags)
@@ -147,6 +377,40 @@ class TestInput(unittest.TestCase):
         hxl.data(url, verify_ssl=True, timeout=30, http_headers={'User-Agent': 'libhxl-python'})
         
 
+class TestRepeatableReader(unittest.TestCase):
+    """Test multiple passes through a HXLReader"""
+
+    def test_repeatable(self):
+        for filename in (FILE_CSV, FILE_XLSX, FILE_JSON,):
+            source = hxl.data(filename, True)
+            self.assertTrue(source.is_cached)
+            first_pass = [(row.values, row.source_row_number) for row in source]
+            second_pass = [(row.values, row.source_row_number) for row in source]
+            self.assertEqual(4, len(first_pass))
+            self.assertEqual(first_pass, second_pass)
+
+    def test_independent_iterators(self):
+        source = hxl.data(FILE_CSV, True)
+        iter1 = iter(source)
+        iter2 = iter(source)
+        self.assertEqual('ACNUR', next(iter1).get('#org'))
+        self.assertEqual('ACNUR', next(iter2).get('#org'))
+        self.assertEqual('OMS', next(iter2).get('#org'))
+        self.assertEqual('OMS', next(iter1).get('#org'))
+
+    def test_no_cache_for_aggregates(self):
+        source = hxl.data(FILE_CSV, True).with_rows('#targeted+f is max')
+        self.assertTrue(isinstance(source.source, HXLReader))
+        self.assertEqual(['UNICEF'], [row.get('#org') for row in source])
+
+    def test_stream_not_repeatable(self):
+        with open(FILE_CSV, 'rb') as f:
+            source = hxl.data(io.BytesIO(f.read()))
+        self.assertFalse(source.is_cached)
+        self.assertEqual(4, len(source.values))
+        self.assertEqual(0, len(source.values))
+
+
 class TestUntaggedInput(unittest.TestCase):
 
     def test_untagged_json(self):
@@ -411,6 +675,257 @@ class TestParser(unittest.TestCase):
                     self.assertEqual(TestParser.EXPECTED_CONTENT[i][j], value)
 
 
+class TestAsync(unittest.TestCase):
+    """Test concurrent loading against a local HTTP server."""
+
+    class Handler(http.server.SimpleHTTPRequestHandler):
+        """Serve test files slowly, tracking how many requests are active at once."""
+
+        lock = threading.Lock()
+        active = 0
+        max_active = 0
+
+        def do_GET(self):
+            cls = TestAsync.Handler
+            with cls.lock:
+                cls.active += 1
+                cls.max_active = max(cls.max_active, cls.active)
+            try:
+                time.sleep(0.1)
+                super().do_GET()
+            finally:
+                with cls.lock:
+                    cls.active -= 1
+
+        def log_message(self, format, *args):
+            pass
+
+    def setUp(self):
+        super().setUp()
+        TestAsync.Handler.max_active = 0
+        self.server = http.server.ThreadingHTTPServer(
+            ('127.0.0.1', 0),
+            functools.partial(TestAsync.Handler, directory=os.path.dirname(FILE_CSV))
+        )
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = 'http://127.0.0.1:{}/'.format(self.server.server_address[1])
+        hxl.io.URL_CACHE.clear()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        super().tearDown()
+
+    def test_data_async(self):
+        source = asyncio.run(hxl.data_async(self.base_url + 'input-valid.csv'))
+        self.assertTrue(isinstance(source, hxl.model.Dataset))
+        self.assertEqual(hxl.data(FILE_CSV, True).values, source.values)
+
+    def test_gather_data(self):
+        filenames = ['input-valid.csv', 'input-valid.json', 'input-valid.xlsx'] * 2
+        sources = asyncio.run(hxl.gather_data(
+            [self.base_url + filename for filename in filenames] + [FILE_CSV],
+            concurrency=6,
+            per_host=2,
+            cache=True,
+            allow_local=True
+        ))
+        self.assertEqual(len(filenames) + 1, len(sources))
+        expected = hxl.data(FILE_CSV, True)
+        for source in sources:
+            self.assertTrue(source.is_cached)
+            self.assertEqual(expected.tags, source.tags)
+            self.assertEqual(len(expected.values), len(source.values))
+        self.assertEqual(2, TestAsync.Handler.max_active)
+
+    def test_gather_data_exceptions(self):
+        sources = asyncio.run(hxl.gather_data(
+            [self.base_url + 'input-valid.csv', self.base_url + 'not-found.csv'],
+            return_exceptions=True
+        ))
+        self.assertTrue(isinstance(sources[0], hxl.model.Dataset))
+        self.assertTrue(isinstance(sources[1], Exception))
+
+    def test_gather_data_registry(self):
+        # the active registry applies in the worker threads, so the URL is opened once
+        url = self.base_url + 'input-valid.csv'
+        async def load():
+            with hxl.io.source_registry():
+                return await hxl.gather_data([url, url, url], concurrency=3)
+        sources = asyncio.run(load())
+        self.assertTrue(isinstance(sources[0].input, hxl.io.SharedInput))
+        self.assertIs(sources[0].input.shared, sources[2].input.shared)
+        self.assertEqual(hxl.data(FILE_CSV, True).values, sources[1].values)
+
+
+class TestRangedDownload(unittest.TestCase):
+    """Test parallel ranged downloads against a local range-capable HTTP server."""
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        """Serve one generated CSV file, with byte ranges, dropping some connections part-way."""
+
+        content = b''
+        failures = set() # range starts that should fail (once each)
+        range_requests = []
+        etag = '"test"'
+        last_modified = None
+        if_range = set() # If-Range values received
+
+        def do_GET(self):
+            cls = TestRangedDownload.Handler
+            content = cls.content
+            match = re.match(r'^bytes=(\d+)-(\d+)$', self.headers.get('Range', ''))
+            if match:
+                start, end = int(match.group(1)), int(match.group(2))
+                cls.range_requests.append((start, end,))
+                cls.if_range.add(self.headers.get('If-Range'))
+                body = content[start:end+1]
+                self.send_response(206)
+                self.send_header('Content-Range', 'bytes {}-{}/{}'.format(start, end, len(content)))
+            else:
+                start = None
+                body = content
+                self.send_response(200)
+                self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('Content-Type', 'text/csv')
+            self.send_header('Content-Length', str(len(body)))
+            if cls.etag:
+                self.send_header('ETag', cls.etag)
+            if cls.last_modified:
+                self.send_header('Last-Modified', cls.last_modified)
+            self.end_headers()
+            if start in cls.failures:
+                # send part of the range, then hang up
+                cls.failures.discard(start)
+                self.wfile.write(body[:len(body)//2])
+                self.wfile.flush()
+                self.close_connection = True
+                self.connection.shutdown(socket.SHUT_RDWR)
+            else:
+                self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    def setUp(self):
+        super().setUp()
+        rows = ['Organisation,Sector,Number', '#org,#sector,#population']
+        rows += ['Org {},Sector {},{}'.format(i, i % 7, i) for i in range(2000)]
+        TestRangedDownload.Handler.content = ('\r\n'.join(rows) + '\r\n').encode('utf-8')
+        TestRangedDownload.Handler.failures = set()
+        TestRangedDownload.Handler.range_requests = []
+        TestRangedDownload.Handler.etag = '"test"'
+        TestRangedDownload.Handler.last_modified = None
+        TestRangedDownload.Handler.if_range = set()
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), TestRangedDownload.Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = 'http://127.0.0.1:{}/data.csv'.format(self.server.server_address[1])
+        hxl.io.URL_CACHE.clear()
+        self.patches = [
+            unittest.mock.patch('hxl.io.RANGE_MIN_SIZE', 0),
+            unittest.mock.patch('hxl.io.RANGE_CHUNK_SIZE', 1000),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        self.server.shutdown()
+        self.server.server_close()
+        super().tearDown()
+
+    def expected_values(self):
+        return hxl.data(io.BytesIO(TestRangedDownload.Handler.content)).values
+
+    def test_ranged(self):
+        with make_input(self.url, range_workers=4) as input:
+            self.assertEqual(self.expected_values(), hxl.data(input).values)
+        length = len(TestRangedDownload.Handler.content)
+        self.assertEqual((length + 999) // 1000, len(TestRangedDownload.Handler.range_requests))
+        self.assertEqual({'"test"'}, TestRangedDownload.Handler.if_range)
+
+    def test_weak_etag(self):
+        # a weak ETag can't go in If-Range, so use the Last-Modified date instead
+        TestRangedDownload.Handler.etag = 'W/"test"'
+        TestRangedDownload.Handler.last_modified = 'Mon, 19 Oct 2026 10:00:00 GMT'
+        with make_input(self.url, range_workers=4) as input:
+            self.assertEqual(self.expected_values(), hxl.data(input).values)
+        self.assertEqual({'Mon, 19 Oct 2026 10:00:00 GMT'}, TestRangedDownload.Handler.if_range)
+        # with neither, there's no safe way to combine ranges, so download in a single stream
+        TestRangedDownload.Handler.last_modified = None
+        TestRangedDownload.Handler.range_requests = []
+        with make_input(self.url, range_workers=4) as input:
+            self.assertEqual(self.expected_values(), hxl.data(input).values)
+        self.assertEqual([], TestRangedDownload.Handler.range_requests)
+
+    def test_resume(self):
+        TestRangedDownload.Handler.failures = {0, 5000, 12000}
+        with make_input(self.url, range_workers=3) as input:
+            self.assertEqual(self.expected_values(), hxl.data(input).values)
+        # each interrupted range was resumed from where it stopped
+        for start in (0, 5000, 12000,):
+            self.assertTrue((start + 500, start + 999,) in TestRangedDownload.Handler.range_requests)
+
+    def test_not_ranged(self):
+        # default is still a single streaming download
+        with make_input(self.url) as input:
+            self.assertEqual(self.expected_values(), hxl.data(input).values)
+        self.assertEqual([], TestRangedDownload.Handler.range_requests)
+
+
+class TestURLCache(unittest.TestCase):
+    """Test caching of resolved URLs"""
+
+    CKAN_URL = 'https://data.example.org/dataset/test-dataset/resource/d22dd1b6-2ff0-47ab-85c6-08aeb911a832'
+
+    def setUp(self):
+        hxl.io.URL_CACHE.clear()
+
+    def tearDown(self):
+        hxl.io.URL_CACHE.clear()
+
+    def test_ckan_lookup_cached(self):
+        response = unittest.mock.Mock()
+        response.json.return_value = {'success': True, 'result': {'url': 'https://data.example.org/download/data.csv'}}
+        with unittest.mock.patch('hxl.io.requests.get', return_value=response) as get:
+            self.assertEqual('https://data.example.org/download/data.csv', hxl.io.munge_url(self.CKAN_URL))
+            self.assertEqual('https://data.example.org/download/data.csv', hxl.io.munge_url(self.CKAN_URL))
+            self.assertEqual(1, get.call_count)
+            # different request headers mean a different lookup
+            hxl.io.munge_url(self.CKAN_URL, http_headers={'Authorization': 'xxx'})
+            self.assertEqual(2, get.call_count)
+
+    def test_expiry(self):
+        cache = hxl.io.TTLCache(0)
+        self.assertEqual(1, cache.get('a', lambda: 1))
+        self.assertEqual(2, cache.get('a', lambda: 2))
+
+    def test_errors_not_cached(self):
+        cache = hxl.io.TTLCache(60)
+        def fail():
+            raise IOError("lookup failed")
+        with self.assertRaises(IOError):
+            cache.get('a', fail)
+        self.assertEqual(1, cache.get('a', lambda: 1))
+
+    def test_single_flight(self):
+        cache = hxl.io.TTLCache(60)
+        calls = []
+        def compute():
+            calls.append(1)
+            time.sleep(0.05)
+            return 'value'
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get('a', compute))) for i in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(['value'] * 5, results)
+        self.assertEqual(1, len(calls))
+
+
 class TestLocationInformation(unittest.TestCase):
     """Test location information for rows and columns"""
 
@@ -478,6 +993,125 @@ class TestFunctions(unittest.TestCase):
                 hxl.io.write_json(buffer, source, use_objects=True)
                 self.assertEqual(expected, buffer.getvalue())
 
+    def test_write_xlsx(self):
+        expected = list(hxl.data(FILE_CSV, True).gen_csv())
+        for limit in (hxl.io.XLSX_SHARED_STRING_LIMIT, 5,):
+            # the second time, most strings are written inline
+            with unittest.mock.patch('hxl.io.XLSX_SHARED_STRING_LIMIT', limit):
+                buffer = io.BytesIO()
+                hxl.io.write_xlsx(buffer, hxl.data(FILE_CSV, True))
+            with make_input(io.BytesIO(buffer.getvalue())) as input:
+                self.assertTrue(isinstance(input, hxl.io.XLSXInput))
+                self.assertEqual(expected, list(hxl.data(input).gen_csv()))
+
+    def test_write_hxlb(self):
+        DATA_RAGGED = [
+            ['Sector', 'Organisation'],
+            ['#sector', '#org'],
+            ['Health'],
+            ['WASH', 'NGO A', 'extra'],
+            [],
+        ]
+        for spec in (FILE_CSV, FILE_XLSX, DATA_RAGGED,):
+            expected = list(hxl.data(spec, True).gen_csv())
+            buffer = io.BytesIO()
+            hxl.io.write_hxlb(buffer, hxl.data(spec, True))
+            with make_input(io.BytesIO(buffer.getvalue())) as input:
+                self.assertTrue(isinstance(input, hxl.io.HXLBInput))
+                self.assertEqual(expected, list(hxl.data(input).gen_csv()))
+
+    def test_read_hxlb_mmap(self):
+        expected = list(hxl.data(FILE_CSV, True).gen_csv())
+        with tempfile.TemporaryDirectory() as dir:
+            filename = os.path.join(dir, 'snapshot.hxlb')
+            with open(filename, 'wb') as output:
+                hxl.io.write_hxlb(output, hxl.data(FILE_CSV, True))
+            with make_input(filename, True) as input:
+                self.assertTrue(isinstance(input, hxl.io.HXLBInput))
+                self.assertTrue(input.is_repeatable)
+                source = hxl.data(input)
+                self.assertEqual(expected, list(source.gen_csv()))
+                self.assertEqual(expected, list(source.gen_csv()))
+            # the file opened from the filename is closed on exit
+            self.assertTrue(input._file.closed)
+
+            # and when the file isn't a snapshot
+            with open(filename, 'wb') as output:
+                output.write(b'not a snapshot, but long enough')
+            opened = []
+            real_open = io.open
+            def tracking_open(*args, **kwargs):
+                opened.append(real_open(*args, **kwargs))
+                return opened[-1]
+            with unittest.mock.patch('hxl.io.io.open', tracking_open):
+                with self.assertRaises(hxl.HXLParseException):
+                    hxl.io.HXLBInput(filename)
+            self.assertTrue(opened[0].closed)
+
+    def test_to_sqlite(self):
+        DATA_RAGGED = [
+            ['Sector', 'Organisation'],
+            ['#sector', '#org'],
+            ['Health'],
+            ['WASH', 'NGO A', 'extra'],
+        ]
+        with tempfile.TemporaryDirectory() as dir:
+            filename = os.path.join(dir, 'data.db')
+            for table, spec in (('valid', FILE_CSV,), ('ragged', DATA_RAGGED,),):
+                hxl.data(spec, True).to_sqlite(filename, table)
+            for table, spec in (('valid', FILE_CSV,), ('ragged', DATA_RAGGED,),):
+                expected = list(hxl.data(spec, True).gen_csv())
+                source = hxl.data('sqlite:///{}?table={}'.format(filename, table), True)
+                self.assertTrue(isinstance(source.input, hxl.io.SQLiteInput))
+                self.assertTrue(source.is_cached)
+                self.assertEqual(expected, list(source.gen_csv()))
+                self.assertEqual(expected, list(source.gen_csv()))
+            with self.assertRaises(hxl.io.HXLIOException):
+                hxl.data('sqlite:///{}?table=valid'.format(filename))
+            with self.assertRaises(hxl.io.HXLIOException):
+                hxl.data('sqlite:///{}?table=missing'.format(filename), True)
+
+    @unittest.skipIf(hxl.io.pyarrow is None, "pyarrow not installed")
+    def test_to_arrow(self):
+        source = hxl.data(FILE_CSV, True)
+        table = source.to_arrow(batch_size=2).read_all()
+        self.assertEqual(len(source.values), table.num_rows)
+        self.assertEqual(2, len(table.column(0).chunks))
+        field = table.schema.field(1)
+        self.assertEqual(b'#sector+es', field.metadata[b'hxl:tag'])
+        self.assertEqual(b'Sector/Cluster', field.metadata[b'hxl:header'])
+
+    @unittest.skipIf(hxl.io.pyarrow is None, "pyarrow not installed")
+    def test_write_parquet(self):
+        expected = list(hxl.data(FILE_CSV, True).gen_csv())
+        buffer = io.BytesIO()
+        hxl.data(FILE_CSV, True).write_parquet(buffer, batch_size=3)
+        with make_input(io.BytesIO(buffer.getvalue())) as input:
+            self.assertTrue(isinstance(input, hxl.io.ParquetInput))
+            self.assertEqual(expected, list(hxl.data(input).gen_csv()))
+        # cells past the last column are dropped, with a warning; values stay strings
+        buffer = io.BytesIO()
+        with self.assertLogs('hxl.io', level='WARNING') as logs:
+            hxl.data([['#org', '#affected'], ['A', 1, 'x', 'extra']]).write_parquet(buffer)
+        self.assertIn('1 row(s)', logs.output[0])
+        with make_input(io.BytesIO(buffer.getvalue())) as input:
+            self.assertEqual([['A', '1']], hxl.data(input).values)
+
+    @unittest.skipIf(hxl.io.pyarrow is None, "pyarrow not installed")
+    def test_read_arrow(self):
+        expected = list(hxl.data(FILE_CSV, True).gen_csv())
+        with tempfile.TemporaryDirectory() as dir:
+            filename = os.path.join(dir, 'data.arrow')
+            reader = hxl.data(FILE_CSV, True).to_arrow()
+            with hxl.io.pyarrow.ipc.new_file(filename, reader.schema) as writer:
+                for batch in reader:
+                    writer.write_batch(batch)
+            with make_input(filename, True) as input:
+                self.assertTrue(isinstance(input, hxl.io.ArrowInput))
+                source = hxl.data(input)
+                self.assertEqual(expected, list(source.gen_csv()))
+                self.assertEqual(expected, list(source.gen_csv()))
+
     def test_write_json_attribute_normalisation(self):
         DATA_IN = [
             ['#sector+es+cluster'],
@@ -9,6 +9,7 @@ License: Public Domain
 from __future__ import print_function
 
 import unittest
+import io
 import os
 import sys
 import subprocess
@@ -122,6 +123,10 @@ class TestCount(BaseTest):
     def test_count_colspec(self):
         self.assertOutput(['-t', 'org,adm1', '-a', 'count() as Activities#output+activities'], 'count-output-colspec.csv')
 
+    def test_memory_limit(self):
+        self.assertOutput(['-t', 'org,adm1', '-m', '0.0001'], 'count-output-simple.csv')
+        self.assertOutput(['-t', 'org,adm1', '-a', 'sum(targeted) as Total targeted#targeted+total', '--memory-limit', '0.0001'], 'count-output-aggregated.csv')
+
 
 class TestCut(BaseTest):
     """
@@ -140,6 +145,14 @@ class TestCut(BaseTest):
         self.assertOutput(['-x', 'population+sex,targeted'], 'cut-output-blacklist.csv')
         self.assertOutput(['--exclude', 'population+sex,targeted'], 'cut-output-blacklist.csv')
 
+    def test_progress(self):
+        # progress from make_source goes to the stderr given to the script
+        stdout = io.StringIO()
+        stderr = io.StringIO()
+        status = hxl.scripts.hxlcut_main(['--progress', '-i', 'org', resolve_file(self.input_file)], stdout=stdout, stderr=stderr)
+        self.assertEqual(hxl.scripts.EXIT_OK, status)
+        self.assertTrue(stderr.getvalue().startswith('8 rows, '))
+
 
 class TestMerge(BaseTest):
     """
@@ -253,6 +266,39 @@ class TestSort(BaseTest):
         self.assertOutput(['-r'], 'sort-output-reverse.csv')
         self.assertOutput(['--reverse'], 'sort-output-reverse.csv')
 
+    def test_memory_limit(self):
+        self.assertOutput(['-m', '0.0001'], 'sort-output-default.csv')
+        self.assertOutput(['--memory-limit', '0.0001', '-r'], 'sort-output-reverse.csv')
+
+    def test_limit(self):
+        self.assertOutput(['-r', '-n', '3'], 'sort-output-limit.csv')
+        self.assertOutput(['--reverse', '--limit', '3'], 'sort-output-limit.csv')
+
+
+class TestOutputFormat(unittest.TestCase):
+    """
+    Test the --output-format option shared by the command-line tools.
+    """
+
+    def test_xlsx(self):
+        with tempfile.TemporaryDirectory() as dir:
+            filename = os.path.join(dir, 'output.xlsx')
+            status = hxl.scripts.hxlsort_main(['--output-format', 'xlsx', resolve_file('input-simple.csv'), filename])
+            self.assertEqual(hxl.scripts.EXIT_OK, status)
+            with open(resolve_file('sort-output-default.csv'), 'rb') as input:
+                expected = hxl.data(input)
+                self.assertEqual(expected.headers, hxl.data(filename, True).headers)
+                self.assertEqual(expected.display_tags, hxl.data(filename, True).display_tags)
+                self.assertEqual(expected.values, hxl.data(filename, True).values)
+
+    def test_json(self):
+        with tempfile.TemporaryDirectory() as dir:
+            filename = os.path.join(dir, 'output.json')
+            status = hxl.scripts.hxlsort_main(['--output-format', 'json', resolve_file('input-simple.csv'), filename])
+            self.assertEqual(hxl.scripts.EXIT_OK, status)
+            with open(resolve_file('sort-output-default.csv'), 'rb') as input:
+                self.assertEqual(hxl.data(input).values, hxl.data(filename, True).values)
+
 
 class TestTag(BaseTest):
     """
@@ -343,6 +389,13 @@ class TestValidate(BaseTest):
             '-s', resolve_file('validation-schema-invalid.csv')
         ], hxl.scripts.EXIT_ERROR)
 
+    def test_progress(self):
+        stdout = io.StringIO()
+        stderr = io.StringIO()
+        status = hxl.scripts.hxlvalidate_main(['--progress', '-s', resolve_file('validation-schema-valid.csv'), resolve_file(self.input_file)], stdout=stdout, stderr=stderr)
+        self.assertEqual(hxl.scripts.EXIT_OK, status)
+        self.assertTrue(stderr.getvalue().startswith('8 rows, '))
+
 
 ########################################################################
 # Support functions
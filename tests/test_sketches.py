@@ -0,0 +1,73 @@
+"""
+Unit tests for the hxl.sketches module
+
+License: Public Domain
+"""
+
+import hxl.sketches, random, unittest
+
+
+class TestQuantileSketch(unittest.TestCase):
+
+    def setUp(self):
+        generator = random.Random(1)
+        self.values = [generator.gauss(100, 30) for i in range(20000)]
+        self.sorted_values = sorted(self.values)
+
+    def rank(self, value):
+        """Fraction of the values below value"""
+        return len([v for v in self.values if v < value]) / len(self.values)
+
+    def test_exact(self):
+        sketch = hxl.sketches.QuantileSketch()
+        self.assertIsNone(sketch.quantile(0.5))
+        for value in [4, 1, 3, 2]:
+            sketch.add(value)
+        self.assertEqual(2.5, sketch.quantile(0.5))
+        self.assertEqual(1, sketch.quantile(0))
+        self.assertEqual(4, sketch.quantile(1))
+
+    def test_approximate(self):
+        sketch = hxl.sketches.QuantileSketch()
+        for value in self.values:
+            sketch.add(value)
+        self.assertLess(sum([len(level) for level in sketch.levels]), 3 * sketch.k)
+        for q in (0.01, 0.25, 0.5, 0.9, 0.99):
+            self.assertAlmostEqual(q, self.rank(sketch.quantile(q)), delta=0.02)
+
+    def test_merge(self):
+        sketches = [hxl.sketches.QuantileSketch() for i in range(3)]
+        for i, value in enumerate(self.values):
+            sketches[i % 3].add(value)
+        sketches[0].merge(sketches[1])
+        sketches[0].merge(sketches[2])
+        self.assertEqual(len(self.values), sketches[0].count)
+        self.assertAlmostEqual(0.5, self.rank(sketches[0].quantile(0.5)), delta=0.02)
+
+
+class TestDistinctSketch(unittest.TestCase):
+
+    def test_exact(self):
+        sketch = hxl.sketches.DistinctSketch()
+        for value in ['a', 'b', 'a', 'c', 'b']:
+            sketch.add(value)
+        self.assertEqual(3, sketch.estimate())
+        self.assertIsNone(sketch.registers)
+
+    def test_approximate(self):
+        sketch = hxl.sketches.DistinctSketch()
+        for i in range(50000):
+            sketch.add('value {}'.format(i % 20000))
+        self.assertEqual(4096, len(sketch.registers))
+        self.assertAlmostEqual(20000, sketch.estimate(), delta=20000 * 0.05)
+
+    def test_merge(self):
+        a, b = hxl.sketches.DistinctSketch(), hxl.sketches.DistinctSketch()
+        for i in range(10000):
+            a.add(i)
+        for i in range(5000, 15000):
+            b.add(i)
+        a.merge(b)
+        self.assertAlmostEqual(15000, a.estimate(), delta=15000 * 0.05)
+        with self.assertRaises(ValueError):
+            a.merge(hxl.sketches.DistinctSketch(precision=10))